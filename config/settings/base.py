@@ -154,6 +154,55 @@ DJANGO_TABLES2_TEMPLATE = "tables2/bootstrap5.html"
 
 DEFAULT_FROM_EMAIL = "library@gmail.com"
 
+# Overdue loans sweeper, run "manage.py sweep_overdue_loans" periodically or with --loop in its own process
+OVERDUE_SWEEP_INTERVAL = config("OVERDUE_SWEEP_INTERVAL", default=3600, cast=int)
+
+# Two-tier cache, a memory cache per process in front of a file cache shared by all the workers
+CACHES = {
+    "default": {
+        "BACKEND": "utils.cache.TwoTierCache",
+        "OPTIONS": {"L2": "shared", "L1_TIMEOUT": config("CACHE_L1_TIMEOUT", default=5, cast=int)},
+    },
+    "shared": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": config("CACHE_LOCATION", default=os.path.join(BASE_DIR, ".cache")),
+        "TIMEOUT": 300,
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+}
+
+# Counts of the list views, cached per filters until the data changes, the unfiltered ones estimated above the threshold
+LIST_COUNT_CACHE_TIMEOUT = config("LIST_COUNT_CACHE_TIMEOUT", default=300, cast=int)
+LIST_COUNT_ESTIMATE_THRESHOLD = config("LIST_COUNT_ESTIMATE_THRESHOLD", default=100000, cast=int)
+# Rendered list pages, cached until the data changes, 0 disables the cache
+LIST_RESPONSE_CACHE_TIMEOUT = config("LIST_RESPONSE_CACHE_TIMEOUT", default=300, cast=int)
+
+TEST_RUNNER = "utils.test_runner.TestRunner"
+
+# Days a customer has to pick up the copy assigned to a hold, run "manage.py expire_book_holds" daily
+BOOK_HOLD_PICKUP_DAYS = config("BOOK_HOLD_PICKUP_DAYS", default=3, cast=int)
+
+# Reminders of the loans that are due soon or overdue, run "manage.py send_loan_reminders" daily
+LOAN_REMINDER_DUE_SOON_TEMPLATE_ID = config("LOAN_REMINDER_DUE_SOON_TEMPLATE_ID", default=1, cast=int)
+LOAN_REMINDER_OVERDUE_TEMPLATE_ID = config("LOAN_REMINDER_OVERDUE_TEMPLATE_ID", default=2, cast=int)
+LOAN_REMINDER_DUE_SOON_DAYS = config("LOAN_REMINDER_DUE_SOON_DAYS", default=2, cast=int)
+LOAN_REMINDER_BATCH_SIZE = config("LOAN_REMINDER_BATCH_SIZE", default=500, cast=int)
+
+# SendInBlue emails, they are stored in the outbox and sent by "manage.py send_outbox_emails"
+SENDINBLUE_API_URL = config("SENDINBLUE_API_URL", default="https://api.sendinblue.com/v3")
+SENDINGBLUE_API_KEY = config("SENDINGBLUE_API_KEY", default="")
+SEND_EMAILS = config("SEND_EMAILS", default=False, cast=bool)
+SENDINBLUE_TIMEOUT = config("SENDINBLUE_TIMEOUT", default=10, cast=int)
+OUTBOX_WORKERS = config("OUTBOX_WORKERS", default=4, cast=int)
+OUTBOX_MAX_ATTEMPTS = config("OUTBOX_MAX_ATTEMPTS", default=5, cast=int)
+OUTBOX_BACKOFF = config("OUTBOX_BACKOFF", default=60, cast=int)
+
+# Outbound HTTP clients, a pool of keep-alive connections and a circuit breaker per provider
+OUTBOUND_TIMEOUT = config("OUTBOUND_TIMEOUT", default=10, cast=int)
+OUTBOUND_POOL_SIZE = config("OUTBOUND_POOL_SIZE", default=10, cast=int)
+OUTBOUND_CIRCUIT_THRESHOLD = config("OUTBOUND_CIRCUIT_THRESHOLD", default=5, cast=int)
+OUTBOUND_CIRCUIT_RESET_TIMEOUT = config("OUTBOUND_CIRCUIT_RESET_TIMEOUT", default=30, cast=int)
+
 REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
     "DEFAULT_AUTHENTICATION_CLASSES": (
@@ -0,0 +1,42 @@
+from django.contrib import admin, messages
+from django.utils.translation import gettext_lazy as _
+
+from .models import BookLoan
+from .services import bulk_return_book_loans
+
+
+@admin.register(BookLoan)
+class BookLoanAdmin(admin.ModelAdmin):
+    list_display = ("id", "customer", "status", "end_date", "created_at")
+    list_filter = ("status",)
+    list_select_related = ("customer",)
+    search_fields = ("customer__document_number",)
+    raw_id_fields = ("customer", "books")
+    # The status and the books change the stock, they are only changed through the loan services
+    readonly_fields = ("status", "books")
+    actions = ("approve_delivery",)
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        actions.pop("delete_selected", None)
+        return actions
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return obj is not None and obj.status == "returned" and super().has_delete_permission(request, obj)
+
+    @admin.action(description=_("Aprobar entrega de los préstamos seleccionados"))
+    def approve_delivery(self, request, queryset):
+        result = bulk_return_book_loans(queryset.values_list("pk", flat=True))
+        self.message_user(request, _("Se aprobó la entrega de {} préstamos.").format(len(result["returned"])),
+                          messages.SUCCESS)
+        if result["already_returned"]:
+            self.message_user(
+                request,
+                _("Ya estaban entregados los préstamos: {}").format(
+                    ", ".join(str(pk) for pk in result["already_returned"])
+                ),
+                messages.WARNING,
+            )
@@ -1,8 +1,26 @@
 from rest_framework import filters
 from django_filters import rest_framework as django_filters
 
+from core.search import search_books
+
+
+class BookSearchFilter(filters.SearchFilter):
+    """Search backend that resolves the books through the full-text index ordered by relevance."""
+
+    def filter_queryset(self, request, queryset, view):
+        value = request.query_params.get(self.search_param, "").strip()
+        if not value:
+            return queryset
+        return search_books(queryset, value)
+
 
 SEARCH_BACKEND_FILTER = (
     django_filters.DjangoFilterBackend,
     filters.SearchFilter,
 )
+
+BOOK_SEARCH_BACKEND_FILTER = (
+    django_filters.DjangoFilterBackend,
+    BookSearchFilter,
+    filters.OrderingFilter,
+)
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 
-from core.models import Book, Author
+from core.models import Book, Author, BookHold
+from customers.models import Customer
 
 
 class AuthorSerializer(serializers.ModelSerializer):
@@ -13,11 +14,43 @@ class AuthorSerializer(serializers.ModelSerializer):
 
 class BookSerializer(serializers.ModelSerializer):
     """Serializer to created and update model Book"""
-    author = serializers.SerializerMethodField()
+    # Declared once per serializer, the authors must be prefetched by the queryset
+    author = AuthorSerializer(many=True, read_only=True)
 
     class Meta:
         model = Book
-        fields = "__all__"
+        # The sequence of the holds is internal state of the queue and it is not published
+        fields = ["id", "title", "summary", "author", "quantity", "in_stock", "total_loans", "active_loans",
+                  "last_borrowed_at", "next_return_date", "holds_waiting", "created_at", "updated_at"]
 
-    def get_author(self, obj):
-        return AuthorSerializer(instance=obj.author, many=True).data
+
+class BulkReturnSerializer(serializers.Serializer):
+    """Serializer to validate the loans of a bulk return"""
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=10000)
+
+
+class LoanStatsSerializer(serializers.Serializer):
+    """Serializer to validate the period of the loans statistics"""
+    days = serializers.IntegerField(min_value=1, max_value=366, default=30)
+    top = serializers.IntegerField(min_value=1, max_value=100, default=10)
+
+
+class BookHoldSerializer(serializers.ModelSerializer):
+    """Serializer to place and show the holds, the customer is given by the document number"""
+    customer = serializers.SlugRelatedField(slug_field="document_number", queryset=Customer.objects.all())
+    # Place of a waiting hold in the queue of its book, set once per page by the viewset
+    position = serializers.SerializerMethodField()
+
+    class Meta:
+        model = BookHold
+        fields = ["id", "book", "customer", "status", "sequence", "position", "ready_at", "expires_at", "book_loan",
+                  "created_at"]
+        read_only_fields = ["status", "ready_at", "expires_at", "book_loan"]
+
+    def get_position(self, obj):
+        return getattr(obj, "position", None)
+
+
+class BookHoldCheckoutSerializer(serializers.Serializer):
+    """Serializer to validate the delivery date of the loan of a ready hold"""
+    end_date = serializers.DateField()
@@ -1,10 +1,17 @@
 from rest_framework.routers import DefaultRouter
 
-from .views import BookViewSet
+from .views import BookHoldViewSet, BookLoanViewSet, BookViewSet, LoanStatsViewSet
 
 router = DefaultRouter()
 
 # Endpoints for the module Book
 router.register("books", BookViewSet, basename="books")
 
+# Endpoints for the module BookLoan
+router.register("book-loans", BookLoanViewSet, basename="book_loans")
+router.register("loan-stats", LoanStatsViewSet, basename="loan_stats")
+
+# Endpoints for the module BookHold
+router.register("book-holds", BookHoldViewSet, basename="book_holds")
+
 urlpatterns = [] + router.urls
@@ -1,19 +1,106 @@
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import DjangoModelPermissions
+from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 from rest_framework import mixins
+from django.utils.translation import gettext_lazy as _
 
-from .filters import SEARCH_BACKEND_FILTER
-from .serializers import BookSerializer
+from utils.api.mixins import ConditionalListMixin
+from utils.api.permissions import ActionModelPermissions
+from .filters import BOOK_SEARCH_BACKEND_FILTER, SEARCH_BACKEND_FILTER
+from .serializers import BookHoldCheckoutSerializer, BookHoldSerializer, BookSerializer, BulkReturnSerializer, \
+    LoanStatsSerializer
 
 
 # ViewSet for the model Book
-from ..models import Book
+from ..models import Author, Book, BookHold, BookLoan
+from ..reports import get_loan_stats
+from ..services import BookHoldError, bulk_return_book_loans, cancel_book_hold, checkout_book_hold, \
+    place_book_hold, set_queue_positions
 
 
-class BookViewSet(mixins.ListModelMixin, GenericViewSet):
+class BookViewSet(ConditionalListMixin, mixins.ListModelMixin, GenericViewSet):
     """ViewSet to model Book"""
     serializer_class = BookSerializer
-    queryset = Book.objects.filter(in_stock__gt=0)
+    queryset = Book.objects.filter(in_stock__gt=0).prefetch_related("author")
     permission_classes = (DjangoModelPermissions,)
+    filter_backends = BOOK_SEARCH_BACKEND_FILTER
+    # Popularity ordering with ?ordering=-total_loans, the counters are indexed
+    ordering_fields = ["title", "created_at", "total_loans", "active_loans", "last_borrowed_at"]
+    conditional_models = [Book, Author]
+
+
+class BookLoanViewSet(GenericViewSet):
+    """ViewSet to model BookLoan"""
+    serializer_class = BulkReturnSerializer
+    queryset = BookLoan.objects.all()
+    permission_classes = (ActionModelPermissions,)
+    # Returning loans changes them, the POST would only require the add permission
+    action_permissions = {"bulk_return": ["core.change_bookloan"]}
+
+    @action(methods=["POST"], detail=False)
+    def bulk_return(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(bulk_return_book_loans(serializer.validated_data["ids"]))
+
+
+class LoanStatsViewSet(GenericViewSet):
+    """ViewSet of the loans statistics, read from the summary tables"""
+    serializer_class = LoanStatsSerializer
+    queryset = BookLoan.objects.none()
+    permission_classes = (ActionModelPermissions,)
+    # The report shows the loans, the GET of the model permissions would not require any permission
+    action_permissions = {"list": ["core.view_bookloan"]}
+
+    def list(self, request):
+        serializer = self.get_serializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return Response(get_loan_stats(**serializer.validated_data))
+
+
+class BookHoldViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin, GenericViewSet):
+    """ViewSet to model BookHold, the holds are only changed through the hold services"""
+    serializer_class = BookHoldSerializer
+    queryset = BookHold.objects.select_related("customer")
+    permission_classes = (ActionModelPermissions,)
+    # The POST actions change the holds, the method would only require the add permission
+    action_permissions = {
+        "cancel": ["core.delete_bookhold"],
+        "checkout": ["core.change_bookhold", "core.add_bookloan"],
+    }
     filter_backends = SEARCH_BACKEND_FILTER
-    search_fields = ["title", "author__full_name"]
+    filterset_fields = ["book", "customer", "status"]
+    search_fields = ["book__title", "customer__document_number"]
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        return page if page is None else set_queue_positions(page)
+
+    def get_object(self):
+        return set_queue_positions([super().get_object()])[0]
+
+    def perform_create(self, serializer):
+        try:
+            hold = place_book_hold(**serializer.validated_data)
+        except BookHoldError as error:
+            raise ValidationError({"detail": str(error)})
+        serializer.instance = set_queue_positions([hold])[0]
+
+    @action(methods=["POST"], detail=True)
+    def cancel(self, request, pk=None):
+        if not cancel_book_hold(self.get_object()):
+            raise ValidationError({"detail": _("La reserva ya no está activa.")})
+        return Response(self.get_serializer(self.get_object()).data)
+
+    @action(methods=["POST"], detail=True)
+    def checkout(self, request, pk=None):
+        hold = self.get_object()
+        serializer = BookHoldCheckoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            checkout_book_hold(hold, serializer.validated_data["end_date"])
+        except BookHoldError as error:
+            raise ValidationError({"detail": str(error)})
+        return Response(self.get_serializer(self.get_object()).data)
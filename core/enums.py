@@ -14,3 +14,21 @@ class StatusBookLoanOptions(Enum):
     returned = _("Entregado")
     past = _("Fuera de Tiempo")
 
+
+ACTIVE_BOOK_LOAN_STATUSES = (StatusBookLoanOptions.in_time, StatusBookLoanOptions.past)
+
+
+class LoanReminderOptions(Enum):
+    due_soon = _("Próximo a Vencer")
+    overdue = _("Vencido")
+
+
+class HoldStatusOptions(Enum):
+    waiting = _("En Espera")
+    ready = _("Lista para Recoger")
+    fulfilled = _("Entregada")
+    cancelled = _("Cancelada")
+    expired = _("Vencida")
+
+
+ACTIVE_HOLD_STATUSES = (HoldStatusOptions.waiting, HoldStatusOptions.ready)
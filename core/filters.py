@@ -1,10 +1,11 @@
 import django_filters
-from django.db.models import Q
 from django.utils.translation import gettext_lazy as _
 from django_select2.forms import Select2Widget
 
 from core.enums import StatusBookLoanOptions, CHOICES_BOOLEAN_FILTER
 from core.models import Author, Book, BookLoan
+from core.search import search_books
+from customers.search import search_customers
 from utils.filters import SearchFilter
 
 
@@ -27,10 +28,7 @@ class BookFilter(SearchFilter):
         fields = ["search", "availability"]
 
     def search_filter(self, queryset, name, value):
-        return queryset.filter(
-            Q(title__icontains=value)
-            | Q(summary__icontains=value)
-        )
+        return search_books(queryset, value)
 
 
 class BookLoanFilter(SearchFilter):
@@ -42,9 +40,4 @@ class BookLoanFilter(SearchFilter):
         fields = ["search", "status"]
 
     def search_filter(self, queryset, name, value):
-        return queryset.filter(
-            Q(customer__first_name__icontains=value)
-            | Q(customer__last_name__icontains=value)
-            | Q(customer__email__icontains=value)
-            | Q(customer__phone_number__icontains=value)
-        )
+        return search_customers(queryset, value, customer_field="customer")
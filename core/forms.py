@@ -62,7 +62,7 @@ class BookLoanForm(forms.ModelForm):
         if customer and not customer.has_book_loan():
             self.add_error("customer", _("Este cliente supera el limite de libros prestados."))
         elif books:
-            if books.count() + customer.has_book_loan(cant=True) > 3:
+            if books.count() + customer.has_book_loan(cant=True) > customer.MAX_BOOKS_ON_LOAN:
                 self.add_error("books", _("Solo es permitido prestar 3 libros."))
 
         return cleaned_data
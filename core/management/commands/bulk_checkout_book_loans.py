@@ -0,0 +1,76 @@
+import csv
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.services import BatchConflictError, bulk_checkout_book_loans
+
+
+class Command(BaseCommand):
+    help = (
+        "Create loans from a CSV file with the columns customer (document number), "
+        "books (ids separated by ';') and end_date (YYYY-MM-DD)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV file with the loans.")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Loans created per transaction.")
+
+    def parse_row(self, row):
+        try:
+            return {
+                "customer": row["customer"].replace(" ", ""),
+                "books": [int(book_id) for book_id in row["books"].split(";") if book_id.strip()],
+                "end_date": datetime.date.fromisoformat(row["end_date"].strip()),
+            }
+        except (KeyError, AttributeError, ValueError):
+            return None
+
+    def handle(self, *args, **options):
+        try:
+            file = open(options["path"], newline="", encoding="utf-8")
+        except OSError as error:
+            raise CommandError(error)
+
+        start = time.monotonic()
+        created = failed = 0
+        with file:
+            reader = csv.DictReader(file)
+            batch = []
+            for line, row in enumerate(reader, start=2):
+                batch.append((line, self.parse_row(row)))
+                if len(batch) >= options["batch_size"]:
+                    created, failed = self.process(batch, created, failed)
+                    batch = []
+            created, failed = self.process(batch, created, failed)
+
+        elapsed = max(time.monotonic() - start, 0.001)
+        self.stdout.write(self.style.SUCCESS(
+            "Created {} loans, {} rows failed in {:.2f}s ({:.0f} loans/s).".format(
+                created, failed, elapsed, created / elapsed
+            )
+        ))
+
+    def process(self, batch, created, failed):
+        rows = [(line, row) for line, row in batch if row is not None]
+        for line, row in batch:
+            if row is None:
+                failed += 1
+                self.stderr.write("Line {}: invalid row.".format(line))
+
+        try:
+            results = bulk_checkout_book_loans([row for _, row in rows]) if rows else []
+        except BatchConflictError as error:
+            raise CommandError(
+                "Lines {}-{}: {}. Created {} loans before the failed batch.".format(
+                    batch[0][0], batch[-1][0], error, created
+                )
+            )
+        for (line, _), result in zip(rows, results):
+            if result["error"]:
+                failed += 1
+                self.stderr.write("Line {}: {}".format(line, result["error"]))
+            else:
+                created += 1
+        return created, failed
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.services import expire_book_holds
+
+
+class Command(BaseCommand):
+    help = ("Expire the holds that were not picked up in BOOK_HOLD_PICKUP_DAYS, their copies go to the next holds "
+            "of the queue or back to the stock.")
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS("Expired {} holds.".format(expire_book_holds())))
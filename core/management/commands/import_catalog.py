@@ -0,0 +1,99 @@
+import csv
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Author, Book
+from core.services import bulk_create_books, get_author_ids
+
+
+class Command(BaseCommand):
+    help = (
+        "Import books from a CSV or JSONL file with the fields title, summary, authors (names separated by ';' "
+        "or a list in JSONL), quantity and in_stock. Authors are matched by normalized name."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSONL file with the books.")
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="File format, by default the file extension.")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Books created per transaction.")
+
+    def read_rows(self, file, file_format):
+        if file_format == "csv":
+            yield from enumerate(csv.DictReader(file), start=2)
+            return
+        for line, text in enumerate(file, start=1):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+            except ValueError:
+                row = None
+            yield line, row if isinstance(row, dict) else None
+
+    def parse_row(self, row):
+        if row is None:
+            return None
+        try:
+            authors = row.get("authors") or []
+            if isinstance(authors, str):
+                authors = authors.split(";")
+            authors = [str(full_name).strip() for full_name in authors if str(full_name).strip()]
+            title = str(row.get("title") or "").strip()
+            summary = str(row.get("summary") or "").strip() or None
+            quantity = int(row.get("quantity") or 1)
+            in_stock = int(row["in_stock"]) if str(row.get("in_stock") or "").strip() else quantity
+        except (TypeError, ValueError):
+            return None
+
+        title_length = Book._meta.get_field("title").max_length
+        summary_length = Book._meta.get_field("summary").max_length
+        author_length = Author._meta.get_field("full_name").max_length
+        if not title or len(title) > title_length or (summary and len(summary) > summary_length):
+            return None
+        if not authors or any(len(full_name) > author_length for full_name in authors):
+            return None
+        if quantity < 1 or in_stock < 0 or in_stock > quantity:
+            return None
+        return {"title": title, "summary": summary, "authors": authors, "quantity": quantity, "in_stock": in_stock}
+
+    def handle(self, *args, **options):
+        file_format = options["format"] or os.path.splitext(options["path"])[1].lstrip(".").lower()
+        if file_format not in ("csv", "jsonl"):
+            raise CommandError("Unknown file format, use --format csv or jsonl.")
+        try:
+            file = open(options["path"], newline="" if file_format == "csv" else None, encoding="utf-8")
+        except OSError as error:
+            raise CommandError(error)
+
+        start = time.monotonic()
+        author_ids = get_author_ids()
+        books = authors = failed = 0
+        with file:
+            batch = []
+            for line, row in self.read_rows(file, file_format):
+                row = self.parse_row(row)
+                if row is None:
+                    failed += 1
+                    self.stderr.write("Line {}: invalid row.".format(line))
+                    continue
+                batch.append(row)
+                if len(batch) >= options["batch_size"]:
+                    books, authors = self.process(batch, author_ids, options["batch_size"], books, authors)
+                    batch = []
+            books, authors = self.process(batch, author_ids, options["batch_size"], books, authors)
+
+        elapsed = max(time.monotonic() - start, 0.001)
+        self.stdout.write(self.style.SUCCESS(
+            "Imported {} books and {} new authors, {} rows failed in {:.2f}s ({:.0f} books/s).".format(
+                books, authors, failed, elapsed, books / elapsed
+            )
+        ))
+
+    def process(self, batch, author_ids, batch_size, books, authors):
+        if not batch:
+            return books, authors
+        created_books, created_authors = bulk_create_books(batch, author_ids, batch_size)
+        return books + created_books, authors + created_authors
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from core.search import has_search_index, rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index of the book catalog."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000, help="Books indexed per batch.")
+
+    def handle(self, *args, **options):
+        if not has_search_index():
+            self.stdout.write(self.style.WARNING("The current database does not support the search index."))
+            return
+
+        total = rebuild_index(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS("Indexed {} books.".format(total)))
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.reports import rebuild_loan_stats
+
+
+class Command(BaseCommand):
+    help = "Calculate the loans summaries of the dashboard again from all the loans."
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        daily, books, statuses = rebuild_loan_stats()
+        self.stdout.write(self.style.SUCCESS(
+            "Created {} daily, {} book and {} status summaries in {:.2f}s.".format(
+                daily, books, statuses, time.monotonic() - start
+            )
+        ))
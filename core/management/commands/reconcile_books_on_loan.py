@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from core.utils import reconcile_book_loan_counters, reconcile_books_on_loan
+
+
+class Command(BaseCommand):
+    help = "Recompute the books on loan counter of the clients and the loan counters of the books from the loans."
+
+    def handle(self, *args, **options):
+        fixed = reconcile_books_on_loan()
+        fixed_books = reconcile_book_loan_counters()
+        self.stdout.write(self.style.SUCCESS("Fixed {} clients and {} books.".format(fixed, fixed_books)))
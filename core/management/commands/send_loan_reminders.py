@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.services import send_loan_reminders
+
+
+class Command(BaseCommand):
+    help = ("Queue the reminders of the overdue loans and of the loans due in the next days, the loans already "
+            "reminded for their delivery date are skipped.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, help="Days before the delivery date, by default "
+                                                     "LOAN_REMINDER_DUE_SOON_DAYS.")
+        parser.add_argument("--batch-size", type=int, help="Loans per email, by default LOAN_REMINDER_BATCH_SIZE.")
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        result = send_loan_reminders(due_soon_days=options["days"], batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(
+            "Queued {} due soon and {} overdue reminders in {} emails in {:.2f}s.".format(
+                result["due_soon"], result["overdue"], result["emails"], time.monotonic() - start
+            )
+        ))
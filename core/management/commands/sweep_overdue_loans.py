@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from core.utils import run_overdue_sweeper, sweep_overdue_loans
+
+
+class Command(BaseCommand):
+    help = "Change the status of the loans that have not been returned on the delivery date."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=int, default=None,
+                            help="Minimum seconds since the last sweep, by default OVERDUE_SWEEP_INTERVAL.")
+        parser.add_argument("--force", action="store_true", help="Sweep even if the last sweep is recent.")
+        parser.add_argument("--loop", action="store_true", help="Keep running and sweep every interval.")
+
+    def handle(self, *args, **options):
+        if options["loop"]:
+            run_overdue_sweeper(interval=options["interval"])
+            return
+        updated = sweep_overdue_loans(interval=options["interval"], force=options["force"])
+        if updated is None:
+            self.stdout.write(self.style.WARNING("The last sweep is more recent than the interval."))
+        else:
+            self.stdout.write(self.style.SUCCESS("Updated {} loans.".format(updated)))
@@ -0,0 +1,45 @@
+from django.db import migrations
+
+BOOK_SEARCH_TABLE = "core_book_search"
+
+
+def create_book_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5("
+        "title, summary, authors, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')".format(
+            BOOK_SEARCH_TABLE
+        )
+    )
+
+    Book = apps.get_model("core", "Book")
+    rows = [
+        (book.pk, book.title, book.summary or "", " ".join(author.full_name for author in book.author.all()))
+        for book in Book.objects.prefetch_related("author")
+    ]
+    if rows:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(
+                "INSERT INTO {}(rowid, title, summary, authors) VALUES (%s, %s, %s, %s)".format(BOOK_SEARCH_TABLE),
+                rows
+            )
+
+
+def drop_book_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+
+    schema_editor.execute("DROP TABLE IF EXISTS {}".format(BOOK_SEARCH_TABLE))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_book_search_index, drop_book_search_index),
+    ]
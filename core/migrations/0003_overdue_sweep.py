@@ -0,0 +1,29 @@
+# Generated by Django 4.0.1 on 2026-10-18 18:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_book_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OverdueSweep',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_run_at', models.DateTimeField(blank=True, null=True, verbose_name='Última Ejecución')),
+                ('swept_until', models.DateField(blank=True, null=True, verbose_name='Revisado Hasta')),
+            ],
+            options={
+                'verbose_name': 'Revisión de Préstamos Vencidos',
+                'verbose_name_plural': 'Revisiones de Préstamos Vencidos',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='bookloan',
+            index=models.Index(fields=['status', 'end_date'], name='book_loan_status_end_date_idx'),
+        ),
+    ]
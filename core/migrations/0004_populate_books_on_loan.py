@@ -0,0 +1,24 @@
+from django.db import migrations
+from django.db.models import Count
+
+
+def populate_books_on_loan(apps, schema_editor):
+    BookLoan = apps.get_model("core", "BookLoan")
+    Customer = apps.get_model("customers", "Customer")
+    rows = BookLoan.books.through.objects.filter(
+        bookloan__status__in=["in_time", "past"]
+    ).values("bookloan__customer").annotate(amount=Count("pk")).order_by()
+    for row in rows:
+        Customer.objects.filter(pk=row["bookloan__customer"]).update(books_on_loan=row["amount"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_overdue_sweep'),
+        ('customers', '0003_customer_books_on_loan'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_books_on_loan, migrations.RunPython.noop),
+    ]
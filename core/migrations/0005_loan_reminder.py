@@ -0,0 +1,36 @@
+# Generated by Django 4.0.1 on 2026-10-18 18:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('utils', '0001_initial'),
+        ('core', '0004_populate_books_on_loan'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoanReminder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de Creación')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Fecha de Actualización')),
+                ('kind', models.CharField(choices=[('due_soon', 'Próximo a Vencer'), ('overdue', 'Vencido')], max_length=8, verbose_name='Tipo')),
+                ('end_date', models.DateField(verbose_name='Fecha de Entrega')),
+                ('book_loan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reminders', to='core.bookloan', verbose_name='Préstamo')),
+                ('outbox_email', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='loan_reminders', to='utils.outboxemail', verbose_name='Correo')),
+            ],
+            options={
+                'verbose_name': 'Recordatorio de Préstamo',
+                'verbose_name_plural': 'Recordatorios de Préstamos',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='loanreminder',
+            constraint=models.UniqueConstraint(fields=('book_loan', 'kind', 'end_date'), name='loan_reminder_unique'),
+        ),
+    ]
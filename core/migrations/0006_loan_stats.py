@@ -0,0 +1,66 @@
+# Generated by Django 4.0.1 on 2026-10-18 18:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_loan_reminder'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoanDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True, verbose_name='Fecha')),
+                ('loans', models.IntegerField(default=0, verbose_name='Préstamos')),
+                ('books_loaned', models.IntegerField(default=0, verbose_name='Libros Prestados')),
+                ('returns', models.IntegerField(default=0, verbose_name='Entregas')),
+                ('books_returned', models.IntegerField(default=0, verbose_name='Libros Entregados')),
+                ('overdue', models.IntegerField(default=0, verbose_name='Fuera de Tiempo')),
+            ],
+            options={
+                'verbose_name': 'Resumen Diario de Préstamos',
+                'verbose_name_plural': 'Resúmenes Diarios de Préstamos',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='LoanStatusStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('in_time', 'En Tiempo'), ('past', 'Fuera de Tiempo'), ('returned', 'Entregado')], max_length=8, unique=True, verbose_name='Estado')),
+                ('loans', models.IntegerField(default=0, verbose_name='Préstamos')),
+                ('books', models.IntegerField(default=0, verbose_name='Libros')),
+            ],
+            options={
+                'verbose_name': 'Resumen de Préstamos por Estado',
+                'verbose_name_plural': 'Resúmenes de Préstamos por Estado',
+            },
+        ),
+        migrations.CreateModel(
+            name='BookDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Fecha')),
+                ('loans', models.IntegerField(default=0, verbose_name='Préstamos')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='core.book', verbose_name='Libro')),
+            ],
+            options={
+                'verbose_name': 'Resumen Diario de Libro',
+                'verbose_name_plural': 'Resúmenes Diarios de Libros',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='bookdailystats',
+            index=models.Index(fields=['date', 'book'], name='book_daily_stats_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='bookdailystats',
+            constraint=models.UniqueConstraint(fields=('book', 'date'), name='book_daily_stats_unique'),
+        ),
+    ]
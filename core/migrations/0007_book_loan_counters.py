@@ -0,0 +1,43 @@
+# Generated by Django 4.0.1 on 2026-10-18 18:37
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Q
+
+
+def populate_book_loan_counters(apps, schema_editor):
+    BookLoan = apps.get_model("core", "BookLoan")
+    Book = apps.get_model("core", "Book")
+    rows = BookLoan.books.through.objects.values("book").annotate(
+        total=Count("pk"),
+        active=Count("pk", filter=Q(bookloan__status__in=["in_time", "past"])),
+        last=Max("bookloan__created_at"),
+    ).order_by()
+    for row in rows:
+        Book.objects.filter(pk=row["book"]).update(total_loans=row["total"], active_loans=row["active"],
+                                                   last_borrowed_at=row["last"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_loan_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='active_loans',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='Préstamos Activos'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='last_borrowed_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True, verbose_name='Último Préstamo'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='total_loans',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='Préstamos'),
+        ),
+        migrations.RunPython(populate_book_loan_counters, migrations.RunPython.noop),
+    ]
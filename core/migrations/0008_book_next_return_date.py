@@ -0,0 +1,30 @@
+# Generated by Django 4.0.1 on 2026-10-18 18:40
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def populate_next_return_date(apps, schema_editor):
+    BookLoan = apps.get_model("core", "BookLoan")
+    Book = apps.get_model("core", "Book")
+    rows = BookLoan.books.through.objects.filter(
+        bookloan__status__in=["in_time", "past"]
+    ).values("book").annotate(date=Min("bookloan__end_date")).order_by()
+    for row in rows:
+        Book.objects.filter(pk=row["book"]).update(next_return_date=row["date"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_book_loan_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='next_return_date',
+            field=models.DateField(blank=True, db_index=True, editable=False, null=True, verbose_name='Próxima Devolución'),
+        ),
+        migrations.RunPython(populate_next_return_date, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.0.1 on 2026-10-18 18:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0003_customer_books_on_loan'),
+        ('core', '0008_book_next_return_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='holds_waiting',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Reservas en Espera'),
+        ),
+        migrations.CreateModel(
+            name='BookHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de Creación')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Fecha de Actualización')),
+                ('status', models.CharField(choices=[('cancelled', 'Cancelada'), ('expired', 'Vencida'), ('fulfilled', 'Entregada'), ('ready', 'Lista para Recoger'), ('waiting', 'En Espera')], default='waiting', max_length=9, verbose_name='Estado')),
+                ('ready_at', models.DateTimeField(blank=True, null=True, verbose_name='Fecha de Asignación')),
+                ('expires_at', models.DateTimeField(blank=True, null=True, verbose_name='Fecha Límite de Recogida')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='core.book', verbose_name='Libro')),
+                ('book_loan', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='holds', to='core.bookloan', verbose_name='Préstamo')),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='customers.customer', verbose_name='Cliente')),
+            ],
+            options={
+                'verbose_name': 'Reserva',
+                'verbose_name_plural': 'Reservas',
+                'ordering': ['id'],
+                'permissions': (('manage_book_hold', 'Puede Administrar Reservas'),),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='bookhold',
+            index=models.Index(fields=['book', 'status', 'id'], name='book_hold_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookhold',
+            index=models.Index(fields=['status', 'expires_at'], name='book_hold_expires_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='bookhold',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ('waiting', 'ready'))), fields=('book', 'customer'), name='book_hold_active_unique'),
+        ),
+    ]
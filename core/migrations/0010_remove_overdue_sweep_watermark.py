@@ -0,0 +1,17 @@
+# Generated by Django 4.0.1 on 2026-10-18 19:02
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_book_hold'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='overduesweep',
+            name='swept_until',
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.0.1 on 2026-10-18 19:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_remove_overdue_sweep_watermark'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['created_at', 'id'], name='book_created_at_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookhold',
+            index=models.Index(fields=['created_at', 'id'], name='book_hold_created_at_id_idx'),
+        ),
+    ]
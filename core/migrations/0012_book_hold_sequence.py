@@ -0,0 +1,48 @@
+# Generated by Django 4.0.1 on 2026-10-18 19:05
+
+from django.db import migrations, models
+
+
+def populate_hold_sequence(apps, schema_editor):
+    # The existing holds keep the order of their ids
+    BookHold = apps.get_model("core", "BookHold")
+    Book = apps.get_model("core", "Book")
+    sequences = {}
+    for pk, book_id in BookHold.objects.order_by("id").values_list("pk", "book_id").iterator():
+        sequences[book_id] = sequences.get(book_id, 0) + 1
+        BookHold.objects.filter(pk=pk).update(sequence=sequences[book_id])
+    for book_id, sequence in sequences.items():
+        Book.objects.filter(pk=book_id).update(hold_sequence=sequence)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_cursor_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='bookhold',
+            name='book_hold_queue_idx',
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='hold_sequence',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Secuencia de Reservas'),
+        ),
+        migrations.AddField(
+            model_name='bookhold',
+            name='sequence',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Secuencia'),
+        ),
+        migrations.RunPython(populate_hold_sequence, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='bookhold',
+            index=models.Index(fields=['book', 'status', 'sequence'], name='book_hold_queue_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='bookhold',
+            constraint=models.UniqueConstraint(fields=('book', 'sequence'), name='book_hold_sequence_unique'),
+        ),
+    ]
@@ -4,9 +4,9 @@ from django.db import models
 from django.urls import reverse_lazy
 from django.utils.translation import gettext_lazy as _
 
-from core.enums import StatusBookLoanOptions
+from core.enums import ACTIVE_HOLD_STATUSES, HoldStatusOptions, LoanReminderOptions, StatusBookLoanOptions
 from customers.models import Customer
-from utils.models import AbstractDates
+from utils.models import AbstractDates, OutboxEmail
 
 User = get_user_model()
 
@@ -40,6 +40,19 @@ class Book(AbstractDates):
     author = models.ManyToManyField(Author, verbose_name=_('Autor'), related_name="books")
     quantity = models.PositiveIntegerField(verbose_name=_('Cantidad de Ejemplares'), default=1)
     in_stock = models.PositiveIntegerField(verbose_name=_('Cantidad Disponible'), default=1)
+    # Counters maintained by the loan services, used to order the books by popularity
+    total_loans = models.PositiveIntegerField(verbose_name=_('Préstamos'), default=0, editable=False, db_index=True)
+    active_loans = models.PositiveIntegerField(verbose_name=_('Préstamos Activos'), default=0, editable=False,
+                                               db_index=True)
+    last_borrowed_at = models.DateTimeField(verbose_name=_('Último Préstamo'), blank=True, null=True,
+                                            editable=False, db_index=True)
+    # Earliest delivery date of the active loans, maintained by the loan services
+    next_return_date = models.DateField(verbose_name=_('Próxima Devolución'), blank=True, null=True, editable=False,
+                                        db_index=True)
+    # Length of the hold queue, the returned copies only look for holds when there are any
+    holds_waiting = models.PositiveIntegerField(verbose_name=_('Reservas en Espera'), default=0, editable=False)
+    # Sequence of the last hold, every hold of the book gets the next one so the queue keeps the arrival order
+    hold_sequence = models.PositiveIntegerField(verbose_name=_('Secuencia de Reservas'), default=0, editable=False)
 
     def __str__(self):
         return self.title
@@ -49,6 +62,8 @@ class Book(AbstractDates):
         verbose_name_plural = _("Libros")
         ordering = ["-created_at"]
         permissions = (("manage_book", _("Puede Administrar Libros")),)
+        # Keyset of the api cursor pagination
+        indexes = [models.Index(fields=["created_at", "id"], name="book_created_at_id_idx")]
 
     def clean(self):
         """Validating that there are no more books in stock than the number of copies"""
@@ -89,17 +104,23 @@ class BookLoan(AbstractDates):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._initial_status = self.status
+        self._initial_end_date = self.end_date
 
     class Meta:
         verbose_name = _("Préstamo")
         verbose_name_plural = _("Préstamos")
         ordering = ["-created_at"]
         permissions = (("manage_book_loan", _("Puede Administrar Préstamos")),)
+        indexes = [models.Index(fields=["status", "end_date"], name="book_loan_status_end_date_idx")]
 
     @property
     def status_has_changed(self):
         return self._initial_status != self.status
 
+    @property
+    def end_date_has_changed(self):
+        return str(self._initial_end_date) != str(self.end_date)
+
     def get_edit_url(self):
         """Return book_loan edit url."""
         return reverse_lazy("core:book_loan_update", kwargs={"pk": self.pk})
@@ -121,3 +142,118 @@ class BookLoan(AbstractDates):
         """Find out if there are any loans in arrears."""
         return self.status == 'past'
 
+
+class BookHold(AbstractDates):
+    """Model where the holds of the books without stock are managed, every book has a FIFO queue"""
+    book = models.ForeignKey(Book, verbose_name=_('Libro'), on_delete=models.CASCADE, related_name="holds")
+    customer = models.ForeignKey(Customer, verbose_name=_('Cliente'), on_delete=models.CASCADE, related_name="holds")
+    status = models.CharField(verbose_name=_('Estado'), choices=HoldStatusOptions.choices,
+                              default=HoldStatusOptions.waiting, max_length=9)
+    sequence = models.PositiveIntegerField(verbose_name=_('Secuencia'), default=0, editable=False)
+    ready_at = models.DateTimeField(verbose_name=_("Fecha de Asignación"), blank=True, null=True)
+    expires_at = models.DateTimeField(verbose_name=_("Fecha Límite de Recogida"), blank=True, null=True)
+    book_loan = models.ForeignKey(BookLoan, verbose_name=_('Préstamo'), on_delete=models.SET_NULL,
+                                  related_name="holds", blank=True, null=True)
+
+    def __str__(self):
+        return "{} - {} - {}".format(self.book_id, self.customer_id, self.status)
+
+    class Meta:
+        verbose_name = _("Reserva")
+        verbose_name_plural = _("Reservas")
+        ordering = ["id"]
+        permissions = (("manage_book_hold", _("Puede Administrar Reservas")),)
+        constraints = [
+            models.UniqueConstraint(fields=["book", "customer"], condition=models.Q(status__in=ACTIVE_HOLD_STATUSES),
+                                    name="book_hold_active_unique"),
+            models.UniqueConstraint(fields=["book", "sequence"], name="book_hold_sequence_unique"),
+        ]
+        indexes = [
+            # Head of the queue of a book
+            models.Index(fields=["book", "status", "sequence"], name="book_hold_queue_idx"),
+            models.Index(fields=["status", "expires_at"], name="book_hold_expires_idx"),
+            models.Index(fields=["created_at", "id"], name="book_hold_created_at_id_idx"),
+        ]
+
+
+class LoanReminder(AbstractDates):
+    """Model where the reminders of the loans are stored, a loan gets one of each kind per delivery date"""
+    book_loan = models.ForeignKey(BookLoan, verbose_name=_('Préstamo'), on_delete=models.CASCADE,
+                                  related_name="reminders")
+    kind = models.CharField(verbose_name=_('Tipo'), choices=LoanReminderOptions.choices, max_length=8)
+    end_date = models.DateField(verbose_name=_("Fecha de Entrega"))
+    outbox_email = models.ForeignKey(OutboxEmail, verbose_name=_('Correo'), on_delete=models.SET_NULL,
+                                     related_name="loan_reminders", blank=True, null=True)
+
+    def __str__(self):
+        return "{} - {} - {}".format(self.book_loan_id, self.kind, self.end_date)
+
+    class Meta:
+        verbose_name = _("Recordatorio de Préstamo")
+        verbose_name_plural = _("Recordatorios de Préstamos")
+        ordering = ["-created_at"]
+        constraints = [
+            models.UniqueConstraint(fields=["book_loan", "kind", "end_date"], name="loan_reminder_unique"),
+        ]
+
+
+class LoanDailyStats(models.Model):
+    """Model where the loans activity of every day is summarized, updated with every loan change"""
+    date = models.DateField(verbose_name=_("Fecha"), unique=True)
+    loans = models.IntegerField(verbose_name=_("Préstamos"), default=0)
+    books_loaned = models.IntegerField(verbose_name=_("Libros Prestados"), default=0)
+    returns = models.IntegerField(verbose_name=_("Entregas"), default=0)
+    books_returned = models.IntegerField(verbose_name=_("Libros Entregados"), default=0)
+    overdue = models.IntegerField(verbose_name=_("Fuera de Tiempo"), default=0)
+
+    def __str__(self):
+        return str(self.date)
+
+    class Meta:
+        verbose_name = _("Resumen Diario de Préstamos")
+        verbose_name_plural = _("Resúmenes Diarios de Préstamos")
+        ordering = ["-date"]
+
+
+class BookDailyStats(models.Model):
+    """Model where the loans of every book per day are summarized"""
+    book = models.ForeignKey(Book, verbose_name=_('Libro'), on_delete=models.CASCADE, related_name="daily_stats")
+    date = models.DateField(verbose_name=_("Fecha"))
+    loans = models.IntegerField(verbose_name=_("Préstamos"), default=0)
+
+    def __str__(self):
+        return "{} - {}".format(self.book_id, self.date)
+
+    class Meta:
+        verbose_name = _("Resumen Diario de Libro")
+        verbose_name_plural = _("Resúmenes Diarios de Libros")
+        ordering = ["-date"]
+        constraints = [models.UniqueConstraint(fields=["book", "date"], name="book_daily_stats_unique")]
+        indexes = [models.Index(fields=["date", "book"], name="book_daily_stats_date_idx")]
+
+
+class LoanStatusStats(models.Model):
+    """Model where the current amount of loans and books per loan status is kept"""
+    status = models.CharField(verbose_name=_('Estado'), choices=StatusBookLoanOptions.choices, max_length=8,
+                              unique=True)
+    loans = models.IntegerField(verbose_name=_("Préstamos"), default=0)
+    books = models.IntegerField(verbose_name=_("Libros"), default=0)
+
+    def __str__(self):
+        return self.status
+
+    class Meta:
+        verbose_name = _("Resumen de Préstamos por Estado")
+        verbose_name_plural = _("Resúmenes de Préstamos por Estado")
+
+
+class OverdueSweep(models.Model):
+    """Model where the state of the overdue loans sweeper is stored, it only has one row"""
+    last_run_at = models.DateTimeField(verbose_name=_("Última Ejecución"), blank=True, null=True)
+
+    def __str__(self):
+        return str(self.last_run_at)
+
+    class Meta:
+        verbose_name = _("Revisión de Préstamos Vencidos")
+        verbose_name_plural = _("Revisiones de Préstamos Vencidos")
@@ -0,0 +1,196 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from core.enums import ACTIVE_BOOK_LOAN_STATUSES, StatusBookLoanOptions
+from core.models import Book, BookDailyStats, BookLoan, LoanDailyStats, LoanStatusStats
+from utils.cache import get_or_set
+from utils.utils import get_chunks, get_data_namespace
+
+DAILY_FIELDS = ("loans", "books_loaned", "returns", "books_returned", "overdue")
+
+
+def add_to_counters(model, key_field, amounts, **filters):
+    """
+    Add the amounts to the counters of the summary rows with one insert and one UPDATE ... CASE per chunk, the
+    missing rows are created with the counters at zero.
+    :param key_field: <str> field that identifies the rows
+    :param amounts: <dict> amount per field of every key, {key: {field: amount}}
+    :param filters: fields shared by every row, like the date
+    """
+    amounts = {key: values for key, values in amounts.items() if any(values.values())}
+    fields = sorted({field for values in amounts.values() for field, amount in values.items() if amount})
+    for chunk in get_chunks(amounts.items()):
+        keys = [key for key, _ in chunk]
+        model.objects.bulk_create([model(**filters, **{key_field: key}) for key in keys], ignore_conflicts=True)
+        model.objects.filter(**filters, **{"{}__in".format(key_field): keys}).update(**{
+            field: F(field) + Case(*[When(**{key_field: key}, then=Value(values.get(field, 0))) for key, values in chunk],
+                                   default=Value(0), output_field=IntegerField())
+            for field in fields
+        })
+
+
+def record_checkouts(book_loans, day=None):
+    """
+    Add new loans to the summaries, must run in the transaction of the loans.
+    :param book_loans: <list> of tuples with the status and the books ids of every new loan
+    """
+    day = day or timezone.localdate()
+    statuses = {}
+    for status, book_ids in book_loans:
+        amounts = statuses.setdefault(status, {"loans": 0, "books": 0})
+        amounts["loans"] += 1
+        amounts["books"] += len(book_ids)
+    books = Counter(book_id for _, book_ids in book_loans for book_id in book_ids)
+
+    add_to_counters(LoanDailyStats, "date", {day: {"loans": len(book_loans), "books_loaned": sum(books.values())}})
+    add_to_counters(BookDailyStats, "book_id", {book_id: {"loans": amount} for book_id, amount in books.items()},
+                    date=day)
+    add_to_counters(LoanStatusStats, "status", statuses)
+
+
+def record_status_changes(changes, day=None):
+    """
+    Move loans between the statuses of the summaries, the returns and the overdue loans are counted in the day.
+    Must run in the transaction of the change.
+    :param changes: <list> of tuples with the old status, the new status, the amount of loans and of their books
+    """
+    day = day or timezone.localdate()
+    daily = dict.fromkeys(DAILY_FIELDS, 0)
+    statuses = {}
+    for old_status, status, loans, books in changes:
+        old_amounts = statuses.setdefault(old_status, {"loans": 0, "books": 0})
+        old_amounts["loans"] -= loans
+        old_amounts["books"] -= books
+        amounts = statuses.setdefault(status, {"loans": 0, "books": 0})
+        amounts["loans"] += loans
+        amounts["books"] += books
+        if status == StatusBookLoanOptions.returned and old_status in ACTIVE_BOOK_LOAN_STATUSES:
+            daily["returns"] += loans
+            daily["books_returned"] += books
+        elif status == StatusBookLoanOptions.past and old_status == StatusBookLoanOptions.in_time:
+            daily["overdue"] += loans
+
+    add_to_counters(LoanDailyStats, "date", {day: daily})
+    add_to_counters(LoanStatusStats, "status", statuses)
+
+
+def record_removals(removals):
+    """
+    Remove deleted loans from the status summary, the activity of the days is kept.
+    :param removals: <list> of tuples with the status, the amount of loans and of their books
+    """
+    statuses = {}
+    for status, loans, books in removals:
+        amounts = statuses.setdefault(status, {"loans": 0, "books": 0})
+        amounts["loans"] -= loans
+        amounts["books"] -= books
+    add_to_counters(LoanStatusStats, "status", statuses)
+
+
+def rebuild_loan_stats():
+    """
+    Calculate the summaries again from the loans. There is no history of the status changes, so the returns are
+    counted on the last update of the returned loans and the overdue loans on the day after their delivery date.
+    :return: <tuple> amount of daily, book and status rows
+    """
+    links = BookLoan.books.through.objects.order_by()
+    daily = {}
+
+    def add_daily(rows, field):
+        for row in rows:
+            daily.setdefault(row["day"], dict.fromkeys(DAILY_FIELDS, 0))[field] += row["amount"]
+
+    created_day = TruncDate("created_at")
+    returned = BookLoan.objects.order_by().filter(status=StatusBookLoanOptions.returned)
+    add_daily(BookLoan.objects.order_by().annotate(day=created_day).values("day").annotate(amount=Count("pk")),
+              "loans")
+    add_daily(links.annotate(day=TruncDate("bookloan__created_at")).values("day").annotate(amount=Count("pk")),
+              "books_loaned")
+    add_daily(returned.annotate(day=TruncDate("updated_at")).values("day").annotate(amount=Count("pk")), "returns")
+    add_daily(links.filter(bookloan__status=StatusBookLoanOptions.returned).annotate(
+        day=TruncDate("bookloan__updated_at")
+    ).values("day").annotate(amount=Count("pk")), "books_returned")
+    add_daily([
+        {"day": row["end_date"] + timedelta(days=1), "amount": row["amount"]}
+        for row in BookLoan.objects.order_by().filter(status=StatusBookLoanOptions.past).values("end_date").annotate(
+            amount=Count("pk")
+        )
+    ], "overdue")
+
+    statuses = {}
+    for row in BookLoan.objects.order_by().values("status").annotate(amount=Count("pk")):
+        statuses.setdefault(row["status"], {"loans": 0, "books": 0})["loans"] = row["amount"]
+    for row in links.values("bookloan__status").annotate(amount=Count("pk")):
+        statuses.setdefault(row["bookloan__status"], {"loans": 0, "books": 0})["books"] = row["amount"]
+
+    with transaction.atomic():
+        LoanDailyStats.objects.all().delete()
+        BookDailyStats.objects.all().delete()
+        LoanStatusStats.objects.all().delete()
+        LoanDailyStats.objects.bulk_create([LoanDailyStats(date=day, **amounts) for day, amounts in daily.items()],
+                                           batch_size=1000)
+        book_rows = links.annotate(day=TruncDate("bookloan__created_at")).values("book", "day").annotate(
+            amount=Count("pk")
+        )
+        books = 0
+        for chunk in get_chunks(book_rows.iterator(), 5000):
+            BookDailyStats.objects.bulk_create([
+                BookDailyStats(book_id=row["book"], date=row["day"], loans=row["amount"]) for row in chunk
+            ])
+            books += len(chunk)
+        LoanStatusStats.objects.bulk_create([
+            LoanStatusStats(status=status, **amounts) for status, amounts in statuses.items()
+        ])
+    return len(daily), books, len(statuses)
+
+
+def get_loan_stats(days=30, top=10, until=None):
+    """
+    Returns the dashboard data from the summaries: the activity per day of the period, the most borrowed books,
+    the loans per status and the share of the copies that are on loan.
+    :param days: <int> days of the period, ending on until
+    :param top: <int> amount of most borrowed books
+    :param until: <date> last day of the period, by default today
+    """
+    until = until or timezone.localdate()
+    since = until - timedelta(days=days - 1)
+    rows = {row.date: row for row in LoanDailyStats.objects.filter(date__range=(since, until))}
+    daily = []
+    for offset in range(days):
+        day = since + timedelta(days=offset)
+        row = rows.get(day)
+        daily.append(dict({field: getattr(row, field) if row else 0 for field in DAILY_FIELDS}, date=day))
+
+    top_books = list(BookDailyStats.objects.filter(date__range=(since, until)).values("book").annotate(
+        loans=Sum("loans")
+    ).order_by("-loans", "book")[:top])
+    # The titles are read for the top books only, the rollup is grouped without joining the books
+    titles = Book.objects.only("title").in_bulk([row["book"] for row in top_books])
+
+    statuses = {status: {"loans": 0, "books": 0} for status, _ in StatusBookLoanOptions.choices}
+    for row in LoanStatusStats.objects.all():
+        statuses[row.status] = {"loans": row.loans, "books": row.books}
+    on_loan = sum(statuses[status]["books"] for status in ACTIVE_BOOK_LOAN_STATUSES)
+    # The copies only change with the book edits, the total is cached until the books change instead of summarized
+    copies = get_or_set(get_data_namespace(Book), ["copies"],
+                        lambda: Book.objects.aggregate(total=Sum("quantity"))["total"] or 0)
+
+    return {
+        "since": since,
+        "until": until,
+        "daily": daily,
+        "totals": {field: sum(row[field] for row in daily) for field in DAILY_FIELDS},
+        "top_books": [{"id": row["book"], "title": titles[row["book"]].title, "loans": row["loans"]}
+                      for row in top_books],
+        "statuses": statuses,
+        "stock": {
+            "on_loan": on_loan,
+            "copies": copies,
+            "utilisation": round(on_loan * 100 / copies, 1) if copies else 0,
+        },
+    }
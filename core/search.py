@@ -0,0 +1,134 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+BOOK_SEARCH_TABLE = "core_book_search"
+
+# bm25 column weights for (title, summary, authors), lower rank is more relevant
+BOOK_SEARCH_WEIGHTS = (10.0, 1.0, 5.0)
+
+TERM_REGEX = re.compile(r"\w+", re.UNICODE)
+
+
+def has_search_index():
+    """Return if the current database supports the FTS5 book index."""
+    return connection.vendor == "sqlite"
+
+
+def build_match_query(value):
+    """
+    Converts the user input into a safe FTS5 MATCH expression.
+    Each term is quoted and used as prefix, so partial words keep matching while typing.
+    """
+    terms = TERM_REGEX.findall(value or "")
+    return " ".join('"{}"*'.format(term) for term in terms)
+
+
+def search_books(queryset, value):
+    """Filter a Book queryset with the full-text index and order it by relevance."""
+    match_query = build_match_query(value)
+    if not has_search_index() or not match_query:
+        return queryset.filter(
+            Q(title__icontains=value)
+            | Q(summary__icontains=value)
+            | Q(author__full_name__icontains=value)
+        ).distinct()
+
+    # The index is joined once, so the MATCH runs once and bm25 is read from the joined row
+    book_table = connection.ops.quote_name(queryset.model._meta.db_table)
+    rank = "bm25({}, {})".format(BOOK_SEARCH_TABLE, ", ".join(str(weight) for weight in BOOK_SEARCH_WEIGHTS))
+    return queryset.extra(
+        select={"search_rank": rank},
+        tables=[BOOK_SEARCH_TABLE],
+        where=["{} MATCH %s".format(BOOK_SEARCH_TABLE), "{}.rowid = {}.id".format(BOOK_SEARCH_TABLE, book_table)],
+        params=[match_query],
+    ).order_by("search_rank", "-created_at")
+
+
+def _get_book_rows(books):
+    """Returns the rows to store in the index for the given books, authors must be prefetched."""
+    return [
+        (book.pk, book.title, book.summary or "", " ".join(author.full_name for author in book.author.all()))
+        for book in books
+    ]
+
+
+def index_books(book_ids):
+    """Insert or refresh the given books in the search index."""
+    from core.models import Book
+
+    if not has_search_index():
+        return
+    book_ids = list(book_ids)
+    if not book_ids:
+        return
+
+    remove_books(book_ids)
+    books = Book.objects.filter(pk__in=book_ids).prefetch_related("author")
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO {}(rowid, title, summary, authors) VALUES (%s, %s, %s, %s)".format(BOOK_SEARCH_TABLE),
+            _get_book_rows(books)
+        )
+
+
+def add_books(rows):
+    """
+    Insert books that are not indexed yet without reading them again, used by the bulk imports.
+    :param rows: <iterable> of (id, title, summary, authors names) tuples
+    """
+    if not has_search_index():
+        return
+
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO {}(rowid, title, summary, authors) VALUES (%s, %s, %s, %s)".format(BOOK_SEARCH_TABLE),
+            [(pk, title, summary or "", " ".join(authors)) for pk, title, summary, authors in rows]
+        )
+
+
+def remove_books(book_ids):
+    """Remove the given books from the search index."""
+    if not has_search_index():
+        return
+    book_ids = list(book_ids)
+    if not book_ids:
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM {} WHERE rowid IN ({})".format(BOOK_SEARCH_TABLE, ", ".join(["%s"] * len(book_ids))),
+            book_ids
+        )
+
+
+def rebuild_index(batch_size=2000):
+    """
+    Rebuild the whole search index from the Book and Author tables.
+    :param batch_size: <int> amount of books loaded and inserted per batch
+    :return: <int> amount of books indexed
+    """
+    from core.models import Book
+
+    if not has_search_index():
+        return 0
+
+    total = 0
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM {}".format(BOOK_SEARCH_TABLE))
+        queryset = Book.objects.order_by("pk").prefetch_related("author")
+        last_pk = 0
+        while True:
+            books = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+            if not books:
+                break
+            cursor.executemany(
+                "INSERT INTO {}(rowid, title, summary, authors) VALUES (%s, %s, %s, %s)".format(BOOK_SEARCH_TABLE),
+                _get_book_rows(books)
+            )
+            total += len(books)
+            last_pk = books[-1].pk
+        cursor.execute("INSERT INTO {}({}) VALUES ('optimize')".format(BOOK_SEARCH_TABLE, BOOK_SEARCH_TABLE))
+
+    return total
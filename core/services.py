@@ -0,0 +1,663 @@
+from collections import Counter
+from datetime import date, datetime, timedelta
+from functools import reduce
+from logging import getLogger
+from operator import or_
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, CharField, Count, Exists, F, IntegerField, OuterRef, Prefetch, Q, Value, When, \
+    Window
+from django.db.models.functions import Greatest, RowNumber
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from core.enums import ACTIVE_BOOK_LOAN_STATUSES, ACTIVE_HOLD_STATUSES, HoldStatusOptions, LoanReminderOptions, \
+    StatusBookLoanOptions
+from core.models import Author, Book, BookHold, BookLoan, LoanReminder
+from core.reports import record_checkouts, record_status_changes
+from core.search import add_books
+from core.utils import get_current_date, update_books_on_loan, update_loan_counters, update_next_return_dates, \
+    update_stock
+from customers.models import Customer
+from utils.services.outbox import enqueue_email, serialize_email_data
+from utils.utils import bump_data_version, get_chunks, normalize_text
+
+logger = getLogger(__name__)
+
+
+class OutOfStockError(Exception):
+    """Raised when some books have no copies available, the loan transaction is rolled back"""
+
+    def __init__(self, books):
+        self.books = books
+        super().__init__(str(_("No hay ejemplares disponibles de: {}")).format(", ".join(str(book) for book in books)))
+
+
+class LoanLimitError(Exception):
+    """Raised when the loan would exceed the books a customer can have on loan, the transaction is rolled back"""
+
+    def __init__(self):
+        super().__init__(str(_("Este cliente supera el limite de libros prestados.")))
+
+
+def reserve_loan_quota(customer_id, amount):
+    """
+    Add the books to the counter of the customer only if it stays within the limit, the check and the increment are
+    one conditional update so concurrent checkouts can not exceed it. Must run inside the loan transaction.
+    :raise LoanLimitError: if the customer would exceed the limit
+    """
+    if not Customer.objects.filter(pk=customer_id, books_on_loan__lte=Customer.MAX_BOOKS_ON_LOAN - amount).update(
+        books_on_loan=F("books_on_loan") + amount
+    ):
+        raise LoanLimitError()
+    bump_data_version(Customer)
+
+
+def reserve_stock(books):
+    """
+    Take one copy of every book, only where there are copies available. Must run inside the loan transaction.
+    :param books: <iterable> books or books ids
+    :raise OutOfStockError: with the books that had no copies available
+    """
+    book_ids = sorted({getattr(book, "pk", book) for book in books})
+    failed = [
+        book_id for book_id in book_ids
+        if not Book.objects.filter(pk=book_id, in_stock__gt=0).update(in_stock=F("in_stock") - 1)
+    ]
+    bump_data_version(Book)
+    if failed:
+        raise OutOfStockError(list(Book.objects.filter(pk__in=failed)))
+
+
+def checkout_book_loan(book_loan, books, reserved=False):
+    """
+    Save a new loan taking its books from the stock in the same transaction.
+    :param book_loan: <BookLoan> unsaved loan
+    :param books: <iterable> books of the loan
+    :param reserved: <boolean> the copies were already taken from the stock, like the copies assigned to a hold
+    :raise OutOfStockError: if any book has no copies available, nothing is saved
+    :raise LoanLimitError: if the customer would exceed the books on loan limit, nothing is saved
+    """
+    with transaction.atomic():
+        is_active = book_loan.status in ACTIVE_BOOK_LOAN_STATUSES
+        book_ids = {getattr(book, "pk", book) for book in books}
+        if is_active:
+            if not reserved:
+                reserve_stock(books)
+            reserve_loan_quota(book_loan.customer_id, len(book_ids))
+        book_loan.save()
+        book_loan.books.set(books)
+        update_loan_counters(book_ids, loans=1, active=1 if is_active else 0, borrowed_at=book_loan.created_at)
+        if is_active:
+            update_next_return_dates(book_ids)
+        record_checkouts([(book_loan.status, book_ids)])
+    return book_loan
+
+
+def get_status_group(status):
+    """Returns the statuses that have the same effect on the stock than the given status."""
+    if status in ACTIVE_BOOK_LOAN_STATUSES:
+        return ACTIVE_BOOK_LOAN_STATUSES
+    return (StatusBookLoanOptions.returned,)
+
+
+def change_book_loan_status(book_loan, status, expected_status=None):
+    """
+    Apply a status transition with a conditional update, the stock and the customer counter are only adjusted
+    if the row transitioned, so retries and concurrent requests do not apply it twice.
+    :param book_loan: <BookLoan> loan to change
+    :param status: <str> new status
+    :param expected_status: <str> status the loan must have, by default the status it had when it was loaded
+    :return: <boolean> if the loan transitioned
+    :raise OutOfStockError: if a returned loan is reopened and any book has no copies available
+    :raise LoanLimitError: if a returned loan is reopened and the customer would exceed the limit
+    """
+    expected_status = expected_status or book_loan._initial_status
+    was_active = expected_status in ACTIVE_BOOK_LOAN_STATUSES
+    is_active = status in ACTIVE_BOOK_LOAN_STATUSES
+
+    with transaction.atomic():
+        # The status may have changed inside the group, like an overdue loan loaded as in time
+        old_status = BookLoan.objects.select_for_update().filter(pk=book_loan.pk).values_list(
+            "status", flat=True
+        ).first()
+        transitioned = BookLoan.objects.filter(
+            pk=book_loan.pk, status__in=get_status_group(expected_status)
+        ).exclude(status=status).update(status=status, updated_at=timezone.now())
+        if not transitioned:
+            return False
+        bump_data_version(BookLoan)
+        book_ids = list(book_loan.books.values_list("pk", flat=True))
+        record_status_changes([(old_status, status, 1, len(book_ids))])
+
+        if was_active and not is_active:
+            # The copies go to the waiting holds first, only the rest is given back to the stock
+            to_stock = release_copies({book_id: 1 for book_id in book_ids})
+            update_stock(Book.objects.filter(pk__in=[book_id for book_id, amount in to_stock.items() if amount]))
+            update_books_on_loan(book_loan, less=True)
+            update_loan_counters(book_ids, active=-1)
+            update_next_return_dates(book_ids)
+        elif is_active and not was_active:
+            reserve_stock(book_ids)
+            reserve_loan_quota(book_loan.customer_id, len(book_ids))
+            update_loan_counters(book_ids, active=1)
+            update_next_return_dates(book_ids)
+
+    book_loan.status = status
+    book_loan._initial_status = status
+    return True
+
+
+class BookHoldError(Exception):
+    """Raised when a hold can not be placed or changed, the transaction is rolled back"""
+
+
+def release_copies(amounts):
+    """
+    Assign the freed copies of the books to the oldest waiting holds, with a lookup of the head of the queue per
+    copy. The copies never go through the stock so they can not be taken by other loans. Must run inside the
+    transaction that frees the copies.
+    :param amounts: <dict> freed copies per book id
+    :return: <dict> copies per book id that had no hold and must be given back to the stock
+    """
+    to_stock = dict(amounts)
+    current = timezone.now()
+    expires_at = current + timedelta(days=settings.BOOK_HOLD_PICKUP_DAYS)
+    for chunk in get_chunks(amounts):
+        # Only the books with a queue are checked, the counter avoids a lookup per returned book
+        queued = Book.objects.select_for_update().filter(pk__in=chunk, holds_waiting__gt=0).values_list("pk", flat=True)
+        for book_id in queued:
+            assigned = 0
+            while to_stock[book_id]:
+                # The head is locked without skipping, a locked head waits instead of letting a later hold pass
+                head = BookHold.objects.select_for_update().filter(
+                    book_id=book_id, status=HoldStatusOptions.waiting
+                ).order_by("sequence").values_list("pk", flat=True).first()
+                if head is None:
+                    break
+                # A concurrent cancel may have changed the head, look again
+                if BookHold.objects.filter(pk=head, status=HoldStatusOptions.waiting).update(
+                    status=HoldStatusOptions.ready, ready_at=current, expires_at=expires_at, updated_at=current
+                ):
+                    to_stock[book_id] -= 1
+                    assigned += 1
+            if assigned:
+                Book.objects.filter(pk=book_id).update(holds_waiting=Greatest(F("holds_waiting") - assigned, 0))
+                bump_data_version(Book, BookHold)
+    return to_stock
+
+
+def give_back_copies(amounts):
+    """Give back the freed copies to the waiting holds and the rest to the stock, must run inside a transaction."""
+    to_stock = release_copies(amounts)
+    for chunk in get_chunks([(pk, amount) for pk, amount in to_stock.items() if amount]):
+        Book.objects.filter(pk__in=[pk for pk, _ in chunk]).update(in_stock=F("in_stock") + get_amount_case(chunk))
+        bump_data_version(Book)
+
+
+def set_queue_positions(holds):
+    """
+    Set the place in the queue of the waiting holds of a page with one window query, only the queues up to the last
+    hold of the page are read. The rest of the holds get no position.
+    :param holds: <list> holds of the page
+    """
+    last = {}
+    for hold in holds:
+        if hold.status == HoldStatusOptions.waiting:
+            last[hold.book_id] = max(last.get(hold.book_id, 0), hold.sequence)
+    positions = {}
+    if last:
+        queues = reduce(or_, [Q(book_id=book_id, sequence__lte=sequence) for book_id, sequence in last.items()])
+        positions = dict(BookHold.objects.filter(queues, status=HoldStatusOptions.waiting).annotate(
+            position=Window(RowNumber(), partition_by=[F("book")], order_by=F("sequence").asc())
+        ).order_by().values_list("pk", "position"))
+    for hold in holds:
+        hold.position = positions.get(hold.pk)
+    return holds
+
+
+def place_book_hold(book, customer):
+    """
+    Add the customer at the end of the queue of a book without copies available.
+    :raise BookHoldError: if the book has copies available or the customer already has a hold of the book
+    """
+    with transaction.atomic():
+        # The update locks the book until the hold is saved, so the holds get consecutive sequences
+        if not Book.objects.filter(pk=book.pk, in_stock=0).update(hold_sequence=F("hold_sequence") + 1,
+                                                                  holds_waiting=F("holds_waiting") + 1):
+            raise BookHoldError(_("El libro tiene ejemplares disponibles, se puede prestar directamente."))
+        sequence = Book.objects.filter(pk=book.pk).values_list("hold_sequence", flat=True).get()
+        try:
+            with transaction.atomic():
+                hold = BookHold.objects.create(book=book, customer=customer, sequence=sequence)
+        except IntegrityError:
+            raise BookHoldError(_("El cliente ya tiene una reserva de este libro."))
+        bump_data_version(Book)
+    return hold
+
+
+def cancel_book_hold(hold, status=HoldStatusOptions.cancelled):
+    """
+    Remove a hold from the queue, the copy assigned to a ready hold goes to the next hold or to the stock.
+    :return: <boolean> False if the hold was not active
+    """
+    with transaction.atomic():
+        old_status = BookHold.objects.select_for_update().filter(pk=hold.pk).values_list("status", flat=True).first()
+        if not BookHold.objects.filter(pk=hold.pk, status=old_status, status__in=ACTIVE_HOLD_STATUSES).update(
+            status=status, updated_at=timezone.now()
+        ):
+            return False
+        if old_status == HoldStatusOptions.waiting:
+            Book.objects.filter(pk=hold.book_id).update(holds_waiting=Greatest(F("holds_waiting") - 1, 0))
+            bump_data_version(Book)
+        else:
+            give_back_copies({hold.book_id: 1})
+    hold.status = status
+    return True
+
+
+def checkout_book_hold(hold, end_date):
+    """
+    Create the loan of a ready hold with the copy assigned to it.
+    :raise BookHoldError: if the hold is not ready or the customer has reached the loan limit
+    :return: <BookLoan> created loan
+    """
+    with transaction.atomic():
+        if not BookHold.objects.filter(pk=hold.pk, status=HoldStatusOptions.ready).update(
+            status=HoldStatusOptions.fulfilled, updated_at=timezone.now()
+        ):
+            raise BookHoldError(_("La reserva no tiene un ejemplar asignado."))
+        try:
+            book_loan = checkout_book_loan(BookLoan(customer_id=hold.customer_id, end_date=end_date),
+                                           [hold.book_id], reserved=True)
+        except LoanLimitError as error:
+            raise BookHoldError(str(error))
+        BookHold.objects.filter(pk=hold.pk).update(book_loan=book_loan)
+    hold.status = HoldStatusOptions.fulfilled
+    hold.book_loan = book_loan
+    return book_loan
+
+
+def expire_book_holds():
+    """
+    Expire the ready holds that were not picked up in time, their copies go to the next holds or to the stock.
+    :return: <int> amount of expired holds
+    """
+    current = timezone.now()
+    with transaction.atomic():
+        expired = list(BookHold.objects.select_for_update().filter(
+            status=HoldStatusOptions.ready, expires_at__lt=current
+        ).values_list("pk", "book"))
+        for chunk in get_chunks([pk for pk, _ in expired]):
+            BookHold.objects.filter(pk__in=chunk).update(status=HoldStatusOptions.expired, updated_at=current)
+        give_back_copies(Counter(book_id for _, book_id in expired))
+    return len(expired)
+
+
+def return_book_loan(book_loan):
+    """
+    Mark an active loan as returned and give back its books to the stock.
+    :return: <boolean> False if the loan was already returned
+    """
+    return change_book_loan_status(book_loan, StatusBookLoanOptions.returned,
+                                   expected_status=StatusBookLoanOptions.in_time)
+
+
+class BatchConflictError(Exception):
+    """Raised when the stock or the quotas changed while a batch was being applied"""
+
+
+def get_amount_case(amounts):
+    """Returns a CASE expression with the amount of every primary key."""
+    return Case(*[When(pk=pk, then=Value(amount)) for pk, amount in amounts], output_field=IntegerField())
+
+
+def parse_end_date(value):
+    """
+    Parse the delivery date of a bulk row, it can be a date or an ISO string.
+    :return: <date> or None if it is not a valid date
+    """
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def validate_bulk_checkout(rows):
+    """
+    Validate a batch of loans with one query per model, quotas and stock are accumulated through the batch.
+    :return: <tuple> errors per row and valid rows with the customer id
+    """
+    documents = {row["customer"] for row in rows}
+    book_ids = {book_id for row in rows for book_id in row["books"]}
+    customers = {}
+    for chunk in get_chunks(documents):
+        customers.update({
+            customer["document_number"]: customer
+            for customer in Customer.objects.filter(document_number__in=chunk).order_by().values(
+                "pk", "document_number", "books_on_loan"
+            )
+        })
+    books = {}
+    for chunk in get_chunks(book_ids):
+        books.update({book.pk: book for book in Book.objects.filter(pk__in=chunk).order_by().only("pk", "title", "in_stock")})
+
+    books_on_loan = {customer["pk"]: customer["books_on_loan"] for customer in customers.values()}
+    in_stock = {book.pk: book.in_stock for book in books.values()}
+    today = get_current_date()
+    errors = {}
+    valid_rows = []
+    for index, row in enumerate(rows):
+        customer = customers.get(row["customer"])
+        row_books = list(dict.fromkeys(row["books"]))
+        missing = [book_id for book_id in row_books if book_id not in books]
+        end_date = parse_end_date(row["end_date"])
+        if not customer:
+            errors[index] = str(_("Cliente no encontrado."))
+        elif not end_date:
+            errors[index] = str(_("Fecha de entrega inválida."))
+        elif end_date < today:
+            errors[index] = str(_("La fecha de entrega no puede ser anterior a hoy."))
+        elif not row_books:
+            errors[index] = str(_("El préstamo debe tener libros."))
+        elif missing:
+            errors[index] = str(_("Libros no encontrados: {}")).format(", ".join(str(book_id) for book_id in missing))
+        elif books_on_loan[customer["pk"]] + len(row_books) > Customer.MAX_BOOKS_ON_LOAN:
+            errors[index] = str(_("Este cliente supera el limite de libros prestados."))
+        else:
+            out_of_stock = [books[book_id] for book_id in row_books if in_stock[book_id] <= 0]
+            if out_of_stock:
+                errors[index] = str(OutOfStockError(out_of_stock))
+                continue
+            books_on_loan[customer["pk"]] += len(row_books)
+            for book_id in row_books:
+                in_stock[book_id] -= 1
+            valid_rows.append((index, customer["pk"], row_books, end_date))
+
+    return errors, valid_rows
+
+
+def apply_bulk_checkout(valid_rows):
+    """
+    Reserve the stock and the quotas with one UPDATE ... CASE per chunk and insert the loans with bulk_create.
+    Must run inside a transaction.
+    :raise BatchConflictError: if any book or customer changed after the validation
+    :return: <dict> created loan id per row index
+    """
+    books_amounts = Counter(book_id for _, _, row_books, _ in valid_rows for book_id in row_books)
+    customers_amounts = Counter()
+    for _, customer_id, row_books, _ in valid_rows:
+        customers_amounts[customer_id] += len(row_books)
+
+    current = timezone.now()
+    for chunk in get_chunks(books_amounts.items()):
+        amount = get_amount_case(chunk)
+        updated = Book.objects.filter(pk__in=[pk for pk, _ in chunk], in_stock__gte=amount).update(
+            in_stock=F("in_stock") - amount, total_loans=F("total_loans") + amount,
+            active_loans=F("active_loans") + amount, last_borrowed_at=current
+        )
+        if updated != len(chunk):
+            raise BatchConflictError()
+    for chunk in get_chunks(customers_amounts.items()):
+        amount = get_amount_case(chunk)
+        updated = Customer.objects.filter(
+            pk__in=[pk for pk, _ in chunk], books_on_loan__lte=Customer.MAX_BOOKS_ON_LOAN - amount
+        ).update(books_on_loan=F("books_on_loan") + amount)
+        if updated != len(chunk):
+            raise BatchConflictError()
+
+    book_loans = BookLoan.objects.bulk_create([
+        BookLoan(customer_id=customer_id, end_date=end_date) for _, customer_id, _, end_date in valid_rows
+    ])
+    BookLoan.books.through.objects.bulk_create([
+        BookLoan.books.through(bookloan_id=book_loan.pk, book_id=book_id)
+        for book_loan, (_, _, row_books, _) in zip(book_loans, valid_rows) for book_id in row_books
+    ])
+    update_next_return_dates(list(books_amounts))
+    record_checkouts([(StatusBookLoanOptions.in_time, row_books) for _, _, row_books, _ in valid_rows])
+    # bulk_create and update do not send the signals that invalidate the cached data
+    bump_data_version(Book, Customer, BookLoan)
+    return {index: book_loan.pk for book_loan, (index, _, _, _) in zip(book_loans, valid_rows)}
+
+
+def bulk_checkout_book_loans(rows, attempts=3):
+    """
+    Create many loans in one transaction.
+    :param rows: <list> of dicts with the customer document number, the list of books ids and the end date
+    :param attempts: <int> times the batch is validated again if the stock changed while it was applied
+    :return: <list> of dicts with the row index and the created book_loan id or the error of the row
+    """
+    for attempt in range(attempts):
+        errors, valid_rows = validate_bulk_checkout(rows)
+        try:
+            with transaction.atomic():
+                created = apply_bulk_checkout(valid_rows) if valid_rows else {}
+            break
+        except BatchConflictError:
+            if attempt == attempts - 1:
+                raise
+
+    return [
+        {"row": index, "book_loan": created.get(index), "error": errors.get(index)}
+        for index in range(len(rows))
+    ]
+
+
+def bulk_return_book_loans(book_loan_ids):
+    """
+    Mark many loans as returned with one statement per chunk and give back their books with one grouped query
+    and one UPDATE ... CASE per chunk.
+    :param book_loan_ids: <iterable> ids of the loans
+    :return: <dict> with the lists of returned, already_returned and not_found loans ids
+    """
+    book_loan_ids = sorted(set(book_loan_ids))
+    returned = []
+    with transaction.atomic():
+        existing = []
+        for chunk in get_chunks(book_loan_ids):
+            rows = BookLoan.objects.select_for_update().filter(pk__in=chunk).order_by().values_list("pk", "status")
+            existing.extend(rows)
+            active_ids = [pk for pk, status in rows if status in ACTIVE_BOOK_LOAN_STATUSES]
+            updated = BookLoan.objects.filter(pk__in=active_ids, status__in=ACTIVE_BOOK_LOAN_STATUSES).update(
+                status=StatusBookLoanOptions.returned, updated_at=timezone.now()
+            )
+            if updated != len(active_ids):
+                raise BatchConflictError()
+            returned.extend(active_ids)
+
+        books_amounts = {}
+        customers_amounts = {}
+        old_statuses = dict(existing)
+        changes = Counter()
+        for chunk in get_chunks(returned):
+            links = BookLoan.books.through.objects.filter(bookloan_id__in=chunk).order_by()
+            loans_books = dict(links.values_list("bookloan").annotate(amount=Count("pk")))
+            for pk in chunk:
+                changes[old_statuses[pk], "loans"] += 1
+                changes[old_statuses[pk], "books"] += loans_books.get(pk, 0)
+            for row in links.values("book").annotate(amount=Count("pk")):
+                books_amounts[row["book"]] = books_amounts.get(row["book"], 0) + row["amount"]
+            for row in links.values("bookloan__customer").annotate(amount=Count("pk")):
+                customer_id = row["bookloan__customer"]
+                customers_amounts[customer_id] = customers_amounts.get(customer_id, 0) + row["amount"]
+
+        to_stock = release_copies(books_amounts)
+        for chunk in get_chunks(books_amounts.items()):
+            Book.objects.filter(pk__in=[pk for pk, _ in chunk]).update(
+                in_stock=F("in_stock") + get_amount_case([(pk, to_stock[pk]) for pk, _ in chunk]),
+                active_loans=Greatest(F("active_loans") - get_amount_case(chunk), 0)
+            )
+        for chunk in get_chunks(customers_amounts.items()):
+            Customer.objects.filter(pk__in=[pk for pk, _ in chunk]).update(
+                books_on_loan=Greatest(F("books_on_loan") - get_amount_case(chunk), 0)
+            )
+        update_next_return_dates(list(books_amounts))
+        if returned:
+            record_status_changes([
+                (old_status, StatusBookLoanOptions.returned, changes[old_status, "loans"],
+                 changes[old_status, "books"])
+                for old_status in ACTIVE_BOOK_LOAN_STATUSES if changes[old_status, "loans"]
+            ])
+            bump_data_version(BookLoan, Book, Customer)
+
+    existing_ids = {pk for pk, _ in existing}
+    return {
+        "returned": returned,
+        "already_returned": sorted(existing_ids - set(returned)),
+        "not_found": [pk for pk in book_loan_ids if pk not in existing_ids],
+    }
+
+
+def get_author_key(full_name):
+    """Returns the key used to match the authors by name, names without ascii letters are only lowercased."""
+    return normalize_text(full_name) or full_name.strip().lower()
+
+
+def get_author_ids():
+    """Returns the id of the authors by name key, the oldest author is kept for repeated names."""
+    author_ids = {}
+    for pk, full_name in Author.objects.order_by("pk").values_list("pk", "full_name").iterator(chunk_size=5000):
+        author_ids.setdefault(get_author_key(full_name), pk)
+    return author_ids
+
+
+def bulk_create_books(rows, author_ids, batch_size=1000):
+    """
+    Insert a batch of books, their missing authors and the relation rows with bulk_create in one transaction.
+    :param rows: <list> of dicts with the title, summary, quantity, in_stock and the list of authors names
+    :param author_ids: <dict> author id by name key, updated with the created authors once the batch is committed
+    :param batch_size: <int> amount of rows per insert
+    :return: <tuple> amount of created books and authors
+    """
+    new_authors = {}
+    for row in rows:
+        for full_name in row["authors"]:
+            key = get_author_key(full_name)
+            if key not in author_ids and key not in new_authors:
+                new_authors[key] = Author(full_name=full_name.strip())
+
+    with transaction.atomic():
+        Author.objects.bulk_create(new_authors.values(), batch_size=batch_size)
+        books = Book.objects.bulk_create([
+            Book(title=row["title"], summary=row["summary"], quantity=row["quantity"], in_stock=row["in_stock"])
+            for row in rows
+        ], batch_size=batch_size)
+        links = []
+        for book, row in zip(books, rows):
+            keys = dict.fromkeys(get_author_key(full_name) for full_name in row["authors"])
+            links.extend(
+                Book.author.through(book_id=book.pk, author_id=author_ids[key] if key in author_ids else new_authors[key].pk)
+                for key in keys
+            )
+        Book.author.through.objects.bulk_create(links, batch_size=batch_size)
+        # bulk_create does not send the signals that keep the search index and the cached data in sync
+        add_books((book.pk, book.title, book.summary, row["authors"]) for book, row in zip(books, rows))
+        bump_data_version(Book, Author)
+
+    author_ids.update({key: author.pk for key, author in new_authors.items()})
+    return len(books), len(new_authors)
+
+
+def get_reminder_template_ids():
+    return {
+        LoanReminderOptions.due_soon: settings.LOAN_REMINDER_DUE_SOON_TEMPLATE_ID,
+        LoanReminderOptions.overdue: settings.LOAN_REMINDER_OVERDUE_TEMPLATE_ID,
+    }
+
+
+def get_reminder_book_loans(today, due_soon_days):
+    """
+    Returns the loans that are overdue or due in the next days and have no reminder of that kind for their
+    delivery date, with the customer joined and only the titles of the books to prefetch.
+    """
+    # Overdue by the delivery date, the loans not swept yet are still in time
+    kind = Case(When(end_date__lt=today, then=Value(LoanReminderOptions.overdue)),
+                default=Value(LoanReminderOptions.due_soon), output_field=CharField())
+    reminded = LoanReminder.objects.filter(book_loan=OuterRef("pk"), kind=OuterRef("reminder_kind"),
+                                           end_date=OuterRef("end_date"))
+    return BookLoan.objects.filter(
+        status__in=ACTIVE_BOOK_LOAN_STATUSES, end_date__lte=today + timedelta(days=due_soon_days),
+        customer__email__isnull=False,
+    ).exclude(customer__email="").annotate(reminder_kind=kind).filter(~Exists(reminded)).select_related(
+        "customer"
+    ).only(
+        "status", "end_date", "customer__first_name", "customer__last_name", "customer__email"
+    ).prefetch_related(Prefetch("books", queryset=Book.objects.only("title").order_by("title"))).order_by("pk")
+
+
+def get_reminder_version(book_loan):
+    """Returns the recipient and the template params of the loan reminder"""
+    customer = book_loan.customer
+    return {
+        "to": [{"email": customer.email, "name": customer.get_full_name()}],
+        "params": {
+            "name": customer.get_full_name(),
+            "end_date": book_loan.end_date.isoformat(),
+            "books": book_loan.get_books,
+        },
+    }
+
+
+def claim_loan_reminders(kind, book_loans, template_id):
+    """
+    Store the reminders of the loans with their email, the reminders already stored by another run are skipped per
+    loan and the email only keeps the versions of the claimed ones. Must run inside a transaction.
+    :return: <list> claimed loans
+    """
+    email = enqueue_email({"message_versions": [get_reminder_version(book_loan) for book_loan in book_loans]},
+                          template_id)
+    LoanReminder.objects.bulk_create([
+        LoanReminder(book_loan=book_loan, kind=kind, end_date=book_loan.end_date, outbox_email=email)
+        for book_loan in book_loans
+    ], ignore_conflicts=True)
+    claimed_ids = set(LoanReminder.objects.filter(outbox_email=email).values_list("book_loan_id", flat=True))
+    claimed = [book_loan for book_loan in book_loans if book_loan.pk in claimed_ids]
+    if not claimed:
+        email.delete()
+    elif len(claimed) < len(book_loans):
+        logger.warning("{} loan reminders were queued by another run".format(len(book_loans) - len(claimed)))
+        versions = [get_reminder_version(book_loan) for book_loan in claimed]
+        email.data = serialize_email_data({"message_versions": versions})
+        email.save(update_fields=["data", "updated_at"])
+    return claimed
+
+
+def send_loan_reminders(today=None, due_soon_days=None, batch_size=None):
+    """
+    Queue the reminders of the loans that are overdue or due soon, one outbox email per batch and kind with a
+    message version per loan. The reminders are stored with the email so a new run only sends the missing ones,
+    and a loan whose delivery date changes gets a new reminder.
+    :param today: <date> by default the current date
+    :param due_soon_days: <int> days before the delivery date to remind, by default LOAN_REMINDER_DUE_SOON_DAYS
+    :param batch_size: <int> loans per email, by default LOAN_REMINDER_BATCH_SIZE
+    :return: <dict> amount of reminders per kind and of queued emails
+    """
+    today = today or get_current_date()
+    due_soon_days = settings.LOAN_REMINDER_DUE_SOON_DAYS if due_soon_days is None else due_soon_days
+    batch_size = batch_size or settings.LOAN_REMINDER_BATCH_SIZE
+    template_ids = get_reminder_template_ids()
+    queryset = get_reminder_book_loans(today, due_soon_days)
+    result = {LoanReminderOptions.due_soon: 0, LoanReminderOptions.overdue: 0, "emails": 0}
+
+    last_pk = 0
+    while True:
+        book_loans = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+        if not book_loans:
+            break
+        last_pk = book_loans[-1].pk
+
+        by_kind = {}
+        for book_loan in book_loans:
+            by_kind.setdefault(book_loan.reminder_kind, []).append(book_loan)
+        with transaction.atomic():
+            for kind, kind_loans in by_kind.items():
+                claimed = claim_loan_reminders(kind, kind_loans, template_ids[kind])
+                if claimed:
+                    result[kind] += len(claimed)
+                    result["emails"] += 1
+    return result
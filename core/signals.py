@@ -0,0 +1,90 @@
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from core.enums import ACTIVE_BOOK_LOAN_STATUSES, HoldStatusOptions
+from core.models import Author, Book, BookHold, BookLoan
+from core.reports import record_removals
+from core.search import index_books, remove_books
+from core.services import give_back_copies
+from core.utils import update_loan_counters, update_next_return_dates
+
+
+@receiver(post_save, sender=Book)
+def update_book_search_index(sender, instance, raw=False, **kwargs):
+    # Keep the full-text index in sync with the book fields
+    if not raw:
+        index_books([instance.pk])
+
+
+@receiver(post_delete, sender=Book)
+def remove_book_search_index(sender, instance, **kwargs):
+    remove_books([instance.pk])
+
+
+@receiver(m2m_changed, sender=Book.author.through)
+def update_book_authors_search_index(sender, instance, action, reverse, pk_set, **kwargs):
+    # Authors are indexed with the book, so the book must be refreshed when the relation changes
+    if action not in ("post_add", "post_remove", "post_clear", "pre_clear"):
+        return
+
+    if action == "pre_clear":
+        if reverse:
+            instance._search_book_ids = list(instance.books.values_list("pk", flat=True))
+    elif not reverse:
+        index_books([instance.pk])
+    elif action == "post_clear":
+        index_books(getattr(instance, "_search_book_ids", []))
+    else:
+        index_books(pk_set or [])
+
+
+@receiver(post_save, sender=Author)
+def update_author_search_index(sender, instance, created, raw=False, **kwargs):
+    if not raw and not created:
+        index_books(instance.books.values_list("pk", flat=True))
+
+
+@receiver(pre_delete, sender=Author)
+def collect_author_books_search_index(sender, instance, **kwargs):
+    # The relation rows are removed with the author without sending m2m_changed
+    instance._search_book_ids = list(instance.books.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=Author)
+def update_deleted_author_search_index(sender, instance, **kwargs):
+    index_books(getattr(instance, "_search_book_ids", []))
+
+
+@receiver(post_save, sender=BookLoan)
+def update_edited_book_loan_next_return(sender, instance, created, raw=False, **kwargs):
+    # The loan services keep the date for the rest of the changes
+    if not created and not raw and instance.end_date_has_changed:
+        update_next_return_dates(list(instance.books.values_list("pk", flat=True)))
+        instance._initial_end_date = instance.end_date
+
+
+@receiver(pre_delete, sender=BookLoan)
+def remove_book_loan_stats(sender, instance, **kwargs):
+    # The books are collected before the relation rows are removed with the loan
+    instance._book_ids = list(instance.books.values_list("pk", flat=True))
+    record_removals([(instance.status, 1, len(instance._book_ids))])
+
+
+@receiver(post_delete, sender=BookLoan)
+def update_deleted_book_loan_next_return(sender, instance, **kwargs):
+    # The total loans are kept as history, only the active ones are released
+    if instance.status in ACTIVE_BOOK_LOAN_STATUSES:
+        book_ids = getattr(instance, "_book_ids", [])
+        update_loan_counters(book_ids, active=-1)
+        update_next_return_dates(book_ids)
+
+
+@receiver(post_delete, sender=BookHold)
+def remove_deleted_book_hold(sender, instance, **kwargs):
+    # Holds deleted with their customer leave the queue, the copy of a ready hold goes to the next one
+    if instance.status == HoldStatusOptions.waiting:
+        Book.objects.filter(pk=instance.book_id).update(holds_waiting=Greatest(F("holds_waiting") - 1, 0))
+    elif instance.status == HoldStatusOptions.ready:
+        give_back_copies({instance.book_id: 1})
@@ -31,10 +31,17 @@ class BookTable(tables.Table):
     title = tables.Column(verbose_name=_("Título"), accessor="title", orderable=True)
     quantity = tables.Column(verbose_name=_("Cantidad"), accessor="quantity", orderable=True)
     in_stock = tables.Column(verbose_name=_("En Stock"), accessor="in_stock", orderable=True)
+    # Ordered by the indexed counters of the books
+    total_loans = tables.Column(verbose_name=_("Préstamos"), accessor="total_loans", orderable=True)
+    last_borrowed_at = tables.DateTimeColumn(verbose_name=_("Último Préstamo"), accessor="last_borrowed_at",
+                                             orderable=True, format="d/m/Y")
+    next_return_date = tables.DateColumn(verbose_name=_("Próxima Devolución"), accessor="next_return_date",
+                                         orderable=True, format="d/m/Y")
 
     class Meta:
         model = Book
-        fields = ("title", "author", "quantity", "in_stock", "actions")
+        fields = ("title", "author", "quantity", "in_stock", "next_return_date", "total_loans", "last_borrowed_at",
+                  "actions")
         row_attrs = {
             'data-in_stock': lambda record: True if record.has_availability else False
         }
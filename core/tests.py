@@ -1,17 +1,48 @@
 import datetime
+import json
+import os
+import tempfile
+import threading
+import time
+from io import StringIO
 from unittest import mock
 
 import pytz
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
 from django.contrib.auth.models import AnonymousUser
 from django.contrib.messages.storage.fallback import FallbackStorage
 from django.contrib.sessions.middleware import SessionMiddleware
-from django.test import TestCase, RequestFactory
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, connection, transaction
+from django.http import Http404
+from django.test import TestCase, TransactionTestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse, resolve
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.test import APIRequestFactory, force_authenticate
 
+from core.api.views import BookHoldViewSet, BookLoanViewSet, BookViewSet, LoanStatsViewSet
 from core.filters import BookFilter, AuthorFilter, BookLoanFilter
-from core.models import Book, Author, BookLoan
+from core.forms import BookLoanForm
+from core.models import Book, Author, BookDailyStats, BookHold, BookLoan, LoanDailyStats, LoanReminder, LoanStatusStats, \
+    OverdueSweep
+from core.reports import get_loan_stats
+from core.search import BOOK_SEARCH_TABLE, search_books
+from core.services import BatchConflictError, BookHoldError, LoanLimitError, OutOfStockError, \
+    bulk_checkout_book_loans, bulk_return_book_loans, cancel_book_hold, change_book_loan_status, checkout_book_hold, \
+    checkout_book_loan, claim_loan_reminders, expire_book_holds, get_reminder_book_loans, place_book_hold, \
+    return_book_loan, send_loan_reminders, set_queue_positions, validate_bulk_checkout
+from core.utils import get_current_date, run_overdue_sweeper, sweep_overdue_loans, update_status, update_stock
+from core.views import BookExportView, BookLoanCreateView, BookLoanExportView, BookUpdateView
 from customers.models import Customer
+from utils.models import OutboxEmail
+from utils.pagination import CustomDatatablesCursorPagination
 
 User = get_user_model()
 
@@ -119,6 +150,80 @@ class BookFilterTestCase(TestCase):
         f = BookFilter(GET, queryset=Book.objects.all())
         self.assertEqual(len(list(f.qs)), 1)
 
+    def test_filter_search_author(self):
+        """Test filters search by author full_name"""
+        GET = {'search': 'author1'}
+        f = BookFilter(GET, queryset=Book.objects.all())
+        self.assertEqual(len(list(f.qs)), 1)
+
+    def test_filter_search_diacritics(self):
+        """Test filters search ignoring accents and case"""
+        Book.objects.create(title="Cien años de soledad", quantity=1, in_stock=1)
+        GET = {'search': 'CIEN anos'}
+        f = BookFilter(GET, queryset=Book.objects.all())
+        self.assertEqual([book.title for book in f.qs], ["Cien años de soledad"])
+
+    def test_filter_search_prefix(self):
+        """Test filters search by partial words"""
+        GET = {'search': 'lib tes'}
+        f = BookFilter(GET, queryset=Book.objects.all())
+        self.assertEqual(len(list(f.qs)), 1)
+
+    def test_filter_search_relevance(self):
+        """Test filters search ordering the title matches first"""
+        other = Book.objects.create(title="Otro", summary="quijote", quantity=1, in_stock=1)
+        quijote = Book.objects.create(title="Quijote", summary="novela", quantity=1, in_stock=1)
+        GET = {'search': 'quijote'}
+        f = BookFilter(GET, queryset=Book.objects.all())
+        self.assertEqual(list(f.qs), [quijote, other])
+
+    def test_search_joins_index_once(self):
+        """Test the search joins the index once and orders by its rank instead of a subquery per book"""
+        Book.objects.create(title="Libro Otro", quantity=1, in_stock=1)
+        with CaptureQueriesContext(connection) as context:
+            titles = [book.title for book in search_books(Book.objects.all(), 'libro')]
+        self.assertEqual(len(titles), 2)
+        sql = context.captured_queries[0]['sql']
+        self.assertEqual(sql.count('MATCH'), 1)
+        self.assertNotIn('SELECT rowid', sql)
+
+    def test_search_index_author_changes(self):
+        """Test search index is updated when the authors change"""
+        self.author.full_name = "Miguel de Cervantes"
+        self.author.save()
+        self.assertEqual(list(search_books(Book.objects.all(), 'cervantes')), [self.book])
+
+        self.book.author.clear()
+        self.assertEqual(list(search_books(Book.objects.all(), 'cervantes')), [])
+
+        author = Author.objects.create(full_name="Gabriel García Márquez")
+        author.books.add(self.book)
+        self.assertEqual(list(search_books(Book.objects.all(), 'garcia')), [self.book])
+
+        author.delete()
+        self.assertEqual(list(search_books(Book.objects.all(), 'garcia')), [])
+
+    def test_search_index_delete_and_rebuild(self):
+        """Test search index is updated on book delete and by the rebuild command"""
+        book = Book.objects.create(title="Rayuela", quantity=1, in_stock=1)
+        book.delete()
+        self.assertEqual(list(search_books(Book.objects.all(), 'rayuela')), [])
+
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM {}".format(BOOK_SEARCH_TABLE))
+        call_command("rebuild_book_search_index", stdout=StringIO())
+        self.assertEqual(list(search_books(Book.objects.all(), 'libro')), [self.book])
+
+    def test_api_search(self):
+        """Test api search books by the full-text index"""
+        Book.objects.create(title="Rayuela", quantity=1, in_stock=1)
+        request = APIRequestFactory().get(reverse('books-list'), {'search': 'author1'})
+        force_authenticate(request, user=self.superadmin)
+        response = BookViewSet.as_view({'get': 'list'})(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([book['title'] for book in response.data['results']], ["Libro Test"])
+
 
 class BookTestCase(TestCase):
 
@@ -676,6 +781,12 @@ class BookLoanFilterTestCase(TestCase):
         f = BookLoanFilter(GET, queryset=BookLoan.objects.all())
         self.assertEqual(len(list(f.qs)), 1)
 
+    def test_filter_search_customer_typo(self):
+        """Test filters search by customer name with typos"""
+        GET = {'search': 'custommer'}
+        f = BookLoanFilter(GET, queryset=BookLoan.objects.all())
+        self.assertEqual(list(f.qs), [self.book_loan])
+
     def test_filter_search_status(self):
         """Test filters search by status"""
         GET = {'status': 'in_time'}
@@ -871,3 +982,1556 @@ class BookLoanTestCase(TestCase):
         self.book.refresh_from_db()
         self.assertEqual(self.book_loan.status, 'returned')
         self.assertEqual(self.book.in_stock, 6)
+
+
+class ListQueriesTestCase(TestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.superadmin = User.objects.create(email='superadmin@gmail.com', first_name='superadmin',
+                                              last_name='superadmin', is_active=True, is_superuser=True)
+
+    def create_rows(self, amount):
+        start = Customer.objects.count()
+        for i in range(start, start + amount):
+            customer = Customer.objects.create(document_number="doc{}".format(i), first_name="customer{}".format(i),
+                                               last_name="last", email="customer{}@gmail.com".format(i))
+            author = Author.objects.create(full_name="author{}".format(i))
+            book = Book.objects.create(title="book{}".format(i), quantity=5, in_stock=5)
+            book.author.add(author)
+            book_loan = BookLoan.objects.create(customer=customer, end_date="2022-10-10")
+            book_loan.books.add(book)
+
+    def count_render_queries(self, url_name, params=None):
+        url = reverse(url_name)
+        request = self.factory.get(url, params or {'per_page': 100})
+        request.COOKIES = dict()
+        request.user = self.superadmin
+        view = resolve(url).func
+        Site.objects.clear_cache()
+        with CaptureQueriesContext(connection) as context:
+            response = view(request)
+            response.render()
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assert_constant_queries(self, url_name, params=None):
+        self.create_rows(2)
+        expected = self.count_render_queries(url_name, params)
+        self.create_rows(20)
+        self.assertEqual(self.count_render_queries(url_name, params), expected)
+
+    def test_book_list_queries(self):
+        """Test the queries of the book list do not depend on the amount of rows"""
+        self.assert_constant_queries('core:books')
+
+    def test_book_loan_list_queries(self):
+        """Test the queries of the book loan list do not depend on the amount of rows"""
+        self.assert_constant_queries('core:book_loans')
+
+    def test_author_list_queries(self):
+        """Test the queries of the author list do not depend on the amount of rows"""
+        self.assert_constant_queries('core:authors')
+
+
+@override_settings(LIST_RESPONSE_CACHE_TIMEOUT=0)
+class ListCountTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.superadmin = User.objects.create(email='superadmin@gmail.com', first_name='superadmin',
+                                              last_name='superadmin', is_active=True, is_superuser=True)
+        for i in range(5):
+            Book.objects.create(title="book{}".format(i), quantity=5, in_stock=5)
+
+    def render(self, url_name, params=None):
+        url = reverse(url_name)
+        request = self.factory.get(url, params or {})
+        request.COOKIES = dict()
+        request.user = self.superadmin
+        with CaptureQueriesContext(connection) as context:
+            response = resolve(url).func(request)
+            response.render()
+        counts = [query for query in context.captured_queries if 'COUNT' in query['sql']]
+        return response.context_data['table'].paginator, len(counts)
+
+    def test_count_cached(self):
+        """Test the list count runs once and is cached per filters"""
+        paginator, counts = self.render('core:books')
+        self.assertEqual((paginator.count, counts), (5, 1))
+        paginator, counts = self.render('core:books')
+        self.assertEqual((paginator.count, counts), (5, 0))
+        paginator, counts = self.render('core:books', {'search': 'book1'})
+        self.assertEqual((paginator.count, counts), (1, 1))
+
+    def test_count_invalidated(self):
+        """Test the cached count changes when the data changes, with or without signals"""
+        self.render('core:books')
+        Book.objects.create(title="book5", quantity=5, in_stock=5)
+        paginator, counts = self.render('core:books')
+        self.assertEqual((paginator.count, counts), (6, 1))
+
+        customer = Customer.objects.create(document_number="654654", first_name="customer",
+                                           last_name="last", email="customer@gmail.com")
+        book_loan = BookLoan.objects.create(customer=customer, end_date="2022-10-10")
+        book_loan.books.add(Book.objects.first())
+        paginator, _ = self.render('core:book_loans', {'status': 'in_time'})
+        self.assertEqual(paginator.count, 1)
+        self.assertTrue(return_book_loan(book_loan))
+        paginator, _ = self.render('core:book_loans', {'status': 'in_time'})
+        self.assertEqual(paginator.count, 0)
+
+    @override_settings(LIST_COUNT_ESTIMATE_THRESHOLD=3)
+    def test_count_estimate(self):
+        """Test the count above the threshold is the database estimate, exact without estimate or with filters"""
+        paginator, _ = self.render('core:books')
+        self.assertEqual((paginator.count, paginator.is_estimate), (5, False))
+
+        cache.clear()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+            cursor.execute("UPDATE sqlite_stat1 SET stat = '50' || substr(stat, instr(stat, ' ')) WHERE tbl = %s",
+                           [Book._meta.db_table])
+        paginator, _ = self.render('core:books')
+        self.assertEqual((paginator.count, paginator.is_estimate), (50, True))
+        paginator, _ = self.render('core:books', {'search': 'book1'})
+        self.assertEqual((paginator.count, paginator.is_estimate), (1, False))
+
+
+class ListResponseCacheTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.superadmin = User.objects.create(email='superadmin@gmail.com', first_name='superadmin',
+                                              last_name='superadmin', is_active=True, is_superuser=True)
+        self.book = Book.objects.create(title="book1", quantity=5, in_stock=5)
+
+    def render(self, url_name, params=None, user=None, cookies=None):
+        url = reverse(url_name)
+        request = self.factory.get(url, params or {})
+        request.COOKIES = cookies or {}
+        request.user = user or self.superadmin
+        response = resolve(url).func(request)
+        if hasattr(response, 'render'):
+            response.render()
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_cached_response(self):
+        """Test a repeated list is served from the cache without queries"""
+        content = self.render('core:books', {'search': 'book'}).content
+        with self.assertNumQueries(0):
+            response = self.render('core:books', {'search': ' book'})
+        self.assertEqual(response.content, content)
+
+    def test_cached_response_params(self):
+        """Test the pages, sorts and users with other permissions get their own response"""
+        self.render('core:books')
+        with CaptureQueriesContext(connection) as context:
+            self.render('core:books', {'sort': 'title'})
+        self.assertTrue(context.captured_queries)
+
+        user = User.objects.create(email='user@gmail.com', first_name='user', last_name='user', is_active=True)
+        user.user_permissions.add(Permission.objects.get(codename='view_book'))
+        self.render('core:books', user=User.objects.get(pk=user.pk))
+        user = User.objects.get(pk=user.pk)
+        with self.assertNumQueries(0):
+            self.render('core:books', user=user)
+
+    def test_cached_response_invalidated(self):
+        """Test the cached list is rendered again after the data changes, with or without signals"""
+        self.render('core:books')
+        update_stock(Book.objects.filter(pk=self.book.pk), less=True)
+        response = self.render('core:books')
+        self.assertIn('<td >4</td>', response.content.decode().replace('"', ''))
+
+    def test_cached_response_csrf(self):
+        """Test the lists with csrf tokens are only cached per csrf cookie"""
+        customer = Customer.objects.create(document_number="654654", first_name="customer",
+                                           last_name="last", email="customer@gmail.com")
+        checkout_book_loan(BookLoan(customer=customer, end_date="2022-10-10"), [self.book])
+        self.render('core:book_loans')
+        with CaptureQueriesContext(connection) as context:
+            self.render('core:book_loans')
+        self.assertTrue(context.captured_queries)
+
+        cookies = {settings.CSRF_COOKIE_NAME: 'a' * 32}
+        self.render('core:book_loans', cookies=cookies)
+        with self.assertNumQueries(0):
+            self.render('core:book_loans', cookies=cookies)
+
+
+class ExportTestCase(TestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.superadmin = User.objects.create(email='superadmin@gmail.com', first_name='superadmin',
+                                              last_name='superadmin', is_active=True, is_superuser=True)
+        self.customer = Customer.objects.create(document_number="654654", first_name="customer",
+                                                last_name="last", email="customer@gmail.com")
+        for i in range(5):
+            book = Book.objects.create(title="book{}".format(i), quantity=5, in_stock=5)
+            book.author.add(Author.objects.create(full_name="author{}".format(i)))
+            book_loan = BookLoan.objects.create(customer=self.customer, end_date="2022-10-10")
+            book_loan.books.add(book)
+
+    def export(self, url_name, export_format, params=None):
+        url = reverse(url_name, args=[export_format])
+        request = self.factory.get(url, params or {})
+        request.user = self.superadmin
+        match = resolve(url)
+        response = match.func(request, **match.kwargs)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode("utf-8")
+
+    def test_export_books_csv(self):
+        """Test the books export applies the filters and includes the authors"""
+        content = self.export('core:books_export', 'csv', {'search': 'book3'})
+        lines = content.splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith('book3,author3,5,5,'))
+
+    def test_export_book_loans_ndjson(self):
+        """Test the book loans export writes one json object per loan"""
+        BookLoan.objects.filter(books__title='book0').update(status='returned')
+        content = self.export('core:book_loans_export', 'ndjson', {'status': 'in_time'})
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[0]['document_number'], '654654')
+        self.assertEqual(sorted(row['books'] for row in rows), ['book1', 'book2', 'book3', 'book4'])
+
+    def test_export_queries_per_chunk(self):
+        """Test the relations are prefetched per chunk"""
+        with mock.patch.object(BookLoanExportView, 'chunk_size', 2):
+            with CaptureQueriesContext(connection) as context:
+                self.export('core:book_loans_export', 'csv')
+        # The loans query plus a books query for each of the 3 chunks
+        self.assertEqual(len(context.captured_queries), 4)
+
+    def test_export_invalid_format(self):
+        """Test an unknown export format returns not found"""
+        request = self.factory.get(reverse('core:books_export', args=['xml']))
+        request.user = self.superadmin
+        with self.assertRaises(Http404):
+            BookExportView.as_view()(request, export_format='xml')
+
+    def test_export_login_required(self):
+        """Test the export redirects the anonymous users"""
+        request = self.factory.get(reverse('core:books_export', args=['csv']))
+        request.user = AnonymousUser()
+        response = BookExportView.as_view()(request, export_format='csv')
+        self.assertEqual(response.status_code, 302)
+
+
+class BookApiTestCase(TestCase):
+
+    def setUp(self):
+        self.superadmin = User.objects.create(email='superadmin@gmail.com', first_name='superadmin',
+                                              last_name='superadmin', is_active=True, is_superuser=True)
+
+    def create_books(self, amount):
+        start = Book.objects.count()
+        for i in range(start, start + amount):
+            book = Book.objects.create(title="book{}".format(i), quantity=5, in_stock=5)
+            book.author.add(Author.objects.create(full_name="author{}".format(i)))
+
+    def get_list(self, params=None):
+        request = APIRequestFactory().get(reverse('books-list'), params or {'length': 100})
+        force_authenticate(request, user=self.superadmin)
+        return BookViewSet.as_view({'get': 'list'})(request)
+
+    def test_list_authors(self):
+        """Test api list books with the authors names"""
+        self.create_books(1)
+        response = self.get_list()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['author'], [{'full_name': 'author0'}])
+
+    def test_list_queries(self):
+        """Test the queries of the api list do not depend on the amount of books"""
+        self.create_books(2)
+        with CaptureQueriesContext(connection) as context:
+            self.get_list()
+        expected = len(context.captured_queries)
+
+        self.create_books(20)
+        with self.assertNumQueries(expected):
+            response = self.get_list()
+        self.assertEqual(len(response.data['results']), 22)
+
+    def test_list_conditional_get(self):
+        """Test the list is answered with 304 while the books do not change"""
+        self.create_books(2)
+        response = self.get_list()
+        etag = response['ETag']
+        self.assertTrue(response['Last-Modified'])
+
+        request = APIRequestFactory().get(reverse('books-list'), {'length': 100, '_': '123'}, HTTP_IF_NONE_MATCH=etag)
+        force_authenticate(request, user=self.superadmin)
+        response = BookViewSet.as_view({'get': 'list'})(request)
+        self.assertEqual(response.status_code, 304)
+
+        update_stock(Book.objects.filter(title='book0'), less=True)
+        request = APIRequestFactory().get(reverse('books-list'), {'length': 100}, HTTP_IF_NONE_MATCH=etag)
+        force_authenticate(request, user=self.superadmin)
+        response = BookViewSet.as_view({'get': 'list'})(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_conditional_get_modified_since(self):
+        """Test If-Modified-Since only answers 304 for changes before its second and the ETag takes precedence"""
+        self.create_books(1)
+        version_time = 1665400000.5
+
+        def get(**headers):
+            request = APIRequestFactory().get(reverse('books-list'), {'length': 100}, **headers)
+            force_authenticate(request, user=self.superadmin)
+            with mock.patch('utils.api.mixins.get_data_version_time', return_value=version_time):
+                return BookViewSet.as_view({'get': 'list'})(request)
+
+        response = get()
+        last_modified, etag = response['Last-Modified'], response['ETag']
+        # A change in the same second as the cached response
+        self.assertEqual(get(HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+        self.assertEqual(get(HTTP_IF_MODIFIED_SINCE=http_date(version_time + 1)).status_code, 304)
+        self.assertEqual(get(HTTP_IF_MODIFIED_SINCE=http_date(version_time + 1),
+                             HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+        self.assertEqual(get(HTTP_IF_MODIFIED_SINCE=last_modified, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_list_conditional_get_datatables(self):
+        """Test the datatables responses have their own validator"""
+        self.create_books(1)
+        etag = self.get_list()['ETag']
+        response = self.get_list({'format': 'datatables', 'draw': 1, 'start': 0, 'length': 10})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        request = APIRequestFactory().get(reverse('books-list'), {'format': 'datatables', 'draw': 1, 'start': 0,
+                                                                  'length': 10}, HTTP_IF_NONE_MATCH=response['ETag'])
+        force_authenticate(request, user=self.superadmin)
+        self.assertEqual(BookViewSet.as_view({'get': 'list'})(request).status_code, 304)
+
+    def get_cursor_pages(self, url):
+        request = APIRequestFactory().get(url)
+        force_authenticate(request, user=self.superadmin)
+        return BookViewSet.as_view({'get': 'list'})(request)
+
+    def test_list_cursor_pagination(self):
+        """Test the keyset pagination walks all the books forward and backward without repeating them"""
+        self.create_books(7)
+        # Books created in the same instant are ordered by id
+        Book.objects.filter(title__in=['book2', 'book3', 'book4']).update(created_at=Book.objects.get(
+            title='book2').created_at)
+        expected = list(Book.objects.order_by('-created_at', '-id').values_list('title', flat=True))
+
+        response = self.get_list({'cursor': '', 'length': 3})
+        self.assertIsNone(response.data['count'])
+        self.assertIsNone(response.data['previous'])
+        titles = [book['title'] for book in response.data['results']]
+        pages = [list(titles)]
+        while response.data['next']:
+            response = self.get_cursor_pages(response.data['next'])
+            titles += [book['title'] for book in response.data['results']]
+            pages.append([book['title'] for book in response.data['results']])
+        self.assertEqual(titles, expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+
+        response = self.get_cursor_pages(response.data['previous'])
+        self.assertEqual([book['title'] for book in response.data['results']], pages[1])
+        response = self.get_cursor_pages(response.data['previous'])
+        self.assertEqual([book['title'] for book in response.data['results']], pages[0])
+        self.assertIsNone(response.data['previous'])
+
+    def test_list_cursor_pagination_count(self):
+        """Test the count of the keyset pagination is only calculated on demand and cached"""
+        self.create_books(3)
+        cache.clear()
+        response = self.get_list({'cursor': '', 'length': 2, 'count': 'true'})
+        self.assertEqual(response.data['count'], 3)
+        with CaptureQueriesContext(connection) as context:
+            response = self.get_list({'cursor': '', 'length': 2, 'count': 'true'})
+        self.assertEqual(response.data['count'], 3)
+        self.assertFalse([query for query in context.captured_queries if 'COUNT' in query['sql']])
+
+        self.create_books(1)
+        response = self.get_list({'cursor': '', 'length': 2, 'count': 'true'})
+        self.assertEqual(response.data['count'], 4)
+
+    def test_list_cursor_pagination_search(self):
+        """Test a search with the cursor keeps the relevance ordering with page numbers"""
+        Book.objects.create(title="python", quantity=5, in_stock=5)
+        Book.objects.create(title="python python python", quantity=5, in_stock=5)
+        Book.objects.create(title="other", quantity=5, in_stock=5)
+        expected = [book.title for book in search_books(Book.objects.all(), "python")]
+
+        response = self.get_list({'cursor': '', 'search': 'python'})
+        self.assertEqual(response.data['page'], 1)
+        self.assertEqual([book['title'] for book in response.data['results']], expected)
+
+    def test_list_cursor_pagination_ordering(self):
+        """Test another ordering with the cursor keeps the requested order with page numbers"""
+        self.create_books(3)
+        Book.objects.filter(title="book1").update(total_loans=5)
+        response = self.get_list({'cursor': '', 'ordering': '-total_loans'})
+        self.assertEqual(response.data['page'], 1)
+        self.assertEqual(response.data['results'][0]['title'], "book1")
+
+        response = self.get_list({'cursor': '', 'ordering': '-created_at'})
+        self.assertNotIn('page', response.data)
+
+    def test_cursor_pagination_models(self):
+        """Test only the models with the keyset index are paginated by cursor"""
+        self.assertTrue(CustomDatatablesCursorPagination.has_keyset_index(Book))
+        self.assertTrue(CustomDatatablesCursorPagination.has_keyset_index(BookHold))
+        self.assertFalse(CustomDatatablesCursorPagination.has_keyset_index(BookLoan))
+
+    def test_list_cursor_pagination_invalid(self):
+        """Test an invalid cursor returns not found"""
+        response = self.get_list({'cursor': 'invalid'})
+        self.assertEqual(response.status_code, 404)
+
+
+class OverdueSweepTestCase(TestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(document_number="654654", first_name="customer",
+                                                last_name="last", email="customer@gmail.com")
+        self.overdue = BookLoan.objects.create(customer=self.customer, end_date="2022-10-10")
+        self.in_time = BookLoan.objects.create(customer=self.customer, end_date="2022-10-20")
+
+    def sweep(self, day, **kwargs):
+        current = datetime.datetime(2022, 10, day, 12, tzinfo=pytz.UTC)
+        with mock.patch('core.utils.get_current_date', side_effect=lambda use_time=False: (
+                current if use_time else current.date())):
+            return sweep_overdue_loans(**kwargs)
+
+    def test_sweep_overdue_loans(self):
+        """Test the sweep changes the status of the overdue loans only"""
+        self.assertEqual(self.sweep(15, interval=0), 1)
+        self.overdue.refresh_from_db()
+        self.in_time.refresh_from_db()
+        self.assertEqual(self.overdue.status, 'past')
+        self.assertEqual(self.in_time.status, 'in_time')
+        self.assertIsNotNone(OverdueSweep.objects.get().last_run_at)
+
+    def test_sweep_interval(self):
+        """Test the sweep runs at most once per interval"""
+        self.assertEqual(self.sweep(15, interval=3600), 1)
+        self.assertIsNone(self.sweep(15, interval=3600))
+        self.assertEqual(self.sweep(25, interval=3600), 1)
+        self.in_time.refresh_from_db()
+        self.assertEqual(self.in_time.status, 'past')
+
+    def test_sweep_reopened_loans(self):
+        """Test the loans that get a past delivery date after a sweep are swept on the next run"""
+        self.sweep(15, interval=0)
+        # Reopened, edited to an earlier date and checked out with a past date
+        BookLoan.objects.filter(pk=self.overdue.pk).update(status='in_time')
+        BookLoan.objects.filter(pk=self.in_time.pk).update(end_date="2022-10-01")
+        created = BookLoan.objects.create(customer=self.customer, end_date="2022-10-05")
+        self.assertEqual(self.sweep(16, interval=0), 3)
+        self.assertIsNone(self.sweep(16, interval=3600))
+        self.assertEqual(self.sweep(16, force=True), 0)
+        self.assertFalse(BookLoan.objects.filter(pk=created.pk, status='in_time').exists())
+
+    def test_list_does_not_sweep(self):
+        """Test the book loan list does not change the status of the loans"""
+        superadmin = User.objects.create(email='superadmin@gmail.com', first_name='superadmin',
+                                         last_name='superadmin', is_active=True, is_superuser=True)
+        url = reverse('core:book_loans')
+        request = RequestFactory().get(url)
+        request.COOKIES = dict()
+        request.user = superadmin
+        resolve(url).func(request).render()
+
+        self.overdue.refresh_from_db()
+        self.assertEqual(self.overdue.status, 'in_time')
+
+    def test_command(self):
+        """Test the sweep command"""
+        out = StringIO()
+        call_command("sweep_overdue_loans", "--force", stdout=out)
+        self.assertIn("Updated 2 loans.", out.getvalue())
+
+    def test_loop(self):
+        """Test the sweeper loop sweeps until it is stopped"""
+        stopped = threading.Event()
+        stopped.set()
+        with mock.patch('core.utils.sweep_overdue_loans') as sweep, mock.patch('core.utils.connections'):
+            run_overdue_sweeper(interval=0, stopped=stopped)
+        sweep.assert_called_once_with(0)
+
+
+class BooksOnLoanTestCase(TestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.superadmin = User.objects.create(email='superadmin@gmail.com', first_name='superadmin',
+                                              last_name='superadmin', is_active=True, is_superuser=True)
+        self.customer = Customer.objects.create(document_number="654654", first_name="customer",
+                                                last_name="last", email="customer@gmail.com")
+        self.books = [Book.objects.create(title="book{}".format(i), quantity=5, in_stock=5) for i in range(4)]
+
+    def post(self, url, data=None, **kwargs):
+        request = self.factory.post(url, data or {})
+        request.COOKIES = dict()
+        middleware = SessionMiddleware(request)
+        middleware.process_request(request)
+        request.session.save()
+        request.user = self.superadmin
+        setattr(request, '_messages', FallbackStorage(request))
+        return resolve(url).func(request, **kwargs)
+
+    def create_loan(self, books):
+        return self.post(reverse('core:book_loan_create'), {
+            'customer': self.customer.pk,
+            'status': 'in_time',
+            'books': [book.pk for book in books],
+            'end_date': '2022-10-15'
+        })
+
+    def test_counter_create_and_return(self):
+        """Test the counter follows the loan create, update and approve delivery"""
+        self.assertEqual(self.create_loan(self.books[:2]).status_code, 302)
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.books_on_loan, 2)
+
+        book_loan = BookLoan.objects.get()
+        url = reverse('core:book_loan_update', kwargs={'pk': book_loan.pk})
+        self.post(url, {'status': 'returned', 'end_date': '2022-10-15'}, pk=book_loan.pk)
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.books_on_loan, 0)
+
+        self.post(url, {'status': 'in_time', 'end_date': '2022-10-15'}, pk=book_loan.pk)
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.books_on_loan, 2)
+
+        url = reverse('core:approved_delivery', kwargs={'book_loan_id': book_loan.pk})
+        self.post(url, book_loan_id=book_loan.pk)
+        self.post(url, book_loan_id=book_loan.pk)
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.books_on_loan, 0)
+
+    def test_counter_limit(self):
+        """Test the loan limit is checked with the counter"""
+        self.create_loan(self.books[:2])
+        self.assertEqual(self.create_loan(self.books[2:]).status_code, 200)
+        self.assertEqual(self.create_loan(self.books[2:3]).status_code, 302)
+        self.assertEqual(self.create_loan(self.books[3:]).status_code, 200)
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.books_on_loan, 3)
+        self.assertFalse(self.customer.has_book_loan())
+
+    def test_counter_limit_after_validation(self):
+        """Test a checkout that passed the form after another checkout took the quota fails and saves nothing"""
+        form_kwargs = {'data': {'customer': self.customer.pk, 'status': 'in_time',
+                                'books': [book.pk for book in self.books[:2]], 'end_date': '2022-10-15'},
+                       'files': {}, 'initial': {}, 'prefix': None, 'instance': None, 'books_qs': Book.objects.all()}
+        # A concurrent checkout commits between the validation and the checkout
+        Customer.objects.filter(pk=self.customer.pk).update(books_on_loan=2)
+        with mock.patch.object(BookLoanForm, 'clean', lambda form: form.cleaned_data), \
+                mock.patch.object(BookLoanCreateView, 'get_form_kwargs', return_value=form_kwargs):
+            response = self.create_loan(self.books[:2])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("limite", str(response.context_data['form'].errors['customer']))
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.books_on_loan, 2)
+        self.assertFalse(BookLoan.objects.exists())
+        self.assertEqual(Book.objects.get(pk=self.books[0].pk).in_stock, 5)
+
+        with self.assertRaises(LoanLimitError):
+            checkout_book_loan(BookLoan(customer=self.customer, end_date="2022-10-15"), self.books[:2])
+        checkout_book_loan(BookLoan(customer=self.customer, end_date="2022-10-15"), self.books[:1])
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.books_on_loan, 3)
+
+    def test_reconcile(self):
+        """Test the reconcile command fixes the counter from the active loans"""
+        book_loan = BookLoan.objects.create(customer=self.customer, end_date="2022-10-10")
+        book_loan.books.add(*self.books[:2])
+        BookLoan.objects.create(customer=self.customer, end_date="2022-10-10",
+                                status='returned').books.add(self.books[2])
+        other = Customer.objects.create(document_number="111", first_name="other", last_name="last",
+                                        email="other@gmail.com", books_on_loan=2)
+
+        out = StringIO()
+        call_command("reconcile_books_on_loan", stdout=out)
+        self.assertIn("Fixed 2 clients and 3 books.", out.getvalue())
+        self.customer.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.customer.books_on_loan, 2)
+        self.assertEqual(other.books_on_loan, 0)
+
+
+class StockReservationTestCase(TestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(document_number="654654", first_name="customer",
+                                                last_name="last", email="customer@gmail.com")
+        self.book = Book.objects.create(title="book1", quantity=1, in_stock=1)
+        self.other = Book.objects.create(title="book2", quantity=1, in_stock=1)
+
+    def test_reserve_reports_failed_books(self):
+        """Test the checkout reports the books without stock and saves nothing"""
+        Book.objects.filter(pk=self.other.pk).update(in_stock=0)
+        book_loan = BookLoan(customer=self.customer, end_date="2022-10-10")
+
+        with self.assertRaises(OutOfStockError) as error:
+            checkout_book_loan(book_loan, [self.book, self.other])
+
+        self.assertEqual(error.exception.books, [self.other])
+        self.book.refresh_from_db()
+        self.customer.refresh_from_db()
+        self.assertEqual(self.book.in_stock, 1)
+        self.assertEqual(self.customer.books_on_loan, 0)
+        self.assertFalse(BookLoan.objects.exists())
+
+    def test_create_view_out_of_stock(self):
+        """Test the create view shows an error when the stock runs out after the form was built"""
+        url = reverse('core:book_loan_create')
+        request = RequestFactory().post(url, {
+            'customer': self.customer.pk, 'status': 'in_time', 'books': [self.book.pk], 'end_date': '2022-10-15'
+        })
+        request.user = User.objects.create(email='superadmin@gmail.com', is_active=True, is_superuser=True)
+        Book.objects.filter(pk=self.book.pk).update(in_stock=0)
+        form_kwargs = {'data': request.POST, 'files': request.FILES, 'initial': {}, 'prefix': None,
+                       'instance': None, 'books_qs': Book.objects.all()}
+        with mock.patch.object(BookLoanCreateView, 'get_form_kwargs', return_value=form_kwargs):
+            response = resolve(url).func(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("book1", str(response.context_data['form'].errors['books']))
+        self.assertFalse(BookLoan.objects.exists())
+
+
+class StockReservationConcurrencyTestCase(TransactionTestCase):
+
+    def test_concurrent_checkouts(self):
+        """Test concurrent checkouts never lend more copies than available"""
+        book = Book.objects.create(title="book1", quantity=3, in_stock=3)
+        customers = [
+            Customer.objects.create(document_number="doc{}".format(i), first_name="customer{}".format(i),
+                                    last_name="last", email="customer{}@gmail.com".format(i))
+            for i in range(12)
+        ]
+        results = []
+
+        def checkout(customer):
+            try:
+                for _ in range(200):
+                    try:
+                        checkout_book_loan(BookLoan(customer=customer, end_date="2022-10-10"), [book])
+                        results.append(True)
+                        return
+                    except OutOfStockError:
+                        results.append(False)
+                        return
+                    except OperationalError:
+                        # SQLite raises instead of waiting when another thread holds the write lock
+                        time.sleep(0.01)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout, args=(customer,)) for customer in customers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        book.refresh_from_db()
+        self.assertEqual(len(results), len(customers))
+        self.assertEqual(results.count(True), 3)
+        self.assertEqual(book.in_stock, 0)
+        self.assertTrue(0 <= book.in_stock <= book.quantity)
+        self.assertEqual(BookLoan.objects.count(), 3)
+
+
+class BookLoanTransitionTestCase(TestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(document_number="654654", first_name="customer",
+                                                last_name="last", email="customer@gmail.com")
+        self.book = Book.objects.create(title="book1", quantity=2, in_stock=2)
+        self.book_loan = checkout_book_loan(BookLoan(customer=self.customer, end_date="2022-10-10"), [self.book])
+
+    def assert_stock(self, in_stock, books_on_loan):
+        self.book.refresh_from_db()
+        self.customer.refresh_from_db()
+        self.assertEqual(self.book.in_stock, in_stock)
+        self.assertEqual(self.customer.books_on_loan, books_on_loan)
+
+    def test_return_is_idempotent(self):
+        """Test returning a loan twice only gives back the books once"""
+        stale = BookLoan.objects.get(pk=self.book_loan.pk)
+        self.assertTrue(return_book_loan(self.book_loan))
+        self.assertFalse(return_book_loan(self.book_loan))
+        self.assertFalse(return_book_loan(stale))
+        self.assert_stock(2, 0)
+
+    def test_return_past_loan(self):
+        """Test an overdue loan can be returned"""
+        BookLoan.objects.filter(pk=self.book_loan.pk).update(status='past')
+        self.assertTrue(return_book_loan(BookLoan.objects.get(pk=self.book_loan.pk)))
+        self.assert_stock(2, 0)
+
+    def test_stale_update(self):
+        """Test a transition loaded before a concurrent change is not applied"""
+        stale = BookLoan.objects.get(pk=self.book_loan.pk)
+        self.assertTrue(return_book_loan(self.book_loan))
+        self.assertTrue(change_book_loan_status(self.book_loan, 'in_time'))
+        self.assert_stock(1, 1)
+
+        stale.status = 'returned'
+        self.assertTrue(change_book_loan_status(stale, 'returned'))
+        self.assertFalse(change_book_loan_status(BookLoan.objects.get(pk=self.book_loan.pk), 'returned',
+                                                 expected_status='in_time'))
+        self.assert_stock(2, 0)
+
+    def test_reopen_without_stock(self):
+        """Test a returned loan is not reopened without copies available"""
+        return_book_loan(self.book_loan)
+        Book.objects.filter(pk=self.book.pk).update(in_stock=0)
+
+        with self.assertRaises(OutOfStockError):
+            change_book_loan_status(self.book_loan, 'in_time')
+        self.book_loan.refresh_from_db()
+        self.assertEqual(self.book_loan.status, 'returned')
+
+    def test_reopen_at_limit(self):
+        """Test a returned loan is not reopened when the customer reached the limit"""
+        return_book_loan(self.book_loan)
+        Customer.objects.filter(pk=self.customer.pk).update(books_on_loan=Customer.MAX_BOOKS_ON_LOAN)
+
+        with self.assertRaises(LoanLimitError):
+            change_book_loan_status(self.book_loan, 'in_time')
+        superadmin = User.objects.create(email='superadmin@gmail.com', is_active=True, is_superuser=True)
+        self.client.force_login(superadmin)
+        response = self.client.post(reverse('core:book_loan_update', kwargs={'pk': self.book_loan.pk}),
+                                    {'status': 'in_time', 'end_date': '2022-10-10'})
+        self.assertIn("limite", str(response.context['form'].non_field_errors()))
+        self.book_loan.refresh_from_db()
+        self.assertEqual(self.book_loan.status, 'returned')
+        self.assert_stock(2, Customer.MAX_BOOKS_ON_LOAN)
+
+    def test_approve_delivery_twice(self):
+        """Test approving the delivery twice only gives back the books once"""
+        superadmin = User.objects.create(email='superadmin@gmail.com', is_active=True, is_superuser=True)
+        url = reverse('core:approved_delivery', kwargs={'book_loan_id': self.book_loan.pk})
+        for _ in range(2):
+            request = RequestFactory().post(url)
+            request.session = {}
+            request.user = superadmin
+            setattr(request, '_messages', FallbackStorage(request))
+            self.assertEqual(resolve(url).func(request, book_loan_id=self.book_loan.pk).status_code, 302)
+        self.assert_stock(2, 0)
+
+
+class BulkCheckoutTestCase(TestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(document_number="654654", first_name="customer",
+                                                last_name="last", email="customer@gmail.com")
+        self.other = Customer.objects.create(document_number="111", first_name="other",
+                                             last_name="last", email="other@gmail.com", books_on_loan=2)
+        self.book = Book.objects.create(title="book1", quantity=2, in_stock=2)
+        self.book2 = Book.objects.create(title="book2", quantity=1, in_stock=1)
+        self.end_date = get_current_date() + datetime.timedelta(days=7)
+
+    def test_bulk_checkout(self):
+        """Test the bulk checkout creates the valid loans and reports the invalid rows"""
+        end_date = self.end_date
+        rows = [
+            {"customer": "654654", "books": [self.book.pk, self.book2.pk], "end_date": end_date},
+            {"customer": "111", "books": [self.book.pk], "end_date": end_date},
+            {"customer": "111", "books": [self.book.pk], "end_date": end_date},
+            {"customer": "654654", "books": [self.book2.pk], "end_date": end_date},
+            {"customer": "999", "books": [self.book.pk], "end_date": end_date},
+            {"customer": "654654", "books": [0], "end_date": end_date},
+        ]
+        # An insert and an update per summary table and the next return date of the books
+        with self.assertNumQueries(8 + 6 + 1):
+            results = bulk_checkout_book_loans(rows)
+
+        self.assertEqual([bool(result["book_loan"]) for result in results], [True, True, False, False, False, False])
+        self.assertIn("limite", results[2]["error"])
+        self.assertIn("book2", results[3]["error"])
+        self.assertEqual(BookLoan.objects.count(), 2)
+        self.assertEqual(list(BookLoan.objects.get(pk=results[0]["book_loan"]).books.order_by("pk")),
+                         [self.book, self.book2])
+        self.book.refresh_from_db()
+        self.book2.refresh_from_db()
+        self.customer.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.book.in_stock, self.book2.in_stock), (0, 0))
+        self.assertEqual((self.customer.books_on_loan, self.other.books_on_loan), (2, 3))
+
+    def test_bulk_checkout_conflict(self):
+        """Test the batch is validated again when the stock changes while it is applied"""
+        rows = [{"customer": "654654", "books": [self.book2.pk], "end_date": self.end_date}]
+        validate = validate_bulk_checkout(rows)
+        Book.objects.filter(pk=self.book2.pk).update(in_stock=0)
+
+        with mock.patch('core.services.validate_bulk_checkout', side_effect=[validate, validate_bulk_checkout(rows)]):
+            results = bulk_checkout_book_loans(rows)
+
+        self.assertIsNone(results[0]["book_loan"])
+        self.assertFalse(BookLoan.objects.exists())
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.books_on_loan, 0)
+
+    def test_command(self):
+        """Test the bulk checkout command reads the loans from a csv file"""
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as file:
+            file.write("customer,books,end_date\n654654,{};{},{}\n111,{},bad\n".format(
+                self.book.pk, self.book2.pk, self.end_date, self.book.pk))
+        out, err = StringIO(), StringIO()
+        call_command("bulk_checkout_book_loans", file.name, stdout=out, stderr=err)
+        os.remove(file.name)
+
+        self.assertIn("Created 1 loans, 1 rows failed", out.getvalue())
+        self.assertIn("Line 3: invalid row.", err.getvalue())
+
+    def test_bulk_checkout_end_date(self):
+        """Test the rows with an invalid or past delivery date are rejected"""
+        yesterday = get_current_date() - datetime.timedelta(days=1)
+        results = bulk_checkout_book_loans([
+            {"customer": "654654", "books": [self.book.pk], "end_date": "bad"},
+            {"customer": "654654", "books": [self.book.pk], "end_date": yesterday},
+            {"customer": "654654", "books": [self.book.pk], "end_date": self.end_date.isoformat()},
+        ])
+
+        self.assertEqual([result["error"] for result in results[:2]],
+                         ["Fecha de entrega inválida.", "La fecha de entrega no puede ser anterior a hoy."])
+        self.assertEqual(BookLoan.objects.get(pk=results[2]["book_loan"]).end_date, self.end_date)
+
+    def test_command_conflict(self):
+        """Test the command fails with an error when a batch keeps conflicting"""
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as file:
+            file.write("customer,books,end_date\n654654,{},{}\n".format(self.book.pk, self.end_date))
+        with mock.patch("core.management.commands.bulk_checkout_book_loans.bulk_checkout_book_loans",
+                        side_effect=BatchConflictError("conflict")):
+            with self.assertRaisesMessage(CommandError, "Lines 2-2: conflict. Created 0 loans"):
+                call_command("bulk_checkout_book_loans", file.name, stdout=StringIO(), stderr=StringIO())
+        os.remove(file.name)
+
+
+class BulkReturnTestCase(TestCase):
+
+    def setUp(self):
+        self.superadmin = User.objects.create(email='superadmin@gmail.com', first_name='superadmin',
+                                              last_name='superadmin', is_active=True, is_superuser=True)
+        self.customer = Customer.objects.create(document_number="654654", first_name="customer",
+                                                last_name="last", email="customer@gmail.com")
+        self.book = Book.objects.create(title="book1", quantity=3, in_stock=3)
+        self.book2 = Book.objects.create(title="book2", quantity=3, in_stock=3)
+        # Returned first, the customer can not have more than 3 books on loan
+        self.returned = checkout_book_loan(BookLoan(customer=self.customer, end_date="2022-10-10"), [self.book2])
+        return_book_loan(self.returned)
+        self.book_loans = [
+            checkout_book_loan(BookLoan(customer=self.customer, end_date="2022-10-10"), books)
+            for books in ([self.book, self.book2], [self.book])
+        ]
+
+    def assert_stock(self, in_stock, in_stock2, books_on_loan):
+        self.book.refresh_from_db()
+        self.book2.refresh_from_db()
+        self.customer.refresh_from_db()
+        self.assertEqual((self.book.in_stock, self.book2.in_stock, self.customer.books_on_loan),
+                         (in_stock, in_stock2, books_on_loan))
+
+    def test_bulk_return(self):
+        """Test the bulk return gives back the books once and reports the returned loans"""
+        self.assert_stock(1, 2, 3)
+        ids = [book_loan.pk for book_loan in self.book_loans] + [self.returned.pk, 999]
+        # The books per loan, an insert and an update per summary table, the next return date of the books and the
+        # books with holds
+        with self.assertNumQueries(8 + 5 + 1 + 1):
+            result = bulk_return_book_loans(ids)
+
+        self.assertEqual(result, {"returned": [book_loan.pk for book_loan in self.book_loans],
+                                  "already_returned": [self.returned.pk], "not_found": [999]})
+        self.assert_stock(3, 3, 0)
+        self.assertEqual(bulk_return_book_loans(ids)["returned"], [])
+        self.assert_stock(3, 3, 0)
+
+    def test_api_bulk_return(self):
+        """Test the api bulk return"""
+        request = APIRequestFactory().post(reverse('book_loans-bulk-return'),
+                                           {'ids': [self.book_loans[0].pk, self.returned.pk]}, format='json')
+        force_authenticate(request, user=self.superadmin)
+        response = BookLoanViewSet.as_view({'post': 'bulk_return'})(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['returned'], [self.book_loans[0].pk])
+        self.assertEqual(response.data['already_returned'], [self.returned.pk])
+        self.assert_stock(2, 3, 1)
+
+    def test_api_bulk_return_permission(self):
+        """Test the api bulk return requires the change permission of the loans"""
+        user = User.objects.create(email='user@gmail.com', first_name='user', last_name='user', is_active=True)
+        user.user_permissions.add(Permission.objects.get(codename='add_bookloan'))
+        view = BookLoanViewSet.as_view({'post': 'bulk_return'})
+
+        request = APIRequestFactory().post(reverse('book_loans-bulk-return'), {'ids': [self.book_loans[0].pk]},
+                                           format='json')
+        force_authenticate(request, user=user)
+        self.assertEqual(view(request).status_code, 403)
+        self.assert_stock(1, 2, 3)
+
+        user = User.objects.get(pk=user.pk)
+        user.user_permissions.add(Permission.objects.get(codename='change_bookloan'))
+        request = APIRequestFactory().post(reverse('book_loans-bulk-return'), {'ids': [self.book_loans[0].pk]},
+                                           format='json')
+        force_authenticate(request, user=user)
+        self.assertEqual(view(request).status_code, 200)
+
+    def test_admin_approve_delivery(self):
+        """Test the admin action approves the delivery of the selected loans"""
+        self.client.force_login(self.superadmin)
+        response = self.client.post(reverse('admin:core_bookloan_changelist'), {
+            'action': 'approve_delivery',
+            '_selected_action': [book_loan.pk for book_loan in self.book_loans],
+        })
+
+        self.assertEqual(response.status_code, 302)
+        self.assert_stock(3, 3, 0)
+
+
+class CatalogImportTestCase(TestCase):
+
+    def setUp(self):
+        self.author = Author.objects.create(full_name="Gabriel García Márquez")
+
+    def import_catalog(self, content, suffix, *args):
+        with tempfile.NamedTemporaryFile("w", suffix=suffix, delete=False, encoding="utf-8") as file:
+            file.write(content)
+        out, err = StringIO(), StringIO()
+        call_command("import_catalog", file.name, *args, stdout=out, stderr=err)
+        os.remove(file.name)
+        return out.getvalue(), err.getvalue()
+
+    def test_import_csv(self):
+        """Test the import creates the books and matches the authors by normalized name"""
+        out, err = self.import_catalog(
+            "title,summary,authors,quantity,in_stock\n"
+            "Cien años de soledad,Macondo,gabriel garcia marquez,3,\n"
+            "El otoño del patriarca,,Gabriel GARCIA Márquez;Julio Cortázar,2,1\n"
+            "Rayuela,,julio cortazar,1,1\n"
+            ",,Nadie,1,1\n"
+            "Libro,,Nadie,1,5\n",
+            ".csv", "--batch-size", "2"
+        )
+
+        self.assertIn("Imported 3 books and 1 new authors, 2 rows failed", out)
+        self.assertIn("Line 5: invalid row.", err)
+        self.assertIn("Line 6: invalid row.", err)
+        self.assertEqual(Author.objects.count(), 2)
+        book = Book.objects.get(title="El otoño del patriarca")
+        self.assertEqual((book.quantity, book.in_stock), (2, 1))
+        self.assertEqual(sorted(book.author.values_list("full_name", flat=True)),
+                         ["Gabriel García Márquez", "Julio Cortázar"])
+        self.assertEqual(Book.objects.get(title="Cien años de soledad").in_stock, 3)
+        self.assertEqual(list(self.author.books.order_by("title").values_list("title", flat=True)),
+                         ["Cien años de soledad", "El otoño del patriarca"])
+
+    def test_import_jsonl(self):
+        """Test the import reads jsonl files and indexes the books for the search"""
+        out, _ = self.import_catalog(
+            '{"title": "Rayuela", "authors": ["Julio Cortázar"], "quantity": 2}\n'
+            'not json\n',
+            ".jsonl"
+        )
+
+        self.assertIn("Imported 1 books and 1 new authors, 1 rows failed", out)
+        self.assertEqual([book.title for book in search_books(Book.objects.all(), "cortazar")], ["Rayuela"])
+
+
+class LoanReminderTestCase(TestCase):
+
+    def setUp(self):
+        self.today = datetime.date(2022, 10, 15)
+        self.book = Book.objects.create(title="book", quantity=5, in_stock=5)
+        self.other_book = Book.objects.create(title="another book", quantity=5, in_stock=5)
+        self.customers = [
+            Customer.objects.create(document_number=str(number), first_name="customer", last_name=str(number),
+                                    email="customer{}@gmail.com".format(number))
+            for number in range(4)
+        ]
+        self.overdue = BookLoan.objects.create(customer=self.customers[0], end_date="2022-10-10", status="past")
+        self.overdue.books.set([self.book, self.other_book])
+        self.due_soon = BookLoan.objects.create(customer=self.customers[1], end_date="2022-10-16")
+        self.due_soon.books.set([self.book])
+        # Due later, returned and without email
+        BookLoan.objects.create(customer=self.customers[2], end_date="2022-10-30")
+        BookLoan.objects.create(customer=self.customers[2], end_date="2022-10-10", status="returned")
+        Customer.objects.filter(pk=self.customers[3].pk).update(email=None)
+        BookLoan.objects.create(customer=self.customers[3], end_date="2022-10-10", status="past")
+
+    @override_settings(LOAN_REMINDER_DUE_SOON_TEMPLATE_ID=10, LOAN_REMINDER_OVERDUE_TEMPLATE_ID=20)
+    def test_send_loan_reminders(self):
+        """Test one email is queued per kind with a message version per loan"""
+        result = send_loan_reminders(today=self.today, due_soon_days=2)
+        self.assertEqual(result, {"due_soon": 1, "overdue": 1, "emails": 2})
+
+        overdue_email = OutboxEmail.objects.get(template_id=20)
+        self.assertEqual(overdue_email.data["message_versions"], [{
+            "to": [{"email": "customer0@gmail.com", "name": "customer 0"}],
+            "params": {"name": "customer 0", "end_date": "2022-10-10", "books": ["another book", "book"]},
+        }])
+        due_soon_email = OutboxEmail.objects.get(template_id=10)
+        self.assertEqual(due_soon_email.data["message_versions"][0]["params"]["books"], ["book"])
+        self.assertEqual(LoanReminder.objects.get(book_loan=self.due_soon).outbox_email, due_soon_email)
+
+    def test_incremental(self):
+        """Test a new run only queues the missing reminders"""
+        send_loan_reminders(today=self.today, due_soon_days=2)
+        self.assertEqual(send_loan_reminders(today=self.today, due_soon_days=2),
+                         {"due_soon": 0, "overdue": 0, "emails": 0})
+
+        # The due soon loan becomes overdue and the delivery date of the overdue loan is extended
+        BookLoan.objects.filter(pk=self.due_soon.pk).update(end_date="2022-10-14", status="past")
+        BookLoan.objects.filter(pk=self.overdue.pk).update(end_date="2022-10-17", status="in_time")
+        self.assertEqual(send_loan_reminders(today=self.today, due_soon_days=2),
+                         {"due_soon": 1, "overdue": 1, "emails": 2})
+        self.assertEqual(LoanReminder.objects.count(), 4)
+
+    def test_batches(self):
+        """Test the loans are split in emails of the batch size with a fixed amount of queries"""
+        for number in range(5):
+            BookLoan.objects.create(customer=self.customers[1], end_date="2022-10-01", status="past")
+        # Per batch: the loans, their books and the savepoint, per email: the email, its reminders and the claimed ones
+        with self.assertNumQueries(3 * 4 + 4 * 3 + 1):
+            result = send_loan_reminders(today=self.today, due_soon_days=2, batch_size=3)
+        self.assertEqual(result, {"due_soon": 1, "overdue": 6, "emails": 4})
+
+    def test_overdue_not_swept(self):
+        """Test a loan past its delivery date that is still in time gets the overdue reminder"""
+        BookLoan.objects.filter(pk=self.overdue.pk).update(status="in_time")
+        result = send_loan_reminders(today=self.today, due_soon_days=2)
+        self.assertEqual(result, {"due_soon": 1, "overdue": 1, "emails": 2})
+        self.assertEqual(LoanReminder.objects.get(book_loan=self.overdue).kind, "overdue")
+
+    def test_conflict_per_loan(self):
+        """Test a reminder queued by another run only skips its loan and not the rest of the batch"""
+        other = BookLoan.objects.create(customer=self.customers[2], end_date="2022-10-16")
+        book_loans = list(get_reminder_book_loans(self.today, 2).filter(pk__in=[self.due_soon.pk, other.pk]))
+        # Another run stores the reminder after the loans were read
+        LoanReminder.objects.create(book_loan=self.due_soon, kind="due_soon", end_date=self.due_soon.end_date)
+
+        with transaction.atomic():
+            self.assertEqual(claim_loan_reminders("due_soon", book_loans, 10), [other])
+            self.assertEqual(claim_loan_reminders("due_soon", book_loans[:1], 10), [])
+        email = OutboxEmail.objects.get()
+        self.assertEqual([version["to"][0]["email"] for version in email.data["message_versions"]],
+                         ["customer2@gmail.com"])
+        self.assertEqual(LoanReminder.objects.get(book_loan=other).outbox_email, email)
+
+    def test_command(self):
+        """Test the command shows the queued reminders"""
+        out = StringIO()
+        with mock.patch('core.services.get_current_date', return_value=self.today):
+            call_command("send_loan_reminders", "--days=2", stdout=out)
+        self.assertIn("Queued 1 due soon and 1 overdue reminders in 2 emails", out.getvalue())
+
+
+class LoanStatsTestCase(TestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(document_number="654654", first_name="customer",
+                                                last_name="last", email="customer@gmail.com")
+        self.book = Book.objects.create(title="book1", quantity=4, in_stock=4)
+        self.book2 = Book.objects.create(title="book2", quantity=4, in_stock=4)
+        self.today = timezone.localdate()
+
+    def checkout(self, books, end_date="2022-10-10"):
+        return checkout_book_loan(BookLoan(customer=self.customer, end_date=end_date), books)
+
+    def get_statuses(self):
+        return {row.status: (row.loans, row.books) for row in LoanStatusStats.objects.exclude(loans=0, books=0)}
+
+    def get_summaries(self):
+        daily = list(LoanDailyStats.objects.values("date", "loans", "books_loaned", "returns", "books_returned"))
+        books = list(BookDailyStats.objects.order_by("book", "date").values("book", "date", "loans"))
+        return daily, books, self.get_statuses()
+
+    def test_checkout_and_return(self):
+        """Test the summaries are updated by the loan lifecycle"""
+        book_loan = self.checkout([self.book, self.book2])
+        self.checkout([self.book])
+        daily = LoanDailyStats.objects.get(date=self.today)
+        self.assertEqual((daily.loans, daily.books_loaned), (2, 3))
+        self.assertEqual(BookDailyStats.objects.get(book=self.book, date=self.today).loans, 2)
+        self.assertEqual(self.get_statuses(), {"in_time": (2, 3)})
+
+        return_book_loan(book_loan)
+        daily.refresh_from_db()
+        self.assertEqual((daily.returns, daily.books_returned), (1, 2))
+        self.assertEqual(self.get_statuses(), {"in_time": (1, 1), "returned": (1, 2)})
+
+        book_loan.delete()
+        self.assertEqual(self.get_statuses(), {"in_time": (1, 1)})
+
+    def test_bulk_operations(self):
+        """Test the bulk checkout and return update the summaries"""
+        end_date = (self.today + datetime.timedelta(days=5)).isoformat()
+        results = bulk_checkout_book_loans([{"customer": "654654", "books": [self.book.pk, self.book2.pk],
+                                             "end_date": end_date}])
+        self.assertEqual(self.get_statuses(), {"in_time": (1, 2)})
+        bulk_return_book_loans([results[0]["book_loan"]])
+        self.assertEqual(self.get_statuses(), {"returned": (1, 2)})
+        daily = LoanDailyStats.objects.get(date=self.today)
+        self.assertEqual((daily.loans, daily.books_loaned, daily.returns, daily.books_returned), (1, 2, 1, 2))
+
+    def test_overdue(self):
+        """Test the sweep counts the loans that became overdue"""
+        self.checkout([self.book, self.book2])
+        self.assertEqual(update_status(), 1)
+        self.assertEqual(LoanDailyStats.objects.get(date=self.today).overdue, 1)
+        self.assertEqual(self.get_statuses(), {"past": (1, 2)})
+
+        return_book_loan(BookLoan.objects.get())
+        self.assertEqual(self.get_statuses(), {"returned": (1, 2)})
+
+    def test_rebuild(self):
+        """Test the backfill calculates the same summaries than the incremental updates"""
+        self.checkout([self.book, self.book2], end_date="2099-10-10")
+        return_book_loan(self.checkout([self.book], end_date="2099-10-10"))
+        expected = self.get_summaries()
+
+        out = StringIO()
+        call_command("rebuild_loan_stats", stdout=out)
+        self.assertIn("Created 1 daily, 2 book and 2 status summaries", out.getvalue())
+        self.assertEqual(self.get_summaries(), expected)
+
+    def test_get_loan_stats(self):
+        """Test the dashboard data is read from the summaries"""
+        self.checkout([self.book, self.book2])
+        self.checkout([self.book2])
+        stats = get_loan_stats(days=7)
+        self.assertEqual(len(stats["daily"]), 7)
+        self.assertEqual(stats["daily"][-1]["loans"], 2)
+        self.assertEqual(stats["totals"]["books_loaned"], 3)
+        self.assertEqual([book["title"] for book in stats["top_books"]], ["book2", "book1"])
+        self.assertEqual(stats["stock"], {"on_loan": 3, "copies": 8, "utilisation": 37.5})
+
+    def test_dashboard(self):
+        """Test the dashboard and the api show the statistics"""
+        self.checkout([self.book])
+        user = User.objects.create(email='superadmin@gmail.com', first_name='superadmin',
+                                   last_name='superadmin', is_active=True, is_superuser=True)
+        self.client.force_login(user)
+        response = self.client.get(reverse("core:loan_stats"), {"days": 7})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["stats"]["daily"]), 7)
+        self.assertContains(response, "book1")
+
+        request = APIRequestFactory().get(reverse("loan_stats-list"), {"days": 7, "top": 1})
+        force_authenticate(request, user=user)
+        response = LoanStatsViewSet.as_view({"get": "list"})(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["top_books"], [{"id": self.book.pk, "title": "book1", "loans": 1}])
+
+        request = APIRequestFactory().get(reverse("loan_stats-list"), {"days": 0})
+        force_authenticate(request, user=user)
+        self.assertEqual(LoanStatsViewSet.as_view({"get": "list"})(request).status_code, 400)
+
+    def test_api_permission(self):
+        """Test the statistics api requires the permission to view the loans"""
+        user = User.objects.create(email='user@gmail.com', first_name='user', last_name='user', is_active=True)
+
+        def get():
+            request = APIRequestFactory().get(reverse("loan_stats-list"))
+            force_authenticate(request, user=User.objects.get(pk=user.pk))
+            return LoanStatsViewSet.as_view({"get": "list"})(request)
+
+        self.assertEqual(get().status_code, 403)
+        user.user_permissions.add(Permission.objects.get(codename='view_bookloan'))
+        self.assertEqual(get().status_code, 200)
+
+
+class BookLoanCountersTestCase(TestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(document_number="654654", first_name="customer",
+                                                last_name="last", email="customer@gmail.com")
+        self.books = [Book.objects.create(title="book{}".format(i), quantity=5, in_stock=5) for i in range(3)]
+        self.superadmin = User.objects.create(email='superadmin@gmail.com', first_name='superadmin',
+                                              last_name='superadmin', is_active=True, is_superuser=True)
+
+    def checkout(self, books):
+        return checkout_book_loan(BookLoan(customer=self.customer, end_date="2022-10-10"), books)
+
+    def get_counters(self):
+        return [
+            (book.total_loans, book.active_loans)
+            for book in Book.objects.order_by("pk").only("total_loans", "active_loans")
+        ]
+
+    def test_counters(self):
+        """Test the counters follow the checkout, the return and the reopening of the loans"""
+        book_loan = self.checkout(self.books[:2])
+        self.checkout(self.books[1:2])
+        self.assertEqual(self.get_counters(), [(1, 1), (2, 2), (0, 0)])
+        self.assertEqual(Book.objects.get(pk=self.books[0].pk).last_borrowed_at, book_loan.created_at)
+
+        return_book_loan(book_loan)
+        self.assertEqual(self.get_counters(), [(1, 0), (2, 1), (0, 0)])
+        change_book_loan_status(book_loan, "in_time")
+        self.assertEqual(self.get_counters(), [(1, 1), (2, 2), (0, 0)])
+
+    def test_bulk_counters(self):
+        """Test the bulk checkout and return update the counters in their stock queries"""
+        with mock.patch('core.services.get_current_date', return_value=datetime.date(2022, 10, 1)):
+            results = bulk_checkout_book_loans([
+                {"customer": "654654", "books": [self.books[0].pk, self.books[2].pk], "end_date": "2022-10-10"},
+            ])
+        self.assertEqual(self.get_counters(), [(1, 1), (0, 0), (1, 1)])
+        self.assertIsNotNone(Book.objects.get(pk=self.books[2].pk).last_borrowed_at)
+        bulk_return_book_loans([results[0]["book_loan"]])
+        self.assertEqual(self.get_counters(), [(1, 0), (0, 0), (1, 0)])
+
+    def test_edit_keeps_counters(self):
+        """Test a book edit loaded before a checkout does not write back the counters"""
+        author = Author.objects.create(full_name="author")
+        stale = Book.objects.get(pk=self.books[0].pk)
+        book_loan = self.checkout(self.books[:1])
+        self.client.force_login(self.superadmin)
+        with mock.patch.object(BookUpdateView, 'get_object', return_value=stale):
+            response = self.client.post(reverse('core:book_update', kwargs={'pk': stale.pk}),
+                                        {'title': 'edited', 'author': [author.pk], 'quantity': 5, 'in_stock': 4})
+
+        self.assertEqual(response.status_code, 302)
+        book = Book.objects.get(pk=stale.pk)
+        self.assertEqual((book.title, book.total_loans, book.active_loans), ('edited', 1, 1))
+        self.assertEqual(book.last_borrowed_at, book_loan.created_at)
+
+    def test_delete_counters(self):
+        """Test deleting an active loan releases the active loans and keeps the total"""
+        book_loan = self.checkout(self.books[:2])
+        returned = self.checkout(self.books[1:2])
+        return_book_loan(returned)
+        book_loan.delete()
+        returned.delete()
+        self.assertEqual(self.get_counters(), [(1, 0), (2, 0), (0, 0)])
+
+    def test_reconcile(self):
+        """Test the reconcile command fixes the counters from the loans"""
+        self.checkout(self.books[:1])
+        Book.objects.filter(pk=self.books[0].pk).update(total_loans=10, active_loans=0)
+        Book.objects.filter(pk=self.books[1].pk).update(total_loans=3)
+        call_command("reconcile_books_on_loan", stdout=StringIO())
+        self.assertEqual(self.get_counters(), [(1, 1), (0, 0), (0, 0)])
+
+    def test_popularity_ordering(self):
+        """Test the books table and the api are ordered by the counters"""
+        self.checkout(self.books[1:])
+        self.checkout(self.books[1:2])
+        self.client.force_login(self.superadmin)
+        response = self.client.get(reverse('core:books'), {'sort': '-total_loans'})
+        self.assertEqual([book.title for book in response.context['table'].page.object_list.data],
+                         ["book1", "book2", "book0"])
+
+        request = APIRequestFactory().get(reverse('books-list'), {'ordering': '-total_loans,title'})
+        force_authenticate(request, user=self.superadmin)
+        response = BookViewSet.as_view({'get': 'list'})(request)
+        self.assertEqual([book['title'] for book in response.data['results']], ["book1", "book2", "book0"])
+        self.assertEqual(response.data['results'][0]['total_loans'], 2)
+
+
+class NextReturnDateTestCase(TestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(document_number="654654", first_name="customer",
+                                                last_name="last", email="customer@gmail.com")
+        self.books = [Book.objects.create(title="book{}".format(i), quantity=2, in_stock=2) for i in range(2)]
+        self.superadmin = User.objects.create(email='superadmin@gmail.com', first_name='superadmin',
+                                              last_name='superadmin', is_active=True, is_superuser=True)
+
+    def checkout(self, books, end_date):
+        return checkout_book_loan(BookLoan(customer=self.customer, end_date=end_date), books)
+
+    def get_dates(self):
+        return [str(date) if date else None
+                for date in Book.objects.order_by("pk").values_list("next_return_date", flat=True)]
+
+    def test_next_return_date(self):
+        """Test the date is the earliest delivery date of the active loans"""
+        first = self.checkout(self.books, "2022-10-20")
+        second = self.checkout(self.books[:1], "2022-10-10")
+        self.assertEqual(self.get_dates(), ["2022-10-10", "2022-10-20"])
+
+        return_book_loan(second)
+        self.assertEqual(self.get_dates(), ["2022-10-20", "2022-10-20"])
+        return_book_loan(first)
+        self.assertEqual(self.get_dates(), [None, None])
+        change_book_loan_status(second, "in_time")
+        self.assertEqual(self.get_dates(), ["2022-10-10", None])
+
+    def test_edit_end_date(self):
+        """Test editing the delivery date of a loan updates the date of its books"""
+        book_loan = self.checkout(self.books[:1], "2022-10-20")
+        self.client.force_login(self.superadmin)
+        self.client.post(reverse('core:book_loan_update', kwargs={'pk': book_loan.pk}),
+                         {'status': 'in_time', 'end_date': '2022-11-05'})
+        self.assertEqual(self.get_dates(), ["2022-11-05", None])
+
+    def test_edit_book_with_active_loan(self):
+        """Test a book edit loaded before a checkout keeps the date and the counters of the loan"""
+        author = Author.objects.create(full_name="author")
+        stale = Book.objects.get(pk=self.books[0].pk)
+        self.checkout(self.books[:1], "2022-10-20")
+        self.client.force_login(self.superadmin)
+        with mock.patch.object(BookUpdateView, 'get_object', return_value=stale):
+            self.client.post(reverse('core:book_update', kwargs={'pk': stale.pk}),
+                             {'title': 'edited', 'author': [author.pk], 'quantity': 2, 'in_stock': 1})
+
+        self.assertEqual(self.get_dates(), ["2022-10-20", None])
+        book = Book.objects.get(pk=stale.pk)
+        self.assertEqual((book.title, book.total_loans, book.active_loans), ('edited', 1, 1))
+
+    def test_bulk_and_delete(self):
+        """Test the bulk operations and the deleted loans update the date"""
+        with mock.patch('core.services.get_current_date', return_value=datetime.date(2022, 10, 1)):
+            results = bulk_checkout_book_loans([
+                {"customer": "654654", "books": [self.books[1].pk], "end_date": "2022-10-15"},
+            ])
+        self.assertEqual(self.get_dates(), [None, "2022-10-15"])
+        bulk_return_book_loans([results[0]["book_loan"]])
+        self.assertEqual(self.get_dates(), [None, None])
+
+        self.checkout(self.books[:1], "2022-10-20")
+        self.customer.delete()
+        self.assertEqual(self.get_dates(), [None, None])
+
+    def test_table_and_api(self):
+        """Test the date is shown without queries per book"""
+        self.checkout(self.books[:1], "2022-10-20")
+        self.client.force_login(self.superadmin)
+        response = self.client.get(reverse('core:books'))
+        self.assertContains(response, "20/10/2022")
+
+        request = APIRequestFactory().get(reverse('books-list'), {'ordering': 'title'})
+        force_authenticate(request, user=self.superadmin)
+        response = BookViewSet.as_view({'get': 'list'})(request)
+        self.assertEqual(response.data['results'][0]['next_return_date'], "2022-10-20")
+
+
+class BookHoldTestCase(TestCase):
+
+    def setUp(self):
+        self.superadmin = User.objects.create(email='superadmin@gmail.com', first_name='superadmin',
+                                              last_name='superadmin', is_active=True, is_superuser=True)
+        self.customers = [
+            Customer.objects.create(document_number="65465{}".format(i), first_name="customer{}".format(i),
+                                    last_name="last", email="customer{}@gmail.com".format(i))
+            for i in range(3)
+        ]
+        self.book = Book.objects.create(title="book1", quantity=1, in_stock=1)
+        self.book_loan = checkout_book_loan(BookLoan(customer=self.customers[0], end_date="2022-10-10"), [self.book])
+        self.holds = [place_book_hold(self.book, customer) for customer in self.customers[1:]]
+
+    def assert_book(self, in_stock, holds_waiting):
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.in_stock, self.book.holds_waiting), (in_stock, holds_waiting))
+
+    def get_statuses(self):
+        return list(BookHold.objects.order_by("pk").values_list("status", flat=True))
+
+    def test_return_to_queue(self):
+        """Test a returned copy goes to the oldest waiting hold and not to the stock"""
+        self.assert_book(0, 2)
+        self.assertTrue(return_book_loan(self.book_loan))
+
+        self.assert_book(0, 1)
+        self.assertEqual(self.get_statuses(), ["ready", "waiting"])
+        hold = BookHold.objects.get(pk=self.holds[0].pk)
+        self.assertGreater(hold.expires_at, timezone.now() + datetime.timedelta(days=settings.BOOK_HOLD_PICKUP_DAYS - 1))
+        self.assertFalse(Book.objects.filter(in_stock__gt=0).exists())
+
+    def test_update_view_return(self):
+        """Test the copy returned from the edit view goes to the queue"""
+        self.client.force_login(self.superadmin)
+        self.client.post(reverse('core:book_loan_update', kwargs={'pk': self.book_loan.pk}),
+                         {'status': 'returned', 'end_date': '2022-10-10'})
+        self.assert_book(0, 1)
+        self.assertEqual(self.get_statuses(), ["ready", "waiting"])
+
+    def test_bulk_return(self):
+        """Test the bulk return only gives back to the stock the copies without holds"""
+        Book.objects.filter(pk=self.book.pk).update(quantity=3, in_stock=2)
+        other = checkout_book_loan(BookLoan(customer=self.customers[0], end_date="2022-10-10"), [self.book])
+        another = checkout_book_loan(BookLoan(customer=self.customers[0], end_date="2022-10-10"), [self.book])
+        bulk_return_book_loans([self.book_loan.pk, other.pk, another.pk])
+
+        self.assert_book(1, 0)
+        self.assertEqual(self.get_statuses(), ["ready", "ready"])
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.active_loans, 0)
+
+    def test_cancel(self):
+        """Test a cancelled ready hold passes the copy to the next hold, and then to the stock"""
+        return_book_loan(self.book_loan)
+        self.assertTrue(cancel_book_hold(self.holds[0]))
+        self.assertEqual(self.get_statuses(), ["cancelled", "ready"])
+        self.assert_book(0, 0)
+        self.assertFalse(cancel_book_hold(self.holds[0]))
+
+        self.assertTrue(cancel_book_hold(self.holds[1]))
+        self.assert_book(1, 0)
+
+    def test_checkout(self):
+        """Test the loan of a ready hold takes the assigned copy"""
+        with self.assertRaises(BookHoldError):
+            checkout_book_hold(self.holds[0], "2022-10-20")
+        return_book_loan(self.book_loan)
+        book_loan = checkout_book_hold(self.holds[0], "2022-10-20")
+
+        self.assertEqual(list(book_loan.books.all()), [self.book])
+        self.assertEqual(self.get_statuses(), ["fulfilled", "waiting"])
+        self.assertEqual(BookHold.objects.get(pk=self.holds[0].pk).book_loan, book_loan)
+        self.assert_book(0, 1)
+        self.customers[1].refresh_from_db()
+        self.assertEqual(self.customers[1].books_on_loan, 1)
+
+        return_book_loan(book_loan)
+        self.assertEqual(self.get_statuses(), ["fulfilled", "ready"])
+
+    def test_checkout_limit(self):
+        """Test the loan of a hold is rejected when the customer reached the limit and the copy stays assigned"""
+        return_book_loan(self.book_loan)
+        Customer.objects.filter(pk=self.customers[1].pk).update(books_on_loan=Customer.MAX_BOOKS_ON_LOAN)
+        with self.assertRaises(BookHoldError):
+            checkout_book_hold(self.holds[0], "2022-10-20")
+        self.assertEqual(self.get_statuses(), ["ready", "waiting"])
+        self.assertEqual(BookLoan.objects.count(), 1)
+
+    def test_expire(self):
+        """Test the holds not picked up in time expire and their copies go to the next hold"""
+        return_book_loan(self.book_loan)
+        self.assertEqual(expire_book_holds(), 0)
+        BookHold.objects.filter(pk=self.holds[0].pk).update(expires_at=timezone.now() - datetime.timedelta(minutes=1))
+        out = StringIO()
+        call_command("expire_book_holds", stdout=out)
+
+        self.assertIn("Expired 1 holds.", out.getvalue())
+        self.assertEqual(self.get_statuses(), ["expired", "ready"])
+        self.assert_book(0, 0)
+
+    def test_deleted_customer(self):
+        """Test the holds deleted with their customer leave the queue"""
+        self.customers[1].delete()
+        self.assert_book(0, 1)
+        return_book_loan(self.book_loan)
+        self.assertEqual(self.get_statuses(), ["ready"])
+
+    def test_errors(self):
+        """Test a book with stock and a second active hold of the same customer are rejected"""
+        with self.assertRaises(BookHoldError):
+            place_book_hold(self.book, self.customers[1])
+        other = Book.objects.create(title="book2", quantity=1, in_stock=1)
+        with self.assertRaises(BookHoldError):
+            place_book_hold(other, self.customers[1])
+        self.assert_book(0, 2)
+        self.assertEqual(BookHold.objects.count(), 2)
+
+    def test_api(self):
+        """Test the api places the holds and shows their place in the queue"""
+        customer = Customer.objects.create(document_number="999", first_name="customer", last_name="last")
+        request = APIRequestFactory().post(reverse('book_holds-list'),
+                                           {'book': self.book.pk, 'customer': "999"}, format='json')
+        force_authenticate(request, user=self.superadmin)
+        response = BookHoldViewSet.as_view({'post': 'create'})(request)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['status'], response.data['position']), ("waiting", 3))
+
+        request = APIRequestFactory().post(reverse('book_holds-list'),
+                                           {'book': self.book.pk, 'customer': "999"}, format='json')
+        force_authenticate(request, user=self.superadmin)
+        self.assertEqual(BookHoldViewSet.as_view({'post': 'create'})(request).status_code, 400)
+
+        return_book_loan(self.book_loan)
+        request = APIRequestFactory().get(reverse('book_holds-list'), {'book': self.book.pk})
+        force_authenticate(request, user=self.superadmin)
+        # The filtered book, the count, the page and the positions of the page
+        with self.assertNumQueries(4):
+            response = BookHoldViewSet.as_view({'get': 'list'})(request)
+        self.assertEqual([(row['customer'], row['position']) for row in response.data['results']],
+                         [("654651", None), ("654652", 1), ("999", 2)])
+
+        hold = BookHold.objects.get(customer=customer)
+        request = APIRequestFactory().post(reverse('book_holds-cancel', kwargs={'pk': hold.pk}))
+        force_authenticate(request, user=self.superadmin)
+        response = BookHoldViewSet.as_view({'post': 'cancel'})(request, pk=hold.pk)
+        self.assertEqual(response.data['status'], "cancelled")
+        self.assert_book(0, 1)
+
+        request = APIRequestFactory().post(reverse('book_holds-checkout', kwargs={'pk': self.holds[0].pk}),
+                                           {'end_date': '2022-10-20'}, format='json')
+        force_authenticate(request, user=self.superadmin)
+        response = BookHoldViewSet.as_view({'post': 'checkout'})(request, pk=self.holds[0].pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], "fulfilled")
+        self.assertIsNotNone(response.data['book_loan'])
+
+    def test_api_permissions(self):
+        """Test cancelling and checking out a hold require their permissions, not only the add permission"""
+        user = User.objects.create(email='user@gmail.com', first_name='user', last_name='user', is_active=True)
+        user.user_permissions.add(*Permission.objects.filter(codename__in=['add_bookhold', 'view_bookhold']))
+        return_book_loan(self.book_loan)
+
+        def post(user, name, pk, data=None):
+            request = APIRequestFactory().post(reverse('book_holds-' + name, kwargs={'pk': pk}), data or {},
+                                               format='json')
+            force_authenticate(request, user=User.objects.get(pk=user.pk))
+            return BookHoldViewSet.as_view({'post': name})(request, pk=pk)
+
+        self.assertEqual(post(user, 'cancel', self.holds[1].pk).status_code, 403)
+        self.assertEqual(post(user, 'checkout', self.holds[0].pk, {'end_date': '2022-10-20'}).status_code, 403)
+        self.assertEqual(self.get_statuses(), ["ready", "waiting"])
+
+        user.user_permissions.add(*Permission.objects.filter(
+            codename__in=['delete_bookhold', 'change_bookhold', 'add_bookloan']
+        ))
+        self.assertEqual(post(user, 'cancel', self.holds[1].pk).status_code, 200)
+        self.assertEqual(post(user, 'checkout', self.holds[0].pk, {'end_date': '2022-10-20'}).status_code, 200)
+        self.assertEqual(self.get_statuses(), ["fulfilled", "cancelled"])
+
+    def test_edit_keeps_queue(self):
+        """Test a book edit loaded before a hold does not move the sequence back and the sequence is not published"""
+        author = Author.objects.create(full_name="author")
+        stale = Book.objects.get(pk=self.book.pk)
+        customer = Customer.objects.create(document_number="999", first_name="customer", last_name="last")
+        place_book_hold(self.book, customer)
+        self.client.force_login(self.superadmin)
+        with mock.patch.object(BookUpdateView, 'get_object', return_value=stale):
+            self.client.post(reverse('core:book_update', kwargs={'pk': stale.pk}),
+                             {'title': 'edited', 'author': [author.pk], 'quantity': 1, 'in_stock': 0})
+
+        self.assert_book(0, 3)
+        self.assertEqual((self.book.title, self.book.hold_sequence), ('edited', 3))
+        other = Customer.objects.create(document_number="888", first_name="other", last_name="last")
+        self.assertEqual(place_book_hold(self.book, other).sequence, 4)
+
+        Book.objects.filter(pk=self.book.pk).update(in_stock=1)
+        request = APIRequestFactory().get(reverse('books-list'))
+        force_authenticate(request, user=self.superadmin)
+        response = BookViewSet.as_view({'get': 'list'})(request)
+        self.assertEqual(response.data['results'][0]['holds_waiting'], 4)
+        self.assertNotIn('hold_sequence', response.data['results'][0])
+
+    def test_queue_sequence(self):
+        """Test the queue follows the sequence of the book and the positions skip the holds that left it"""
+        self.assertEqual([hold.sequence for hold in self.holds], [1, 2])
+        customer = Customer.objects.create(document_number="999", first_name="customer", last_name="last")
+        last = place_book_hold(self.book, customer)
+        self.assertEqual(last.sequence, 3)
+        cancel_book_hold(self.holds[0])
+
+        holds = set_queue_positions(list(BookHold.objects.order_by("pk")))
+        self.assertEqual([hold.position for hold in holds], [None, 1, 2])
+        return_book_loan(self.book_loan)
+        self.assertEqual(self.get_statuses(), ["cancelled", "ready", "waiting"])
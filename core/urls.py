@@ -2,7 +2,7 @@ from django.urls import path
 
 from core.views import AuthorListView, AuthorCreateView, AuthorUpdateView, AuthorDeleteView, BookListView, \
     BookCreateView, BookUpdateView, BookDeleteView, BookLoanListView, BookLoanCreateView, BookLoanUpdateView, \
-    BookLoanDeleteView, approve_delivery
+    BookLoanDeleteView, approve_delivery, BookExportView, BookLoanExportView, LoanStatsView
 
 app_name = "core"
 
@@ -15,14 +15,17 @@ urlpatterns = [
 
     # Urls for the model Book (Class Based Views)
     path("books", BookListView.as_view(), name="books"),
+    path("books/export/<slug:export_format>", BookExportView.as_view(), name="books_export"),
     path("books/create", BookCreateView.as_view(), name="book_create"),
     path("books/<int:pk>/update", BookUpdateView.as_view(), name="book_update"),
     path("books/<int:pk>/delete", BookDeleteView.as_view(), name="book_delete"),
 
     # Urls for the model BookLoan (Class Based Views)
     path("", BookLoanListView.as_view(), name="book_loans"),
+    path("book_loans/export/<slug:export_format>", BookLoanExportView.as_view(), name="book_loans_export"),
     path("book_loans/create", BookLoanCreateView.as_view(), name="book_loan_create"),
     path("book_loans/<int:pk>/update", BookLoanUpdateView.as_view(), name="book_loan_update"),
     path("book_loans/<int:pk>/delete", BookLoanDeleteView.as_view(), name="book_loan_delete"),
-    path("book_loans/<int:book_loan_id>/approved", approve_delivery, name="approved_delivery")
+    path("book_loans/<int:book_loan_id>/approved", approve_delivery, name="approved_delivery"),
+    path("book_loans/stats", LoanStatsView.as_view(), name="loan_stats"),
 ]
@@ -1,8 +1,22 @@
-from django.db.models import F
+import datetime
+import threading
+from datetime import timedelta
+from logging import getLogger
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Count, F, Max, Min, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
 from django.utils import timezone
 from django.utils.timezone import now
 
-from core.models import BookLoan
+from core.enums import ACTIVE_BOOK_LOAN_STATUSES
+from core.models import Book, BookLoan, OverdueSweep
+from core.reports import record_status_changes
+from customers.models import Customer
+from utils.utils import bump_data_version, get_chunks
+
+logger = getLogger(__name__)
 
 
 def get_current_date(use_time=False):
@@ -22,9 +36,159 @@ def update_stock(books, less=None):
     """Method to update the in_stock field of the books."""
     update_kwargs = {"in_stock": F("in_stock") - 1 if less else F("in_stock") + 1}
     books.all().update(**update_kwargs)
+    bump_data_version(Book)
+
+
+def update_loan_counters(book_ids, loans=0, active=0, borrowed_at=None):
+    """
+    Method to update the loan counters of the books, must run in the loan transaction.
+    :param loans: <int> new loans of every book
+    :param active: <int> change of the active loans of every book, never goes below zero
+    :param borrowed_at: <datetime> date of the new loans
+    """
+    update_kwargs = {}
+    if loans:
+        update_kwargs["total_loans"] = F("total_loans") + loans
+    if active:
+        update_kwargs["active_loans"] = Greatest(F("active_loans") + active, 0)
+    if borrowed_at:
+        update_kwargs["last_borrowed_at"] = borrowed_at
+    if update_kwargs and book_ids:
+        Book.objects.filter(pk__in=book_ids).update(**update_kwargs)
+        bump_data_version(Book)
+
+
+def get_next_return_date():
+    """Returns a subquery with the earliest delivery date of the active loans of the outer book."""
+    return Subquery(BookLoan.books.through.objects.filter(
+        book=OuterRef("pk"), bookloan__status__in=ACTIVE_BOOK_LOAN_STATUSES
+    ).order_by().values("book").annotate(date=Min("bookloan__end_date")).values("date"))
+
+
+def update_next_return_dates(book_ids):
+    """Method to update the next return date of the books, must run in the loan transaction."""
+    for chunk in get_chunks(book_ids):
+        Book.objects.filter(pk__in=chunk).update(next_return_date=get_next_return_date())
+    if book_ids:
+        bump_data_version(Book)
+
+
+def update_books_on_loan(book_loan, less=None):
+    """Method to update the books_on_loan counter of the loan customer, must run in the loan transaction."""
+    amount = book_loan.books.count()
+    # Never go below zero, a counter that drifted is fixed by reconcile
+    update_kwargs = {"books_on_loan": Greatest(F("books_on_loan") - amount, 0) if less else F("books_on_loan") + amount}
+    Customer.objects.filter(pk=book_loan.customer_id).update(**update_kwargs)
+    bump_data_version(Customer)
+
+
+def reconcile_books_on_loan():
+    """
+    Method to fix the books_on_loan counter of the customers that differs from their active loans.
+    :return: <int> amount of fixed customers
+    """
+    active_books = BookLoan.books.through.objects.filter(
+        bookloan__customer=OuterRef("pk"), bookloan__status__in=ACTIVE_BOOK_LOAN_STATUSES
+    ).values("bookloan__customer").annotate(amount=Count("pk")).values("amount")
+    books_on_loan = Coalesce(Subquery(active_books), 0)
+
+    wrong = Customer.objects.annotate(actual=books_on_loan).exclude(books_on_loan=F("actual"))
+    fixed = Customer.objects.filter(pk__in=wrong.values("pk")).update(books_on_loan=books_on_loan)
+    if fixed:
+        bump_data_version(Customer)
+    return fixed
+
+
+def reconcile_book_loan_counters():
+    """
+    Method to fix the loan counters and the next return date of the books that differ from their loans.
+    :return: <int> amount of fixed books
+    """
+    links = BookLoan.books.through.objects.filter(book=OuterRef("pk")).order_by().values("book")
+    total_loans = Coalesce(Subquery(links.annotate(amount=Count("pk")).values("amount")), 0)
+    active_loans = Coalesce(Subquery(links.filter(bookloan__status__in=ACTIVE_BOOK_LOAN_STATUSES).annotate(
+        amount=Count("pk")
+    ).values("amount")), 0)
+    last_borrowed_at = Subquery(links.annotate(last=Max("bookloan__created_at")).values("last"))
+    # The books without loans have no dates, compared with fixed dates so NULL is equal to NULL
+    no_date = Value(datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc))
+
+    next_return_date = get_next_return_date()
+    no_day = Value(datetime.date(1970, 1, 1))
+
+    wrong = Book.objects.annotate(
+        actual_total=total_loans, actual_active=active_loans, actual_last=Coalesce(last_borrowed_at, no_date),
+        current_last=Coalesce("last_borrowed_at", no_date), actual_next=Coalesce(next_return_date, no_day),
+        current_next=Coalesce("next_return_date", no_day),
+    ).exclude(total_loans=F("actual_total"), active_loans=F("actual_active"), current_last=F("actual_last"),
+              current_next=F("actual_next"))
+    fixed = Book.objects.filter(pk__in=wrong.values("pk")).update(
+        total_loans=total_loans, active_loans=active_loans, last_borrowed_at=last_borrowed_at,
+        next_return_date=next_return_date
+    )
+    if fixed:
+        bump_data_version(Book)
+    return fixed
 
 
 def update_status():
-    """Method to change the status of loans that have not been returned on the delivery date."""
-    kwargs = {'status': 'past'}
-    BookLoan.objects.filter(status='in_time').filter(end_date__lt=get_current_date()).update(**kwargs)
+    """
+    Method to change the status of loans that have not been returned on the delivery date. The overdue loans leave
+    the in time status, so the (status, end_date) index only reads the loans that must change, including the loans
+    reopened or edited with a past delivery date.
+    :return: <int> amount of updated loans
+    """
+    queryset = BookLoan.objects.filter(status='in_time', end_date__lt=get_current_date())
+    updated = 0
+    books = 0
+    with transaction.atomic():
+        for chunk in get_chunks(queryset.select_for_update().values_list("pk", flat=True)):
+            updated += BookLoan.objects.filter(pk__in=chunk, status='in_time').update(status='past')
+            books += BookLoan.books.through.objects.filter(bookloan_id__in=chunk).count()
+        if updated:
+            record_status_changes([('in_time', 'past', updated, books)])
+            bump_data_version(BookLoan)
+    return updated
+
+
+def sweep_overdue_loans(interval=None, force=False):
+    """
+    Change the status of the overdue loans, at most once per interval.
+    :param interval: <int> minimum seconds between sweeps, by default the OVERDUE_SWEEP_INTERVAL setting
+    :param force: <boolean> ignore the interval
+    :return: <int> amount of updated loans, None if the interval has not passed yet
+    """
+    interval = settings.OVERDUE_SWEEP_INTERVAL if interval is None else interval
+    current = get_current_date(use_time=True)
+
+    with transaction.atomic():
+        sweep, _ = OverdueSweep.objects.get_or_create(pk=1)
+        # Claim the run with a conditional update so concurrent workers do not sweep twice
+        claim = OverdueSweep.objects.filter(pk=sweep.pk)
+        if not force:
+            claim = claim.filter(Q(last_run_at__isnull=True) | Q(last_run_at__lte=current - timedelta(seconds=interval)))
+        if not claim.update(last_run_at=current):
+            return None
+
+        updated = update_status()
+
+    logger.info("overdue sweep updated {} loans".format(updated))
+    return updated
+
+
+def run_overdue_sweeper(interval=None, stopped=None):
+    """
+    Sweep the overdue loans every interval seconds until stopped is set, used by the sweep command with --loop.
+    :param stopped: <threading.Event> stops the loop, by default it runs forever
+    """
+    interval = settings.OVERDUE_SWEEP_INTERVAL if interval is None else interval
+    stopped = stopped or threading.Event()
+    while True:
+        try:
+            sweep_overdue_loans(interval)
+        except DatabaseError:
+            logger.exception("overdue sweep failed")
+        finally:
+            connections.close_all()
+        if stopped.wait(interval):
+            break
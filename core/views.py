@@ -1,23 +1,27 @@
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db import transaction
 from django.http import HttpResponseNotAllowed, HttpResponseRedirect
 from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse_lazy
-from django.views.generic import CreateView, DeleteView, UpdateView
+from django.views.generic import CreateView, DeleteView, TemplateView, UpdateView
 from django_filters.views import FilterView
 from django_tables2 import SingleTableMixin
 from django.utils.translation import gettext_lazy as _
 
-from core.enums import StatusBookLoanOptions
 from core.filters import AuthorFilter, BookFilter, BookLoanFilter
 from core.forms import AuthorForm, BookForm, BookLoanForm, BookLoanUpdateForm
 from core.models import Author, Book, BookLoan
+from core.reports import get_loan_stats
+from core.services import LoanLimitError, OutOfStockError, change_book_loan_status, checkout_book_loan, \
+    return_book_loan
 from core.tables import AuthorTable, BookTable, BookLoanTable
-from core.utils import update_stock, update_status
+from customers.models import Customer
+from utils.views import CachedCountMixin, CachedResponseMixin, StreamingExportView
 
 
-class AuthorListView(LoginRequiredMixin, SingleTableMixin, FilterView):
+class AuthorListView(LoginRequiredMixin, CachedResponseMixin, CachedCountMixin, SingleTableMixin, FilterView):
     """
     ListView for the model Author.
     """
@@ -57,7 +61,7 @@ class AuthorDeleteView(LoginRequiredMixin, DeleteView):
     success_url = reverse_lazy("core:authors")
 
 
-class BookListView(LoginRequiredMixin, SingleTableMixin, FilterView):
+class BookListView(LoginRequiredMixin, CachedResponseMixin, CachedCountMixin, SingleTableMixin, FilterView):
     """
     ListView for the model Book.
     """
@@ -66,6 +70,29 @@ class BookListView(LoginRequiredMixin, SingleTableMixin, FilterView):
     table_class = BookTable
     filterset_class = BookFilter
     paginate_by = 10
+    count_models = [Book, Author]
+    response_cache_models = [Book, Author]
+
+    def get_queryset(self):
+        # The authors column is rendered for every row
+        return super().get_queryset().prefetch_related("author")
+
+
+class BookExportView(LoginRequiredMixin, StreamingExportView):
+    """
+    Export the filtered books.
+    """
+    model = Book
+    filterset_class = BookFilter
+    export_filename = "books"
+    export_prefetch = ("author",)
+    export_fields = (
+        ("title", _("Título"), lambda book: book.title),
+        ("authors", _("Autores"), lambda book: ", ".join(author.full_name for author in book.author.all())),
+        ("quantity", _("Cantidad"), lambda book: book.quantity),
+        ("in_stock", _("En Stock"), lambda book: book.in_stock),
+        ("created_at", _("Fecha de Creación"), lambda book: book.created_at),
+    )
 
 
 class BookCreateView(LoginRequiredMixin, CreateView):
@@ -87,6 +114,14 @@ class BookUpdateView(LoginRequiredMixin, UpdateView):
     template_name = "core/book/book_edit.html"
     success_url = reverse_lazy("core:books")
 
+    def form_valid(self, form):
+        # The counters are kept by the loan services with conditional updates, a full save would write back the
+        # values loaded with the form
+        self.object = form.save(commit=False)
+        self.object.save(update_fields=["title", "summary", "quantity", "in_stock", "updated_at"])
+        form.save_m2m()
+        return redirect(self.get_success_url())
+
 
 class BookDeleteView(LoginRequiredMixin, DeleteView):
     """
@@ -97,7 +132,7 @@ class BookDeleteView(LoginRequiredMixin, DeleteView):
     success_url = reverse_lazy("core:books")
 
 
-class BookLoanListView(LoginRequiredMixin, SingleTableMixin, FilterView):
+class BookLoanListView(LoginRequiredMixin, CachedResponseMixin, CachedCountMixin, SingleTableMixin, FilterView):
     """
     ListView for the model BookLoan.
     """
@@ -106,12 +141,35 @@ class BookLoanListView(LoginRequiredMixin, SingleTableMixin, FilterView):
     table_class = BookLoanTable
     filterset_class = BookLoanFilter
     paginate_by = 10
+    count_models = [BookLoan, Customer]
+    response_cache_models = [BookLoan, Customer, Book]
+    # The actions column has forms with csrf tokens
+    response_cache_csrf = True
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        update_status()
+    def get_queryset(self):
+        # The customer and books columns are rendered for every row
+        return super().get_queryset().select_related("customer").prefetch_related("books")
 
-        return context
+
+class BookLoanExportView(LoginRequiredMixin, StreamingExportView):
+    """
+    Export the filtered book loans.
+    """
+    model = BookLoan
+    filterset_class = BookLoanFilter
+    export_filename = "book_loans"
+    export_prefetch = ("books",)
+    export_fields = (
+        ("customer", _("Cliente"), lambda book_loan: book_loan.customer.get_full_name()),
+        ("document_number", _("DNI/NIE/Pasaporte"), lambda book_loan: book_loan.customer.document_number),
+        ("books", _("Libros"), lambda book_loan: ", ".join(book.title for book in book_loan.books.all())),
+        ("status", _("Estado"), lambda book_loan: book_loan.status),
+        ("end_date", _("Fecha de Entrega"), lambda book_loan: book_loan.end_date),
+        ("created_at", _("Fecha de Creación"), lambda book_loan: book_loan.created_at),
+    )
+
+    def get_queryset(self):
+        return super().get_queryset().select_related("customer")
 
 
 class BookLoanCreateView(LoginRequiredMixin, CreateView):
@@ -124,8 +182,14 @@ class BookLoanCreateView(LoginRequiredMixin, CreateView):
     success_url = reverse_lazy('core:book_loans')
 
     def form_valid(self, form):
-        self.object = form.save()
-        update_stock(self.object.books, less=True)
+        try:
+            self.object = checkout_book_loan(form.save(commit=False), form.cleaned_data["books"])
+        except OutOfStockError as error:
+            form.add_error("books", str(error))
+            return self.form_invalid(form)
+        except LoanLimitError as error:
+            form.add_error("customer", str(error))
+            return self.form_invalid(form)
         messages.success(self.request, _("Se ha creado el préstamo correctamente!"))
         return redirect(self.success_url)
 
@@ -145,13 +209,20 @@ class BookLoanUpdateView(LoginRequiredMixin, UpdateView):
     success_url = reverse_lazy("core:book_loans")
 
     def form_valid(self, form):
-        self.object = form.save()
-        if self.object.status_has_changed:
-            if self.object._initial_status == "returned":
-                update_stock(self.object.books, less=True)
-            elif self.object._initial_status in ['in_time', 'past'] and self.object.status == 'returned':
-                update_stock(self.object.books)
-        messages.success(self.request, _('Se ha actualizado correctamente el préstamo.'))
+        self.object = form.save(commit=False)
+        try:
+            with transaction.atomic():
+                self.object.save(update_fields=["end_date", "updated_at"])
+                transitioned = not self.object.status_has_changed or change_book_loan_status(
+                    self.object, self.object.status
+                )
+        except (OutOfStockError, LoanLimitError) as error:
+            form.add_error(None, str(error))
+            return self.form_invalid(form)
+        if transitioned:
+            messages.success(self.request, _('Se ha actualizado correctamente el préstamo.'))
+        else:
+            messages.warning(self.request, _("El estado del préstamo fue modificado por otro usuario."))
         return redirect(self.success_url)
 
 
@@ -179,8 +250,30 @@ def approve_delivery(request, book_loan_id):
     if request.method != "POST":
         return HttpResponseNotAllowed(["post"])
     book_loan = get_object_or_404(BookLoan, pk=book_loan_id)
-    book_loan.status = StatusBookLoanOptions.returned
-    book_loan.save()
-    update_stock(book_loan.books)
-    messages.success(request, _("Se aprobó la entrega del préstamo correctamente!"))
+    if return_book_loan(book_loan):
+        messages.success(request, _("Se aprobó la entrega del préstamo correctamente!"))
+    else:
+        messages.warning(request, _("La entrega de este préstamo ya había sido aprobada."))
     return redirect(reverse_lazy('core:book_loans'))
+
+
+class LoanStatsView(LoginRequiredMixin, TemplateView):
+    """
+    Dashboard of the loans, it only reads the summary tables.
+    """
+    template_name = "core/book_loan/loan_stats.html"
+    period_choices = (7, 30, 90, 365)
+
+    def get_days(self):
+        try:
+            days = int(self.request.GET.get("days", 30))
+        except ValueError:
+            return 30
+        return days if days in self.period_choices else 30
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["stats"] = get_loan_stats(days=self.get_days())
+        context["period_choices"] = self.period_choices
+        context["title"] = _("Estadísticas de Préstamos")
+        return context
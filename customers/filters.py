@@ -1,7 +1,6 @@
-from django.db.models import Q
-
 from utils.filters import SearchFilter
 from customers.models import Customer
+from customers.search import search_customers
 
 
 class CustomerFilter(SearchFilter):
@@ -11,10 +10,4 @@ class CustomerFilter(SearchFilter):
         fields = ["search"]
 
     def search_filter(self, queryset, name, value):
-        return queryset.filter(
-            Q(first_name__icontains=value)
-            | Q(last_name__icontains=value)
-            | Q(document_number__icontains=value)
-            | Q(email__icontains=value)
-            | Q(phone_number__icontains=value)
-        )
+        return search_customers(queryset, value)
@@ -5,6 +5,11 @@ from customers.models import Customer
 
 class CustomerForm(forms.ModelForm):
 
+    def __init__(self, *args, check_unique=True, **kwargs):
+        # The bulk import validates the uniqueness of the whole batch at once
+        self.check_unique = check_unique
+        super().__init__(*args, **kwargs)
+
     class Meta:
         model = Customer
         fields = ["document_number", "first_name", "last_name", "email", "phone_number"]
@@ -52,6 +57,13 @@ class CustomerForm(forms.ModelForm):
         phone_number = cleaned_data.get("phone_number")
         document_number = cleaned_data.get("document_number")
 
+        if not email and not phone_number:
+            self.add_error("email", _("Debe proporcionarse un teléfono o un correo como medio de contacto."))
+            self.add_error("phone_number", _("Debe proporcionarse un teléfono o un correo como medio de contacto."))
+
+        if not self.check_unique:
+            return cleaned_data
+
         qs_base = Customer.objects.all()
 
         if self.instance and self.instance.pk:
@@ -61,10 +73,6 @@ class CustomerForm(forms.ModelForm):
         phone_valid = not qs_base.filter(phone_number=phone_number).exists()
         dni_valid = not qs_base.filter(document_number=document_number).exists()
 
-        if not email and not phone_number:
-            self.add_error("email", _("Debe proporcionarse un teléfono o un correo como medio de contacto."))
-            self.add_error("phone_number", _("Debe proporcionarse un teléfono o un correo como medio de contacto."))
-
         if email and not email_valid:
             self.add_error("email", _("Este correo ya está en uso."))
 
@@ -84,6 +92,8 @@ class CustomerForm(forms.ModelForm):
                 ),
             )
 
+        return cleaned_data
 
-
-        return cleaned_data
\ No newline at end of file
+    def validate_unique(self):
+        if self.check_unique:
+            super().validate_unique()
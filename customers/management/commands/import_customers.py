@@ -0,0 +1,51 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from customers.services import bulk_create_customers
+
+
+class Command(BaseCommand):
+    help = (
+        "Import customers from a CSV file with the columns document_number, first_name, last_name, email and "
+        "phone_number. The rejected rows are reported together at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV file with the customers.")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Customers created per transaction.")
+
+    def handle(self, *args, **options):
+        try:
+            file = open(options["path"], newline="", encoding="utf-8")
+        except OSError as error:
+            raise CommandError(error)
+
+        start = time.monotonic()
+        created = 0
+        rejected = []
+        with file:
+            batch = []
+            for line, row in enumerate(csv.DictReader(file), start=2):
+                batch.append((line, row))
+                if len(batch) >= options["batch_size"]:
+                    created += self.process(batch, rejected)
+                    batch = []
+            created += self.process(batch, rejected)
+
+        for line, error in rejected:
+            self.stderr.write("Line {}: {}".format(line, error))
+        elapsed = max(time.monotonic() - start, 0.001)
+        self.stdout.write(self.style.SUCCESS(
+            "Created {} customers, {} rows rejected in {:.2f}s ({:.0f} customers/s).".format(
+                created, len(rejected), elapsed, created / elapsed
+            )
+        ))
+
+    def process(self, batch, rejected):
+        if not batch:
+            return 0
+        created, errors = bulk_create_customers([row for _, row in batch])
+        rejected.extend((batch[index][0], error) for index, error in sorted(errors.items()))
+        return created
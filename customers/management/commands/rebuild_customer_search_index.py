@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from customers.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the trigram search index of the clients."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000, help="Clients indexed per batch.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            total = rebuild_index(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS("Indexed {} clients.".format(total)))
@@ -0,0 +1,60 @@
+# Generated by Django 4.0.1 on 2026-10-18 18:04
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+SEARCH_FIELDS = ("first_name", "last_name", "document_number", "email", "phone_number")
+
+
+def get_trigrams(value):
+    # Frozen copy of utils.utils.get_trigrams at the time of this migration
+    value = unicodedata.normalize("NFKD", str(value or "")).encode("ascii", "ignore").decode("ascii")
+    trigrams = set()
+    for word in re.findall(r"[a-z0-9]+", value.lower()):
+        padded = "  {} ".format(word)
+        trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+
+def populate_customer_search_trigrams(apps, schema_editor):
+    Customer = apps.get_model("customers", "Customer")
+    CustomerSearchTrigram = apps.get_model("customers", "CustomerSearchTrigram")
+    for customer in Customer.objects.iterator(chunk_size=2000):
+        trigrams = get_trigrams(" ".join(getattr(customer, field) or "" for field in SEARCH_FIELDS))
+        CustomerSearchTrigram.objects.bulk_create([
+            CustomerSearchTrigram(customer_id=customer.pk, trigram=trigram) for trigram in trigrams
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerSearchTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3, verbose_name='Trigrama')),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_trigrams', to='customers.customer', verbose_name='Cliente')),
+            ],
+            options={
+                'verbose_name': 'Trigrama de Cliente',
+                'verbose_name_plural': 'Trigramas de Clientes',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='customersearchtrigram',
+            index=models.Index(fields=['trigram', 'customer'], name='customer_search_trigram_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='customersearchtrigram',
+            unique_together={('customer', 'trigram')},
+        ),
+        migrations.RunPython(populate_customer_search_trigrams, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.1 on 2026-10-18 18:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0002_customer_search_trigram'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='books_on_loan',
+            field=models.PositiveIntegerField(db_index=True, default=0, verbose_name='Libros Prestados'),
+        ),
+    ]
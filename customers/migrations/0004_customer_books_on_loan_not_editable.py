@@ -0,0 +1,18 @@
+# Generated by Django 4.0.1 on 2026-10-18 19:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0003_customer_books_on_loan'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customer',
+            name='books_on_loan',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='Libros Prestados'),
+        ),
+    ]
@@ -1,10 +1,11 @@
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, transaction
 from django.urls import reverse_lazy
 from django.utils.translation import gettext_lazy as _
 
 from utils.mixins import LowercaseEmailField
 from utils.models import AbstractDates
+from utils.utils import get_trigrams
 from utils.validators import get_phone_valid_message, phone_regex_validator
 
 User = get_user_model()
@@ -24,6 +25,12 @@ class Customer(AbstractDates):
         validators=[phone_regex_validator],
         help_text=get_phone_valid_message(),
     )
+    # Kept by the loan services with conditional updates, the forms never write it
+    books_on_loan = models.PositiveIntegerField(verbose_name=_("Libros Prestados"), default=0, db_index=True,
+                                                editable=False)
+
+    MAX_BOOKS_ON_LOAN = 3
+    SEARCH_FIELDS = ("first_name", "last_name", "document_number", "email", "phone_number")
 
     def __str__(self):
         return self.get_full_name()
@@ -34,6 +41,19 @@ class Customer(AbstractDates):
         ordering = ["-created_at"]
         permissions = (("manage_customer", _("Puede Administrar Cliente")),)
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._initial_search_values = self.get_search_values()
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            adding = self._state.adding
+            super().save(*args, **kwargs)
+            # The trigrams are only rebuilt when the indexed fields change, not on every save
+            if adding or self.search_fields_have_changed:
+                self.update_search_trigrams(replace=not adding)
+                self._initial_search_values = self.get_search_values()
+
     def get_edit_url(self):
         """Return customer edit url."""
         return reverse_lazy("customers:customers_update", kwargs={"pk": self.pk})
@@ -52,11 +72,46 @@ class Customer(AbstractDates):
         Method to know if you can lend more books to the client.
         :param cant: <boolean> if you want to return the amount
         """
-        aux = 0
-        for book_loan in self.book_loan.filter(status__in=['in_time', 'past']):
-            aux += book_loan.books.count()
-
         if cant:
-            return aux
+            return self.books_on_loan
+
+        return self.books_on_loan < self.MAX_BOOKS_ON_LOAN
+
+    def get_search_values(self):
+        """Returns the loaded values of the searchable fields, the deferred fields are None."""
+        return tuple(self.__dict__.get(field) for field in self.SEARCH_FIELDS)
+
+    @property
+    def search_fields_have_changed(self):
+        return self._initial_search_values != self.get_search_values()
+
+    def get_search_trigrams(self):
+        """Returns the trigrams of the searchable fields."""
+        return get_trigrams(" ".join(getattr(self, field) or "" for field in self.SEARCH_FIELDS))
 
-        return aux < 3
+    def update_search_trigrams(self, replace=True):
+        """
+        Store the trigrams of the searchable fields in the search index for this customer.
+        :param replace: <boolean> remove the stored trigrams first, a new customer has none
+        """
+        if replace:
+            CustomerSearchTrigram.objects.filter(customer=self).delete()
+        CustomerSearchTrigram.objects.bulk_create([
+            CustomerSearchTrigram(customer=self, trigram=trigram) for trigram in self.get_search_trigrams()
+        ])
+
+
+class CustomerSearchTrigram(models.Model):
+    """Trigram index used for the fuzzy search of clients, the rows are removed in cascade with the client"""
+    customer = models.ForeignKey(Customer, verbose_name=_("Cliente"), on_delete=models.CASCADE,
+                                 related_name="search_trigrams")
+    trigram = models.CharField(verbose_name=_("Trigrama"), max_length=3)
+
+    def __str__(self):
+        return self.trigram
+
+    class Meta:
+        verbose_name = _("Trigrama de Cliente")
+        verbose_name_plural = _("Trigramas de Clientes")
+        unique_together = ("customer", "trigram")
+        indexes = [models.Index(fields=["trigram", "customer"], name="customer_search_trigram_idx")]
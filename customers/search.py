@@ -0,0 +1,62 @@
+from math import ceil
+
+from django.db.models import Count, Q
+
+from customers.models import Customer, CustomerSearchTrigram
+from utils.utils import get_trigrams
+
+# Minimum fraction of the searched trigrams that a client must share to be a match
+SIMILARITY_THRESHOLD = 0.5
+
+
+def get_fallback_filter(value, prefix=""):
+    """Returns the substring filter used when the value has no searchable trigrams."""
+    return (
+        Q(**{"{}first_name__icontains".format(prefix): value})
+        | Q(**{"{}last_name__icontains".format(prefix): value})
+        | Q(**{"{}document_number__icontains".format(prefix): value})
+        | Q(**{"{}email__icontains".format(prefix): value})
+        | Q(**{"{}phone_number__icontains".format(prefix): value})
+    )
+
+
+def search_customers(queryset, value, customer_field="pk"):
+    """
+    Filter the queryset by the clients that are similar to the value, ordered by similarity.
+    :param queryset: <QuerySet> of Customer or of a model with a relation to Customer
+    :param value: <str> searched text, typos and missing accents are tolerated
+    :param customer_field: <str> field of the queryset model that references the client
+    """
+    # The edge trigrams like "  a" are shared by too many clients, they are only used for the short words
+    trigrams = get_trigrams(value, padded=False)
+    prefix = "" if customer_field == "pk" else "{}__".format(customer_field)
+    if not trigrams:
+        return queryset.filter(get_fallback_filter(value, prefix))
+
+    # One join with the trigram index, the score is the count of the same aggregate that filters the clients
+    min_score = max(1, ceil(len(trigrams) * SIMILARITY_THRESHOLD))
+    return queryset.filter(**{"{}search_trigrams__trigram__in".format(prefix): trigrams}).annotate(
+        search_score=Count("{}search_trigrams".format(prefix))
+    ).filter(search_score__gte=min_score).order_by("-search_score", "-created_at")
+
+
+def rebuild_index(batch_size=2000):
+    """
+    Rebuild the trigrams of all clients.
+    :param batch_size: <int> amount of clients processed per batch
+    :return: <int> amount of clients indexed
+    """
+    CustomerSearchTrigram.objects.all().delete()
+    total = 0
+    batch = []
+    for customer in Customer.objects.order_by("pk").iterator(chunk_size=batch_size):
+        batch.extend(
+            CustomerSearchTrigram(customer_id=customer.pk, trigram=trigram)
+            for trigram in customer.get_search_trigrams()
+        )
+        total += 1
+        if total % batch_size == 0:
+            CustomerSearchTrigram.objects.bulk_create(batch)
+            batch = []
+    CustomerSearchTrigram.objects.bulk_create(batch)
+    return total
@@ -0,0 +1,85 @@
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+
+from customers.forms import CustomerForm
+from customers.models import Customer, CustomerSearchTrigram
+from utils.utils import bump_data_version, get_chunks
+
+# Fields that must be unique with the messages of the CustomerForm
+UNIQUE_FIELDS = (
+    ("document_number", _("Este número de documento ya está en uso.")),
+    ("email", _("Este correo ya está en uso.")),
+    ("phone_number", _("Este teléfono ya está en uso.")),
+)
+
+
+def get_form_errors(form):
+    """Returns the errors of the form in one line, the generic message is only kept if there is no other."""
+    errors = form.errors.get_json_data()
+    if len(errors) > 1:
+        errors.pop("__all__", None)
+    return "; ".join(
+        "{}: {}".format(field, " ".join(error["message"] for error in field_errors)) if field != "__all__"
+        else " ".join(error["message"] for error in field_errors)
+        for field, field_errors in errors.items()
+    )
+
+
+def validate_bulk_customers(rows):
+    """
+    Clean a batch of customers with the CustomerForm rules and check the uniqueness of the whole batch with one
+    query per field, the repeated values in the batch are rejected after the first row that has them.
+    :param rows: <list> of dicts with the CustomerForm fields
+    :return: <tuple> errors per row index and the cleaned data of the valid rows
+    """
+    errors = {}
+    cleaned = {}
+    for index, row in enumerate(rows):
+        form = CustomerForm(data=row, check_unique=False)
+        if form.is_valid():
+            cleaned[index] = form.cleaned_data
+        else:
+            errors[index] = get_form_errors(form)
+
+    for field, message in UNIQUE_FIELDS:
+        values = {data[field] for data in cleaned.values() if data[field]}
+        existing = set()
+        for chunk in get_chunks(values):
+            existing.update(Customer.objects.filter(**{field + "__in": chunk}).order_by().values_list(field, flat=True))
+
+        seen = set()
+        for index, data in list(cleaned.items()):
+            value = data[field]
+            if not value:
+                continue
+            if value in existing:
+                errors[index] = "{}: {}".format(field, message)
+            elif value in seen:
+                errors[index] = "{}: {}".format(field, _("Este valor está repetido en la importación."))
+            else:
+                seen.add(value)
+                continue
+            del cleaned[index]
+
+    return errors, cleaned
+
+
+def bulk_create_customers(rows, batch_size=1000):
+    """
+    Validate a batch of customers and insert the valid ones and their search trigrams with bulk_create.
+    :param rows: <list> of dicts with the CustomerForm fields
+    :return: <tuple> amount of created customers and errors per row index
+    """
+    errors, cleaned = validate_bulk_customers(rows)
+    customers = [
+        Customer(**{field: data[field] for field in CustomerForm.Meta.fields}) for data in cleaned.values()
+    ]
+    with transaction.atomic():
+        Customer.objects.bulk_create(customers, batch_size=batch_size)
+        # bulk_create does not call save, the search index and the cached data are updated here
+        CustomerSearchTrigram.objects.bulk_create([
+            CustomerSearchTrigram(customer_id=customer.pk, trigram=trigram)
+            for customer in customers for trigram in customer.get_search_trigrams()
+        ], batch_size=batch_size)
+        bump_data_version(Customer)
+    return len(customers), errors
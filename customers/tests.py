@@ -1,10 +1,22 @@
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase, RequestFactory
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse, resolve
 
 from customers.filters import CustomerFilter
-from customers.models import Customer
+from customers.forms import CustomerForm
+from customers.models import Customer, CustomerSearchTrigram
+from customers.search import search_customers
+from customers.services import validate_bulk_customers
+from customers.views import CustomerUpdateView
 
 User = get_user_model()
 
@@ -120,6 +132,67 @@ class CustomerFilterTestCase(TestCase):
         f = CustomerFilter(GET, queryset=Customer.objects.all())
         self.assertEqual(len(list(f.qs)), 1)
 
+    def test_filter_search_typo_and_accents(self):
+        """Test filters search tolerating typos and missing accents"""
+        customer = Customer.objects.create(document_number="111", first_name="José", last_name="González Pérez",
+                                           email="jose@gmail.com")
+        GET = {'search': 'gonzales perez'}
+        f = CustomerFilter(GET, queryset=Customer.objects.all())
+        self.assertEqual(list(f.qs), [customer])
+
+    def test_filter_search_ranking(self):
+        """Test filters search ordering the most similar clients first"""
+        rodrigo = Customer.objects.create(document_number="111", first_name="Rodrigo", last_name="Diaz",
+                                          email="rodrigo@gmail.com")
+        rodriguez = Customer.objects.create(document_number="222", first_name="Ana", last_name="Rodriguez",
+                                            email="ana@gmail.com")
+        GET = {'search': 'rodriguez'}
+        f = CustomerFilter(GET, queryset=Customer.objects.all())
+        self.assertEqual(list(f.qs), [rodriguez, rodrigo])
+
+    def test_search_index_update_and_delete(self):
+        """Test the search index follows the client changes"""
+        self.customer.last_name = "Martínez"
+        self.customer.save()
+        self.assertEqual(list(search_customers(Customer.objects.all(), 'martinez')), [self.customer])
+        self.assertEqual(list(search_customers(Customer.objects.all(), 'last')), [])
+
+        self.customer.delete()
+        self.assertFalse(CustomerSearchTrigram.objects.exists())
+
+    def test_search_without_edge_trigrams(self):
+        """Test the searches of 3 or more characters do not match by the trigrams of the word edges only"""
+        Customer.objects.create(document_number="111", first_name="Ana", last_name="Diaz", email="ana@gmail.com")
+        self.assertEqual([customer.first_name for customer in search_customers(Customer.objects.all(), 'axx')], [])
+        self.assertEqual([customer.first_name for customer in search_customers(Customer.objects.all(), 'ana')],
+                         ["Ana"])
+
+    def test_search_single_aggregate(self):
+        """Test the score of the search comes from the aggregate that filters the clients"""
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(list(search_customers(Customer.objects.all(), 'customer')), [self.customer])
+        sql = context.captured_queries[0]['sql']
+        self.assertEqual(sql.count('SELECT'), 1)
+        self.assertIn('HAVING', sql)
+
+    def test_search_index_unchanged_fields(self):
+        """Test the trigrams are only rebuilt when the searchable fields change"""
+        customer = Customer.objects.get(pk=self.customer.pk)
+        with CaptureQueriesContext(connection) as context:
+            customer.save()
+        self.assertFalse([query for query in context.captured_queries if 'customer_search_trigram' in query['sql']
+                          or 'customersearchtrigram' in query['sql']])
+
+        customer.first_name = "Mario"
+        customer.save()
+        self.assertEqual(list(search_customers(Customer.objects.all(), 'mario')), [customer])
+
+    def test_search_index_rebuild(self):
+        """Test the rebuild command of the search index"""
+        Customer.objects.update(last_name="Fernández")
+        call_command("rebuild_customer_search_index", stdout=StringIO())
+        self.assertEqual(list(search_customers(Customer.objects.all(), 'fernandez')), [self.customer])
+
 
 class CustomerTestCase(TestCase):
 
@@ -399,4 +472,109 @@ class CustomerTestCase(TestCase):
         self.assertEqual(self.customer.document_number, '546654')
         self.assertEqual(self.customer.phone_number, '+59896101701')
 
+    def test_create_customer_duplicated_contact(self):
+        """Test the email and the phone number of another customer are rejected"""
+        Customer.objects.filter(pk=self.customer.pk).update(phone_number="+59896101701")
+        form = CustomerForm(data={'document_number': '546654', 'first_name': 'test', 'last_name': 'test',
+                                  'email': 'Customer@gmail.com', 'phone_number': '+598 96101701'})
+
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors['email'], ["Este correo ya está en uso."])
+        self.assertEqual(form.errors['phone_number'], ["Este teléfono ya está en uso."])
+        self.assertEqual(Customer.objects.count(), 1)
+
+    def test_update_customer_keeps_contact(self):
+        """Test a customer can be saved again with its own email"""
+        form = CustomerForm(instance=self.customer, data={'document_number': '456465', 'first_name': 'test',
+                                                          'last_name': 'last', 'email': 'customer@gmail.com',
+                                                          'phone_number': ''})
+        self.assertTrue(form.is_valid())
+
+    def test_update_customer_keeps_books_on_loan(self):
+        """Test editing a customer does not write back the books on loan counter loaded by the form"""
+        url = reverse('customers:customers_update', kwargs={'pk': self.customer.pk})
+        data = {'document_number': '456465', 'first_name': 'edited', 'last_name': 'last',
+                'email': 'customer@gmail.com', 'phone_number': ''}
+        request = self.factory.post(url, data)
+        request.user = self.superadmin
+        view = resolve(url).func
+        # A loan is checked out after the view loaded the customer
+        stale = Customer.objects.get(pk=self.customer.pk)
+        Customer.objects.filter(pk=self.customer.pk).update(books_on_loan=2)
+        with mock.patch.object(CustomerUpdateView, 'get_object', return_value=stale):
+            response = view(request, pk=self.customer.pk)
+
+        self.assertEqual(response.status_code, 302)
+        self.customer.refresh_from_db()
+        self.assertEqual((self.customer.first_name, self.customer.books_on_loan), ('edited', 2))
+
+
+class CustomerExportTestCase(TestCase):
 
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.superadmin = User.objects.create(email='superadmin@gmail.com', first_name='superadmin',
+                                              last_name='superadmin', is_active=True, is_superuser=True)
+        Customer.objects.create(document_number="654654", first_name="Maria", last_name="Perez",
+                                email="maria@gmail.com")
+        Customer.objects.create(document_number="123123", first_name="Jose", last_name="Garcia",
+                                email="jose@gmail.com")
+
+    def test_export_customers_csv(self):
+        """Test the customers export applies the search filter"""
+        url = reverse('customers:customers_export', args=['csv'])
+        request = self.factory.get(url, {'search': 'maria'})
+        request.user = self.superadmin
+        match = resolve(url)
+        response = match.func(request, **match.kwargs)
+        lines = b"".join(response.streaming_content).decode("utf-8").splitlines()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith('Maria,Perez,654654,maria@gmail.com'))
+
+
+class CustomerImportTestCase(TestCase):
+
+    def setUp(self):
+        Customer.objects.create(document_number="654654", first_name="Maria", last_name="Perez",
+                                email="maria@gmail.com", phone_number="+34600000000")
+
+    def test_validate_bulk_customers(self):
+        """Test the batch is validated with one query per unique field and the repeated rows are rejected"""
+        rows = [
+            {"document_number": "111 111", "first_name": "Jose", "last_name": "Garcia", "email": "JOSE@gmail.com"},
+            {"document_number": "654654", "first_name": "Ana", "last_name": "Lopez", "email": "ana@gmail.com"},
+            {"document_number": "222222", "first_name": "Luis", "last_name": "Diaz", "email": "jose@gmail.com"},
+            {"document_number": "333333", "first_name": "Eva", "last_name": "Ruiz", "phone_number": "+34 600000000"},
+            {"document_number": "444444", "first_name": "Sin", "last_name": "Contacto"},
+            {"document_number": "555555", "first_name": "Pedro", "last_name": "Gil", "phone_number": "abc"},
+        ]
+        with self.assertNumQueries(3):
+            errors, cleaned = validate_bulk_customers(rows)
+
+        self.assertEqual(list(cleaned), [0])
+        self.assertEqual(cleaned[0]["document_number"], "111111")
+        self.assertEqual(cleaned[0]["email"], "jose@gmail.com")
+        self.assertIn("Este número de documento ya está en uso.", errors[1])
+        self.assertIn("repetido", errors[2])
+        self.assertIn("Este teléfono ya está en uso.", errors[3])
+        self.assertIn("Debe proporcionarse un teléfono o un correo", errors[4])
+        self.assertIn("phone_number", errors[5])
+
+    def test_command(self):
+        """Test the import command creates the customers with their search trigrams and reports the rejected rows"""
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, encoding="utf-8") as file:
+            file.write("document_number,first_name,last_name,email,phone_number\n"
+                       "111111,Jose,Garcia,jose@gmail.com,\n"
+                       "654654,Ana,Lopez,ana@gmail.com,\n"
+                       "222222,Luis,Diaz,luis@gmail.com,\n"
+                       "333333,Eva,Ruiz,luis@gmail.com,\n")
+        out, err = StringIO(), StringIO()
+        call_command("import_customers", file.name, "--batch-size", "2", stdout=out, stderr=err)
+        os.remove(file.name)
+
+        self.assertIn("Created 2 customers, 2 rows rejected", out.getvalue())
+        self.assertIn("Line 3: document_number", err.getvalue())
+        self.assertIn("Line 5: email", err.getvalue())
+        self.assertEqual([customer.first_name for customer in search_customers(Customer.objects.all(), "garcia")],
+                         ["Jose"])
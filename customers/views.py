@@ -1,5 +1,7 @@
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.shortcuts import redirect
 from django.urls import reverse_lazy
+from django.utils.translation import gettext_lazy as _
 from django.views.generic import CreateView, DeleteView, UpdateView
 from django_filters.views import FilterView
 from django_tables2 import SingleTableMixin
@@ -8,9 +10,10 @@ from customers.filters import CustomerFilter
 from customers.forms import CustomerForm
 from customers.models import Customer
 from customers.tables import CustomerTable
+from utils.views import CachedCountMixin, CachedResponseMixin, StreamingExportView
 
 
-class CustomerListView(LoginRequiredMixin, SingleTableMixin, FilterView):
+class CustomerListView(LoginRequiredMixin, CachedResponseMixin, CachedCountMixin, SingleTableMixin, FilterView):
     """
     ListView for the model Customer.
     """
@@ -21,6 +24,24 @@ class CustomerListView(LoginRequiredMixin, SingleTableMixin, FilterView):
     paginate_by = 25
 
 
+class CustomerExportView(LoginRequiredMixin, StreamingExportView):
+    """
+    Export the filtered customers.
+    """
+    model = Customer
+    filterset_class = CustomerFilter
+    export_filename = "customers"
+    export_fields = (
+        ("first_name", _("Nombre"), lambda customer: customer.first_name),
+        ("last_name", _("Apellidos"), lambda customer: customer.last_name),
+        ("document_number", _("DNI/NIE/Pasaporte"), lambda customer: customer.document_number),
+        ("email", _("Email"), lambda customer: customer.email),
+        ("phone_number", _("Teléfono"), lambda customer: customer.phone_number),
+        ("books_on_loan", _("Libros Prestados"), lambda customer: customer.books_on_loan),
+        ("created_at", _("Fecha de Creación"), lambda customer: customer.created_at),
+    )
+
+
 class CustomerCreateView(LoginRequiredMixin, CreateView):
     """
     CreateView for the model Customer.
@@ -40,6 +61,12 @@ class CustomerUpdateView(LoginRequiredMixin, UpdateView):
     template_name = "customers/customer_edit.html"
     success_url = reverse_lazy("customers:customers")
 
+    def form_valid(self, form):
+        # Only the fields of the form are written, so the loans checked out meanwhile keep their counter
+        self.object = form.save(commit=False)
+        self.object.save(update_fields=[*form._meta.fields, "updated_at"])
+        return redirect(self.get_success_url())
+
 
 class CustomerDeleteView(LoginRequiredMixin, DeleteView):
     """
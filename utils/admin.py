@@ -0,0 +1,24 @@
+from django.contrib import admin, messages
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from .enums import OutboxStatus
+from .models import OutboxEmail
+
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ("id", "template_id", "status", "attempts", "next_attempt_at", "sent_at")
+    list_filter = ("status",)
+    readonly_fields = ("status", "attempts", "locked_until", "lock_id", "sent_at", "last_error")
+    actions = ("retry",)
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description=_("Reintentar los correos seleccionados"))
+    def retry(self, request, queryset):
+        amount = queryset.filter(status=OutboxStatus.dead).update(
+            status=OutboxStatus.pending, attempts=0, next_attempt_at=timezone.now(), last_error=""
+        )
+        self.message_user(request, _("Se reintentarán {} correos.").format(amount), messages.SUCCESS)
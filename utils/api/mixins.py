@@ -0,0 +1,60 @@
+import hashlib
+
+from django.http import HttpResponseNotModified
+from django.utils import translation
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+from utils.utils import get_data_version, get_data_version_time
+
+
+class ConditionalListMixin:
+    """
+    Conditional GET for list endpoints, the ETag and Last-Modified validators come from the data version of
+    conditional_models, so a list that did not change is answered with 304 without running its queries.
+    """
+    # Models the list depends on, the queryset model by default
+    conditional_models = None
+    # Parameters that do not change the response, "_" is the cache breaker added by jQuery
+    conditional_ignored_params = ("_",)
+
+    def get_conditional_models(self):
+        return self.conditional_models or [self.get_queryset().model]
+
+    def get_etag(self, request):
+        params = sorted(
+            (key, value) for key, values in request.query_params.lists() for value in values
+            if key not in self.conditional_ignored_params
+        )
+        parts = (
+            get_data_version(*self.get_conditional_models()), request.accepted_renderer.format,
+            translation.get_language(), params
+        )
+        return hashlib.md5(repr(parts).encode("utf-8")).hexdigest()
+
+    def list(self, request, *args, **kwargs):
+        etag = quote_etag(self.get_etag(request))
+        last_modified = get_data_version_time(*self.get_conditional_models())
+
+        # The Last-Modified has whole seconds, the ETag decides when the client sends both validators
+        if "HTTP_IF_NONE_MATCH" in request.META:
+            response = get_conditional_response(request._request, etag=etag)
+        else:
+            response = self.get_not_modified_response(request, last_modified)
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+        response["ETag"] = etag
+        if last_modified:
+            response["Last-Modified"] = http_date(int(last_modified))
+        patch_vary_headers(response, ("Accept", "Authorization", "Cookie"))
+        return response
+
+    def get_not_modified_response(self, request, last_modified):
+        """
+        Returns 304 when the data changed strictly before the second of If-Modified-Since, a change in the same
+        second as the cached response is answered with the data.
+        """
+        if_modified_since = parse_http_date_safe(request.META.get("HTTP_IF_MODIFIED_SINCE"))
+        if last_modified and if_modified_since is not None and last_modified < if_modified_since:
+            return HttpResponseNotModified()
+        return None
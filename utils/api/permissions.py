@@ -0,0 +1,16 @@
+from rest_framework.permissions import DjangoModelPermissions
+
+
+class ActionModelPermissions(DjangoModelPermissions):
+    """
+    Model permissions where the extra actions of the viewset declare the permissions they need in
+    action_permissions, {action: [<app_label>.<codename>]}. The rest of the actions use the permission of the method.
+    """
+
+    def has_permission(self, request, view):
+        perms = getattr(view, "action_permissions", {}).get(getattr(view, "action", None))
+        if perms is None:
+            return super().has_permission(request, view)
+        if not request.user or (not request.user.is_authenticated and self.authenticated_users_only):
+            return False
+        return request.user.has_perms(perms)
@@ -0,0 +1,160 @@
+import hashlib
+import time
+import uuid
+
+from django.core.cache import cache as default_cache, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+class TwoTierCache(BaseCache):
+    """
+    Cache backend with a per-process LocMemCache (L1) in front of a shared cache alias (L2), for example a
+    FileBasedCache that every worker can read without outside services.
+    The values are kept in L1 for at most L1_TIMEOUT seconds, use namespaced keys when the values must change
+    in every worker as soon as the data changes.
+
+    OPTIONS:
+        L2: <str> alias of the shared cache
+        L1_TIMEOUT: <int> max seconds a value is kept in the process
+        L1_MAX_ENTRIES: <int> max values kept in the process
+    """
+
+    def __init__(self, name, params):
+        options = dict(params.get("OPTIONS", {}))
+        self.l2_alias = options.pop("L2")
+        self.l1_timeout = options.pop("L1_TIMEOUT", 5)
+        l1_max_entries = options.pop("L1_MAX_ENTRIES", 1000)
+        super().__init__(dict(params, OPTIONS=options))
+        self.l1 = LocMemCache("two-tier-{}".format(name), {"OPTIONS": {"MAX_ENTRIES": l1_max_entries}})
+
+    @property
+    def l2(self):
+        return caches[self.l2_alias]
+
+    def get_l1_timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT or timeout is None:
+            return self.l1_timeout
+        return min(timeout, self.l1_timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.l2.add(key, value, timeout, version=version)
+        if added:
+            self.l1.set(key, value, self.get_l1_timeout(timeout), version=version)
+        return added
+
+    def get(self, key, default=None, version=None):
+        value = self.l1.get(key, self._missing_key, version=version)
+        if value is self._missing_key:
+            value = self.l2.get(key, self._missing_key, version=version)
+            if value is self._missing_key:
+                return default
+            self.l1.set(key, value, self.l1_timeout, version=version)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l2.set(key, value, timeout, version=version)
+        self.l1.set(key, value, self.get_l1_timeout(timeout), version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l1.delete(key, version=version)
+        return self.l2.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self.l1.delete(key, version=version)
+        return self.l2.delete(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self.l1.delete(key, version=version)
+        return self.l2.incr(key, delta, version=version)
+
+    def has_key(self, key, version=None):
+        return self.l1.has_key(key, version=version) or self.l2.has_key(key, version=version)
+
+    def clear(self):
+        self.l1.clear()
+        self.l2.clear()
+
+    def close(self, **kwargs):
+        self.l2.close(**kwargs)
+
+
+def get_shared_cache(alias="default"):
+    """Returns the shared tier of the cache, the generations are always read from it to see the bumps of every worker"""
+    cache = caches[alias]
+    return cache.l2 if isinstance(cache, TwoTierCache) else cache
+
+
+def get_generation_key(namespace):
+    return "generation:{}".format(namespace)
+
+
+def get_generation_time_key(namespace):
+    return "generation-time:{}".format(namespace)
+
+
+def new_generation():
+    """Returns a generation that was never used, so concurrent bumps of other workers never write the same value"""
+    return uuid.uuid4().hex
+
+
+def get_generations(*namespaces):
+    """Returns the current generation of every namespace."""
+    cache = get_shared_cache()
+    keys = [get_generation_key(namespace) for namespace in namespaces]
+    generations = cache.get_many(keys)
+    missing = [namespace for namespace, key in zip(namespaces, keys) if key not in generations]
+    if missing:
+        # A new generation, so a cleared cache never repeats an old one.
+        # add does not overwrite a generation created meanwhile by another worker
+        current = time.time()
+        for namespace in missing:
+            cache.add(get_generation_key(namespace), new_generation(), timeout=None)
+            cache.add(get_generation_time_key(namespace), current, timeout=None)
+        generations.update(cache.get_many([get_generation_key(namespace) for namespace in missing]))
+    return tuple(generations.get(key, "") for key in keys)
+
+
+def get_generations_time(*namespaces):
+    """Returns the timestamp of the last change of any of the namespaces."""
+    get_generations(*namespaces)
+    times = get_shared_cache().get_many([get_generation_time_key(namespace) for namespace in namespaces])
+    return max(times.values()) if times else None
+
+
+def bump_generation(*namespaces):
+    """
+    Invalidate every key of the namespaces, the old values are left to expire.
+    The generation is replaced by a new unique value instead of incremented, the shared cache may not have an atomic
+    increment and two workers incrementing at once would write the same generation.
+    """
+    cache = get_shared_cache()
+    current = time.time()
+    for namespace in namespaces:
+        cache.set(get_generation_key(namespace), new_generation(), timeout=None)
+        cache.set(get_generation_time_key(namespace), current, timeout=None)
+
+
+def make_key(namespace, *parts, depends_on=()):
+    """
+    Returns a key of the namespace that changes when the generation of the namespace, or of any namespace it
+    depends on, is bumped.
+    :param parts: values that identify the cached value, they are hashed so any value with a stable repr works
+    """
+    generations = get_generations(namespace, *depends_on)
+    digest = hashlib.md5(repr(parts).encode("utf-8")).hexdigest()
+    return "{}:{}:{}".format(namespace, ".".join(str(generation) for generation in generations), digest)
+
+
+def get_or_set(namespace, parts, default, timeout=DEFAULT_TIMEOUT, depends_on=()):
+    """
+    Returns the cached value of the namespaced key, default is called to calculate it on a miss.
+    None values are not cached.
+    """
+    key = make_key(namespace, *parts, depends_on=depends_on)
+    value = default_cache.get(key)
+    if value is None:
+        value = default()
+        if value is not None:
+            default_cache.set(key, value, timeout)
+    return value
@@ -57,3 +57,10 @@ class DocumentTypes(Enum):
     dni = _("DNI")
     nie = _("NIE")
     passport = _("Pasaporte")
+
+
+class OutboxStatus(Enum):
+    pending = _("Pendiente")
+    sending = _("Enviando")
+    sent = _("Enviado")
+    dead = _("Fallido")
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from utils.services.outbox import get_outbox_metrics, process_outbox
+
+
+class Command(BaseCommand):
+    help = "Send the emails of the outbox with a pool of threads, retrying the failed ones with backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, help="Threads sending emails, by default OUTBOX_WORKERS.")
+        parser.add_argument("--batch-size", type=int, default=50, help="Emails claimed per batch.")
+        parser.add_argument("--max-attempts", type=int, help="Attempts before an email is marked as failed.")
+        parser.add_argument("--interval", type=int, default=10, help="Seconds to wait when there are no emails.")
+        parser.add_argument("--once", action="store_true", help="Send the due emails and exit.")
+        parser.add_argument("--metrics", action="store_true", help="Show the size of the queue and exit.")
+
+    def handle(self, *args, **options):
+        if options["metrics"]:
+            self.write_metrics()
+            return
+
+        try:
+            while True:
+                results = process_outbox(options["workers"], options["batch_size"], options["max_attempts"])
+                if any(results.values()):
+                    self.stdout.write("Sent {sent}, retrying {pending}, failed {dead}.".format(**results))
+                    continue
+                if options["once"]:
+                    break
+                close_old_connections()
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+        self.write_metrics()
+
+    def write_metrics(self):
+        self.stdout.write(self.style.SUCCESS(
+            "Outbox: {pending} pending ({due} due, oldest {oldest_pending_seconds}s), {sending} sending, "
+            "{sent} sent, {dead} failed.".format(**get_outbox_metrics())
+        ))
@@ -0,0 +1,41 @@
+# Generated by Django 4.0.1 on 2026-10-18 18:27
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de Creación')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Fecha de Actualización')),
+                ('template_id', models.PositiveIntegerField(verbose_name='Plantilla')),
+                ('data', models.JSONField(verbose_name='Datos')),
+                ('status', models.CharField(choices=[('dead', 'Fallido'), ('pending', 'Pendiente'), ('sending', 'Enviando'), ('sent', 'Enviado')], default='pending', max_length=10, verbose_name='Estado')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Intentos')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Próximo Intento')),
+                ('locked_until', models.DateTimeField(blank=True, null=True, verbose_name='Bloqueado Hasta')),
+                ('lock_id', models.CharField(blank=True, max_length=32, verbose_name='Bloqueo')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Fecha de Envío')),
+                ('last_error', models.TextField(blank=True, verbose_name='Último Error')),
+            ],
+            options={
+                'verbose_name': 'Correo Pendiente',
+                'verbose_name_plural': 'Correos Pendientes',
+                'ordering': ['next_attempt_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='outboxemail',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_next_attempt_idx'),
+        ),
+    ]
@@ -1,6 +1,9 @@
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from utils.enums import OutboxStatus
+
 
 class AbstractDates(models.Model):
     """
@@ -12,3 +15,26 @@ class AbstractDates(models.Model):
 
     class Meta:
         abstract = True
+
+
+class OutboxEmail(AbstractDates):
+    """Emails waiting to be sent by the outbox worker"""
+    template_id = models.PositiveIntegerField(verbose_name=_("Plantilla"))
+    data = models.JSONField(verbose_name=_("Datos"))
+    status = models.CharField(verbose_name=_("Estado"), max_length=10, choices=OutboxStatus.choices,
+                              default=OutboxStatus.pending)
+    attempts = models.PositiveSmallIntegerField(verbose_name=_("Intentos"), default=0)
+    next_attempt_at = models.DateTimeField(verbose_name=_("Próximo Intento"), default=timezone.now)
+    locked_until = models.DateTimeField(verbose_name=_("Bloqueado Hasta"), blank=True, null=True)
+    lock_id = models.CharField(verbose_name=_("Bloqueo"), max_length=32, blank=True)
+    sent_at = models.DateTimeField(verbose_name=_("Fecha de Envío"), blank=True, null=True)
+    last_error = models.TextField(verbose_name=_("Último Error"), blank=True)
+
+    def __str__(self):
+        return "{} - {}".format(self.template_id, self.status)
+
+    class Meta:
+        verbose_name = _("Correo Pendiente")
+        verbose_name_plural = _("Correos Pendientes")
+        ordering = ["next_attempt_at"]
+        indexes = [models.Index(fields=["status", "next_attempt_at"], name="outbox_status_next_attempt_idx")]
@@ -1,17 +1,128 @@
+from base64 import b64decode, b64encode
 from collections import OrderedDict
+from urllib import parse
 
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils.dateparse import parse_datetime
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 from rest_framework_datatables.pagination import DatatablesPageNumberPagination
 from rest_framework.response import Response
 
+from utils.cache import make_key
+from utils.utils import get_data_namespace
+
+
+def estimate_count(queryset):
+    """Returns the database estimate of the rows of the queryset, None if the database has no estimate for it"""
+    connection = connections[queryset.db]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            sql, params = queryset.order_by().query.sql_with_params()
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            return int(cursor.fetchone()[0][0]['Plan']['Plan Rows'])
+        if connection.vendor == 'sqlite' and not queryset.query.where:
+            # The table statistics are only available after ANALYZE
+            cursor.execute("SELECT name FROM sqlite_master WHERE name = 'sqlite_stat1'")
+            if not cursor.fetchone():
+                return None
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s', [queryset.model._meta.db_table])
+            rows = [int(stat.split()[0]) for stat, in cursor.fetchall()]
+            return max(rows) if rows else None
+    return None
+
+
+def get_count(queryset, threshold=None):
+    """
+    Returns the amount of records of the queryset, counting at most threshold + 1 rows of the unfiltered ones.
+    Above the threshold the database estimate is returned when it has one, the filtered querysets are always
+    counted exactly so every page of the results can be reached.
+    :return: <tuple> count and if it is an estimate
+    """
+    if not threshold or queryset.query.where:
+        return queryset.count(), False
+    count = queryset.order_by()[:threshold + 1].count()
+    if count <= threshold:
+        return count, False
+    estimate = estimate_count(queryset)
+    if estimate is None:
+        return queryset.count(), False
+    return max(estimate, count), True
+
+
+def get_cached_count(queryset, params, models=None, timeout=None, threshold=None):
+    """
+    Returns the count of the queryset cached per model, filter params and data version of the models, so the
+    cached counts are invalidated when any of the models changes.
+    :param params: <dict> filter params, empty values are ignored
+    :param models: <iterable> models the count depends on, the queryset model by default
+    :return: <tuple> count and if it is an estimate
+    """
+    models = models or [queryset.model]
+    params = sorted((key, str(value).strip()) for key, value in params.items() if value not in (None, '', [], ()))
+    key = make_key('list-count:{}'.format(queryset.model._meta.label_lower), params,
+                   depends_on=[get_data_namespace(model) for model in models])
+    value = cache.get(key)
+    if value is None:
+        value = get_count(queryset, threshold)
+        cache.set(key, value, settings.LIST_COUNT_CACHE_TIMEOUT if timeout is None else timeout)
+    return tuple(value)
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator that gets the count from get_cached_count, used by the tables of the list views.
+    Pages after an estimated count may be empty.
+    """
+
+    def __init__(self, object_list, per_page, count_queryset=None, count_params=None, count_models=None, **kwargs):
+        self.count_queryset = count_queryset
+        self.count_params = count_params or {}
+        self.count_models = count_models
+        self.is_estimate = False
+        super().__init__(object_list, per_page, **kwargs)
+
+    @cached_property
+    def count(self):
+        if self.count_queryset is None:
+            return super().count
+        count, self.is_estimate = get_cached_count(
+            self.count_queryset, self.count_params, self.count_models,
+            threshold=settings.LIST_COUNT_ESTIMATE_THRESHOLD
+        )
+        return count
+
 
 class CustomDatatablesPageNumberPagination(DatatablesPageNumberPagination):
 
     page_size_query_param = 'length'
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        Override to switch to keyset pagination when the request sends the cursor parameter, even empty
+        """
+        self.cursor_paginator = None
+        if (self.cursor_query_param in request.query_params
+                and not CustomDatatablesCursorPagination.uses_page_numbers(request, queryset)):
+            self.cursor_paginator = CustomDatatablesCursorPagination()
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
 
     def get_paginated_response(self, data):
         """
         Override to include page number on paginated responses
         """
+        if self.cursor_paginator:
+            return self.cursor_paginator.get_paginated_response(data)
         return Response(OrderedDict([
             ('count', self.page.paginator.count),
             ('next', self.get_next_link()),
@@ -54,3 +165,170 @@ class CustomDatatablesPageNumberPagination(DatatablesPageNumberPagination):
                 'results': schema,
             },
         }
+
+
+class CustomDatatablesCursorPagination(BasePagination):
+    """
+    Keyset pagination on (created_at, id), pages are read with an indexed range instead of an OFFSET and the
+    count is only calculated when requested with ?count=true, cached per filters for count_cache_timeout seconds.
+    Only the models with an index on (created_at, id) are paginated by keyset, the rest keep the page numbers.
+    Datatables requests keep the page number pagination, they need the counts and jump to any page. Searches and
+    other orderings keep it too, so the results stay in the requested order.
+    """
+
+    ordering = ('-created_at', '-id')
+    # Orderings of the ?ordering parameter served by the keyset
+    default_orderings = ('-created_at', '-created_at,-id')
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'length'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    count_cache_timeout = 60
+    invalid_cursor_message = _('Cursor inválido')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.fallback_paginator = None
+        if self.uses_page_numbers(request, queryset):
+            self.fallback_paginator = CustomDatatablesPageNumberPagination()
+            return self.fallback_paginator.paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.count = self.get_count(queryset, request) if self.is_count_requested(request) else None
+        reverse, position = self.decode_cursor(request)
+
+        ordering = self.ordering
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(position, reverse))
+        if reverse:
+            ordering = [field[1:] if field.startswith('-') else '-' + field for field in ordering]
+
+        results = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+
+        self.has_next = has_more if not reverse else position is not None
+        self.has_previous = has_more if reverse else position is not None
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+            if size <= 0:
+                raise ValueError()
+            return min(size, self.max_page_size)
+        except (KeyError, ValueError):
+            return self.page_size
+
+    @classmethod
+    def uses_page_numbers(cls, request, queryset):
+        """
+        Returns if the request is paginated by page number: the datatables requests, the searches, the orderings
+        other than the keyset and the models without the keyset index
+        """
+        ordering = request.query_params.get(api_settings.ORDERING_PARAM, '').strip()
+        return (request.accepted_renderer.format == 'datatables'
+                or bool(request.query_params.get(api_settings.SEARCH_PARAM, '').strip())
+                or ordering not in ('', *cls.default_orderings)
+                or not cls.has_keyset_index(queryset.model))
+
+    @staticmethod
+    def has_keyset_index(model):
+        return any(list(index.fields) == ['created_at', 'id'] for index in model._meta.indexes)
+
+    def is_count_requested(self, request):
+        return request.query_params.get(self.count_query_param, '').lower() in ('1', 'true')
+
+    def get_count(self, queryset, request):
+        """Returns the amount of filtered records, cached per model, filter parameters and data version"""
+        params = {
+            key: request.query_params.getlist(key) for key in request.query_params
+            if key not in (self.cursor_query_param, self.page_size_query_param, self.count_query_param)
+        }
+        count, _ = get_cached_count(queryset, params, timeout=self.count_cache_timeout)
+        return count
+
+    def get_position_filter(self, position, reverse):
+        """Returns the filter of the records after the position in the ordering, or before it when reverse"""
+        created_at, pk = position
+        descending = self.ordering[0].startswith('-') != reverse
+        lookup = 'lt' if descending else 'gt'
+        return Q(**{'created_at__' + lookup: created_at}) | Q(created_at=created_at, **{'id__' + lookup: pk})
+
+    def decode_cursor(self, request):
+        """
+        Returns if the cursor goes back and the (created_at, id) position, or no position for the first page
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return False, None
+        try:
+            tokens = parse.parse_qs(b64decode(encoded.encode('ascii')).decode('ascii'), strict_parsing=True)
+            created_at = parse_datetime(tokens['c'][0])
+            pk = int(tokens['i'][0])
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return reverse, (created_at, pk)
+
+    def encode_cursor(self, instance, reverse=False):
+        tokens = {'c': instance.created_at.isoformat(), 'i': instance.pk}
+        if reverse:
+            tokens['r'] = '1'
+        encoded = b64encode(parse.urlencode(tokens, doseq=True).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        if self.fallback_paginator:
+            return self.fallback_paginator.get_paginated_response(data)
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'count': {
+                    'type': 'integer',
+                    'nullable': True,
+                    'example': 123,
+                },
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                    'format': 'uri',
+                    'example': 'http://api.example.org/accounts/?{cursor_query_param}=cD00ODY%3D'.format(
+                        cursor_query_param=self.cursor_query_param)
+                },
+                'previous': {
+                    'type': 'string',
+                    'nullable': True,
+                    'format': 'uri',
+                    'example': 'http://api.example.org/accounts/?{cursor_query_param}=cj0xJnA9NDg3'.format(
+                        cursor_query_param=self.cursor_query_param)
+                },
+                'results': schema,
+            },
+        }
@@ -4,27 +4,47 @@ from base64 import b64encode
 from datetime import datetime
 from logging import getLogger
 
-from constance import config
 from django.conf import settings
 from django.core.files import File
-from requests import request, get
 
-from utils.utils import get_current_site_no_request
+from utils.services.http_client import get_client
+from utils.utils import get_config, get_current_site_no_request
 
 logger = getLogger(__name__)
 
 
 class SendInBlueService:
 
+    @classmethod
+    def get_client(cls):
+        """Returns the pooled client of the API, with enough connections for the outbox workers"""
+        return get_client("sendinblue", timeout=settings.SENDINBLUE_TIMEOUT,
+                          pool_size=max(settings.OUTBOUND_POOL_SIZE, settings.OUTBOX_WORKERS))
+
+    @classmethod
+    def enqueue_email(cls, data, template_id):
+        """Store the email in the outbox, it is sent by the send_outbox_emails worker"""
+        from utils.services.outbox import enqueue_email
+
+        return enqueue_email(data, template_id)
+
     @classmethod
     def send_email(cls, data, template_id):
-        url = f'https://api.sendinblue.com/v3/smtp/email'
+        url = f'{settings.SENDINBLUE_API_URL}/smtp/email'
 
         payload = {
-            'to': data.get('to'),
             'templateId': template_id,
         }
 
+        to = data.get('to', None)
+        if to:
+            payload.update({'to': to})
+
+        # Up to 1000 recipients with their own params in a single call
+        message_versions = data.get('message_versions', None)
+        if message_versions:
+            payload.update({'messageVersions': message_versions})
+
         bcc = data.get('bcc', None)
         if bcc:
             payload.update({'bcc': bcc})
@@ -37,7 +57,7 @@ class SendInBlueService:
                 else:
                     attachment_b64 = b64encode(attachment.get('content').getvalue().encode())
             else:
-                attachment_b64 = b64encode(get(attachment.get('url')).content)
+                attachment_b64 = b64encode(get_client('attachments').get(attachment.get('url')).content)
 
             payload.update({
                 'attachment': [
@@ -55,19 +75,19 @@ class SendInBlueService:
         headers = {
             'Accept': "application/json",
             'Origin': get_current_site_no_request().domain,
-            'api-key': config.SENDINGBLUE_API_KEY,
+            'api-key': get_config('SENDINGBLUE_API_KEY'),
             'Content-Type': "application/json",
             'cache-control': "no-cache",
         }        
 
-        if not config.SEND_EMAILS:
+        if not get_config('SEND_EMAILS'):
             logger.debug('sendinblue append csv')
             SendInBlueService.create_csv_mailing(url, payload, headers)
         else:
             logger.info(f'sendinblue url: {url}')
             logger.info(f'sendinblue payload: {str(payload)}')
             logger.info(f'sendinblue headers: {str(headers)}')
-            req = request("POST", url, json=payload, headers=headers)
+            req = cls.get_client().post(url, json=payload, headers=headers, timeout=settings.SENDINBLUE_TIMEOUT)
             logger.info(f'sendinblue status_code: {req.status_code}')
             logger.info(f'sendinblue body: {req.text}')
             return req
@@ -0,0 +1,139 @@
+import threading
+import time
+from logging import getLogger
+
+from django.conf import settings
+from requests import RequestException, Session
+from requests.adapters import HTTPAdapter
+
+logger = getLogger(__name__)
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class CircuitOpenError(RequestException):
+    """The provider failed too many times in a row, the call is not made until the circuit is reset"""
+
+
+class CircuitBreaker:
+    """
+    Counts the consecutive failures of a provider and opens after `threshold` of them, while it is open the calls
+    fail fast with CircuitOpenError. After `reset_timeout` seconds a single call is let through, the circuit closes
+    if it succeeds and opens again if it fails.
+    """
+
+    def __init__(self, name, threshold=5, reset_timeout=30):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None and (self.trial or self.retry_in > 0)
+
+    @property
+    def retry_in(self):
+        """Returns the seconds until a call is let through again"""
+        if self.opened_at is None:
+            return 0
+        return max(self.opened_at + self.reset_timeout - time.monotonic(), 0)
+
+    def before_call(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if not self.trial and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.trial = True
+                return
+        raise CircuitOpenError("{} circuit is open, retry in {:.0f}s".format(self.name, self.retry_in))
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial = False
+            if self.failures >= self.threshold:
+                if self.opened_at is None or self.retry_in == 0:
+                    logger.warning("{} circuit opened after {} failures".format(self.name, self.failures))
+                self.opened_at = time.monotonic()
+
+
+class HttpClient:
+    """
+    requests Session with a pool of keep-alive connections shared by the threads of the process, every call has
+    a timeout and goes through the circuit breaker of the provider. Connection errors, timeouts and 5xx or 429
+    responses count as failures.
+    """
+
+    def __init__(self, name, timeout=None, pool_size=None, threshold=None, reset_timeout=None):
+        self.name = name
+        self.timeout = timeout or settings.OUTBOUND_TIMEOUT
+        self.breaker = CircuitBreaker(
+            name,
+            threshold=threshold or settings.OUTBOUND_CIRCUIT_THRESHOLD,
+            reset_timeout=reset_timeout or settings.OUTBOUND_CIRCUIT_RESET_TIMEOUT,
+        )
+        pool_size = pool_size or settings.OUTBOUND_POOL_SIZE
+        self.session = Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method, url, timeout=None, **kwargs):
+        self.breaker.before_call()
+        try:
+            response = self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+        except RequestException:
+            self.breaker.record_failure()
+            raise
+        if response.status_code >= 500 or response.status_code == 429:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+def get_client(name, **kwargs):
+    """
+    Returns the client of the provider, created on the first call of the process so the connections and the
+    state of the circuit are shared by every caller.
+    :param kwargs: options of HttpClient, only used when the client is created
+    """
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = HttpClient(name, **kwargs)
+    return client
+
+
+def close_clients():
+    """Close the connections of every client, the next get_client call creates them again"""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
@@ -0,0 +1,173 @@
+import uuid
+from base64 import b64decode, b64encode
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from logging import getLogger
+
+from django.conf import settings
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+from requests import RequestException
+
+from utils.enums import OutboxStatus
+from utils.models import OutboxEmail
+from utils.services.SendInBlue import SendInBlueService
+from utils.services.http_client import CircuitOpenError
+from utils.utils import get_config, get_current_site_no_request
+
+logger = getLogger(__name__)
+
+# Max seconds an email is kept claimed by a worker, after it the email can be claimed again
+LEASE_SECONDS = 300
+# Max seconds between two attempts
+MAX_BACKOFF = 6 * 3600
+
+
+def serialize_email_data(data):
+    """Returns the email data as JSON, the in memory attachments are stored in base64."""
+    data = dict(data)
+    attachment = data.get("attachment")
+    if attachment and attachment.get("url") == "in_memory":
+        if "content_bytes" in attachment:
+            content = attachment["content_bytes"]
+        else:
+            content = attachment["content"].getvalue().encode()
+        data["attachment"] = {"url": "in_memory", "name": attachment.get("name"),
+                              "content_b64": b64encode(content).decode()}
+    return data
+
+
+def deserialize_email_data(data):
+    """Returns the email data in the format of SendInBlueService.send_email."""
+    data = dict(data)
+    attachment = data.get("attachment")
+    if attachment and "content_b64" in attachment:
+        data["attachment"] = {"url": "in_memory", "name": attachment.get("name"),
+                              "content_bytes": b64decode(attachment["content_b64"])}
+    return data
+
+
+def enqueue_email(data, template_id):
+    """
+    Store an email in the outbox, it is sent with the transaction of the caller so it is never sent for
+    changes that were rolled back.
+    :param data: <dict> with the to, bcc, params and attachment of SendInBlueService.send_email
+    :param template_id: <int> SendInBlue template
+    """
+    return OutboxEmail.objects.create(data=serialize_email_data(data), template_id=template_id)
+
+
+def claim_emails(limit, lease=LEASE_SECONDS):
+    """
+    Mark the next due emails as sending for this worker, the emails of a worker that died are claimed again
+    when their lease expires.
+    :return: <list> claimed emails
+    """
+    current = timezone.now()
+    claimable = Q(status=OutboxStatus.pending, next_attempt_at__lte=current) | Q(
+        status=OutboxStatus.sending, locked_until__lt=current
+    )
+    ids = list(OutboxEmail.objects.filter(claimable).order_by("next_attempt_at").values_list("pk", flat=True)[:limit])
+    if not ids:
+        return []
+
+    lock_id = uuid.uuid4().hex
+    OutboxEmail.objects.filter(claimable, pk__in=ids).update(
+        status=OutboxStatus.sending, locked_until=current + timedelta(seconds=lease), lock_id=lock_id
+    )
+    return list(OutboxEmail.objects.filter(lock_id=lock_id, status=OutboxStatus.sending))
+
+
+def send_outbox_email(email):
+    """
+    Send one email, it runs in the worker threads and the result is saved by the caller thread.
+    :return: <tuple> if it was sent, None when it was not attempted because the circuit is open, the error and if
+    the error is permanent
+    """
+    try:
+        response = SendInBlueService.send_email(deserialize_email_data(email.data), email.template_id)
+    except CircuitOpenError as error:
+        return None, str(error), False
+    except RequestException as error:
+        return False, str(error), False
+    # Without SEND_EMAILS the email is written to a csv file and there is no response
+    if response is None or 200 <= response.status_code < 300:
+        return True, "", False
+    permanent = 400 <= response.status_code < 500 and response.status_code not in (408, 429)
+    return False, "{}: {}".format(response.status_code, response.text[:1000]), permanent
+
+
+def get_backoff(attempts, backoff=None):
+    """Returns the seconds to wait before the next attempt, doubled after every failed attempt."""
+    backoff = settings.OUTBOX_BACKOFF if backoff is None else backoff
+    return min(backoff * 2 ** (attempts - 1), MAX_BACKOFF)
+
+
+def record_result(email, sent, error, permanent, max_attempts):
+    """Update the email with the result of the attempt, only if it is still claimed by this worker."""
+    current = timezone.now()
+    attempts = email.attempts + 1
+    claimed = OutboxEmail.objects.filter(pk=email.pk, lock_id=email.lock_id, status=OutboxStatus.sending)
+    if sent is None:
+        # Not attempted, it waits for the circuit without losing an attempt
+        retry_in = SendInBlueService.get_client().breaker.retry_in
+        claimed.update(status=OutboxStatus.pending, locked_until=None, last_error=error, updated_at=current,
+                       next_attempt_at=current + timedelta(seconds=retry_in))
+        return OutboxStatus.pending
+    if sent:
+        claimed.update(status=OutboxStatus.sent, attempts=attempts, sent_at=current, locked_until=None,
+                       last_error="", updated_at=current)
+        return OutboxStatus.sent
+
+    status = OutboxStatus.dead if permanent or attempts >= max_attempts else OutboxStatus.pending
+    claimed.update(status=status, attempts=attempts, locked_until=None, last_error=error, updated_at=current,
+                   next_attempt_at=current + timedelta(seconds=get_backoff(attempts)))
+    if status == OutboxStatus.dead:
+        logger.error("outbox email {} failed after {} attempts: {}".format(email.pk, attempts, error))
+    return status
+
+
+def process_outbox(workers=None, batch_size=50, max_attempts=None):
+    """
+    Claim a batch of due emails and send them with a pool of threads, the results are saved from the caller
+    thread so the database is not used concurrently.
+    :return: <dict> amount of emails per resulting status
+    """
+    workers = workers or settings.OUTBOX_WORKERS
+    max_attempts = max_attempts or settings.OUTBOX_MAX_ATTEMPTS
+    results = {OutboxStatus.sent: 0, OutboxStatus.pending: 0, OutboxStatus.dead: 0}
+    # The emails are left in the queue while the provider is down
+    if SendInBlueService.get_client().breaker.is_open:
+        return results
+    emails = claim_emails(batch_size)
+    if not emails:
+        return results
+
+    # Load the cached values in this thread, so the worker threads do not query the database
+    get_current_site_no_request()
+    get_config("SENDINGBLUE_API_KEY")
+    get_config("SEND_EMAILS")
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="outbox") as executor:
+        for email, result in zip(emails, executor.map(send_outbox_email, emails)):
+            results[record_result(email, *result, max_attempts=max_attempts)] += 1
+    return results
+
+
+def get_outbox_metrics():
+    """
+    Returns the size of the queue by status, the emails that are due and the age in seconds of the oldest
+    pending email.
+    """
+    current = timezone.now()
+    metrics = {status: 0 for status, _ in OutboxStatus.choices}
+    metrics.update({
+        row["status"]: row["amount"]
+        for row in OutboxEmail.objects.order_by().values("status").annotate(amount=Count("pk"))
+    })
+    pending = OutboxEmail.objects.filter(status=OutboxStatus.pending).aggregate(
+        due=Count("pk", filter=Q(next_attempt_at__lte=current)), oldest=Min("created_at")
+    )
+    metrics["due"] = pending["due"]
+    metrics["oldest_pending_seconds"] = int((current - pending["oldest"]).total_seconds()) if pending["oldest"] else 0
+    return metrics
@@ -0,0 +1,34 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from utils.cache import bump_generation
+from utils.utils import CONFIG_NAMESPACE, bump_data_version
+
+try:
+    from constance.signals import config_updated
+except ImportError:
+    config_updated = None
+
+# Apps whose writes never change the cached data, the sessions are saved on almost every request
+# and utils only has the email outbox
+IGNORED_APPS = ("sessions", "admin", "contenttypes", "utils")
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def bump_saved_data_version(sender, **kwargs):
+    if sender._meta.app_label not in IGNORED_APPS:
+        bump_data_version(sender)
+
+
+@receiver(m2m_changed)
+def bump_relation_data_version(sender, instance, action, model, **kwargs):
+    # Both sides of the relation may be filtered by it
+    if action in ("post_add", "post_remove", "post_clear"):
+        bump_data_version(sender, instance.__class__, model)
+
+
+if config_updated is not None:
+    @receiver(config_updated)
+    def bump_config_version(sender, key, **kwargs):
+        bump_generation(CONFIG_NAMESPACE)
@@ -0,0 +1,25 @@
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """Runs the tests with the shared cache in a temporary directory, so they do not see the data of other runs"""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache_location = tempfile.mkdtemp(prefix="test-cache-")
+        caches = {alias: dict(options) for alias, options in settings.CACHES.items()}
+        for options in caches.values():
+            if options["BACKEND"].endswith("FileBasedCache"):
+                options["LOCATION"] = self.cache_location
+        self.cache_settings = override_settings(CACHES=caches)
+        self.cache_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.cache_settings.disable()
+        shutil.rmtree(self.cache_location, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
@@ -1,3 +1,314 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from requests import Timeout
+from django.utils import timezone
+
+from utils.cache import TwoTierCache, bump_generation, get_generations, get_or_set, make_key
+from utils.enums import OutboxStatus
+from utils.models import OutboxEmail
+from utils.services.SendInBlue import SendInBlueService
+from utils.services.http_client import CircuitOpenError, HttpClient, close_clients
+from utils.services.outbox import get_outbox_metrics, process_outbox
+from utils.utils import get_current_site_no_request
+
+
+class TwoTierCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.cache = caches['default']
+        self.shared = caches['shared']
+        self.cache.clear()
+
+    def test_backend(self):
+        """Test the default cache is two-tier"""
+        self.assertIsInstance(self.cache, TwoTierCache)
+
+    def test_get_from_shared(self):
+        """Test the values written by other workers in the shared cache are read and kept in the process"""
+        self.shared.set('key', 'value')
+        self.assertEqual(self.cache.get('key'), 'value')
+        self.assertEqual(self.cache.l1.get('key'), 'value')
+
+    def test_set_and_delete(self):
+        """Test the values are written and deleted in both tiers"""
+        self.cache.set('key', 'value')
+        self.assertEqual(self.shared.get('key'), 'value')
+        self.assertEqual(self.cache.l1.get('key'), 'value')
+        self.cache.delete('key')
+        self.assertIsNone(self.shared.get('key'))
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_incr(self):
+        """Test incr updates the shared value and drops the process copy"""
+        self.cache.set('counter', 1)
+        self.assertEqual(self.cache.incr('counter'), 2)
+        self.assertEqual(self.cache.get('counter'), 2)
+
+
+class GenerationTestCase(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_bump_generation(self):
+        """Test a bump changes the keys of the namespace and of the namespaces that depend on it"""
+        books, authors = get_generations('books', 'authors')
+        key = make_key('books', 'page', 1)
+        dependent = make_key('loans', 'page', 1, depends_on=['books'])
+        self.assertEqual(make_key('books', 'page', 1), key)
+
+        bump_generation('books')
+        new_books, new_authors = get_generations('books', 'authors')
+        self.assertNotEqual(new_books, books)
+        self.assertEqual(new_authors, authors)
+        self.assertNotEqual(make_key('books', 'page', 1), key)
+        self.assertNotEqual(make_key('loans', 'page', 1, depends_on=['books']), dependent)
+
+    def test_get_or_set(self):
+        """Test the value is calculated again after the namespace is invalidated"""
+        calls = []
+
+        def default():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(get_or_set('books', ['count'], default), 1)
+        self.assertEqual(get_or_set('books', ['count'], default), 1)
+        bump_generation('books')
+        self.assertEqual(get_or_set('books', ['count'], default), 2)
+
+    def test_generation_after_clear(self):
+        """Test a cleared cache does not repeat the old generations"""
+        generation, = get_generations('books')
+        caches['default'].clear()
+        self.assertNotEqual(get_generations('books')[0], generation)
+
+    def test_bump_without_read(self):
+        """Test a bump writes a new generation without reading the old one, so concurrent bumps are not lost"""
+        generation, = get_generations('books')
+        shared = caches['shared']
+        with mock.patch.object(shared, 'get', side_effect=AssertionError), \
+                mock.patch.object(shared, 'incr', side_effect=AssertionError):
+            bump_generation('books')
+        bumped, = get_generations('books')
+        bump_generation('books')
+        self.assertEqual(len({generation, bumped, get_generations('books')[0]}), 3)
+
+
+class FakeSendInBlueHandler(BaseHTTPRequestHandler):
+    """Answers the SendInBlue API calls with the status codes of the server, it keeps the received payloads"""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.server.payloads.append(json.loads(self.rfile.read(length)))
+        self.server.client_ports.append(self.client_address[1])
+        if self.path.endswith("/slow"):
+            time.sleep(0.5)
+        status = self.server.statuses.pop(0) if self.server.statuses else 201
+        self.send_response(status)
+        body = b'{"messageId": "1"}' if status < 300 else b'{"code": "error"}'
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeSendInBlueServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # The clients that time out close the connection before the answer
+        pass
+
+
+class FakeSendInBlueTestCase(TestCase):
+    """Runs a local stand-in of the SendInBlue API and sends the emails to it"""
+
+    def setUp(self):
+        self.server = FakeSendInBlueServer(("127.0.0.1", 0), FakeSendInBlueHandler)
+        self.server.payloads = []
+        self.server.statuses = []
+        self.server.client_ports = []
+        self.url = "http://127.0.0.1:{}".format(self.server.server_port)
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        overridden = override_settings(SENDINBLUE_API_URL=self.url, SEND_EMAILS=True, OUTBOX_BACKOFF=60,
+                                       OUTBOUND_CIRCUIT_THRESHOLD=3)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+        # Every test starts with new connections and closed circuits
+        close_clients()
+        self.addCleanup(close_clients)
+
+
+class OutboxTestCase(FakeSendInBlueTestCase):
+
+    def enqueue(self, amount=1):
+        for number in range(amount):
+            SendInBlueService.enqueue_email({"to": [{"email": "user{}@example.com".format(number)}],
+                                             "params": {"number": number}}, 1)
+
+    def test_enqueue(self):
+        """Test the emails are stored without calling the API"""
+        self.enqueue(2)
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxStatus.pending).count(), 2)
+        self.assertEqual(self.server.payloads, [])
+
+    def test_process_outbox(self):
+        """Test the due emails are sent and marked as sent"""
+        self.enqueue(3)
+        self.assertEqual(process_outbox(workers=2), {"sent": 3, "pending": 0, "dead": 0})
+        self.assertEqual(sorted(payload["params"]["number"] for payload in self.server.payloads), [0, 1, 2])
+        self.assertFalse(OutboxEmail.objects.exclude(status=OutboxStatus.sent).exists())
+        self.assertEqual(process_outbox(), {"sent": 0, "pending": 0, "dead": 0})
+
+    def test_retry_with_backoff(self):
+        """Test a server error keeps the email pending until the backoff ends"""
+        self.server.statuses = [500]
+        self.enqueue()
+        self.assertEqual(process_outbox(), {"sent": 0, "pending": 1, "dead": 0})
+        email = OutboxEmail.objects.get()
+        self.assertEqual(email.attempts, 1)
+        self.assertGreater(email.next_attempt_at, timezone.now() + timedelta(seconds=50))
+        self.assertIn("500", email.last_error)
+        # It is not due yet
+        self.assertEqual(process_outbox(), {"sent": 0, "pending": 0, "dead": 0})
+
+        OutboxEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(process_outbox(), {"sent": 1, "pending": 0, "dead": 0})
+        self.assertEqual(OutboxEmail.objects.get().attempts, 2)
+
+    def test_permanent_error(self):
+        """Test a rejected email is not retried"""
+        self.server.statuses = [400]
+        self.enqueue()
+        self.assertEqual(process_outbox(), {"sent": 0, "pending": 0, "dead": 1})
+        self.assertEqual(OutboxEmail.objects.get().status, OutboxStatus.dead)
+
+    def test_max_attempts(self):
+        """Test the email is marked as failed after the last attempt"""
+        self.server.statuses = [503, 503]
+        self.enqueue()
+        process_outbox(max_attempts=2)
+        OutboxEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(process_outbox(max_attempts=2), {"sent": 0, "pending": 0, "dead": 1})
+
+    def test_expired_lease(self):
+        """Test an email claimed by a worker that died is sent when the lease expires"""
+        self.enqueue()
+        OutboxEmail.objects.update(status=OutboxStatus.sending, lock_id="dead-worker",
+                                   locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(process_outbox(), {"sent": 1, "pending": 0, "dead": 0})
+
+    def test_command(self):
+        """Test the command sends the due emails and shows the metrics"""
+        self.server.statuses = [201, 500]
+        self.enqueue(2)
+        out = StringIO()
+        call_command("send_outbox_emails", "--once", "--workers=1", stdout=out)
+        self.assertIn("Sent 1, retrying 1, failed 0.", out.getvalue())
+        self.assertIn("Outbox: 1 pending (0 due", out.getvalue())
+        metrics = get_outbox_metrics()
+        self.assertEqual((metrics["sent"], metrics["pending"], metrics["due"]), (1, 1, 0))
+
+
+class HttpClientTestCase(FakeSendInBlueTestCase):
+
+    def post(self, client, path="/smtp/email", **kwargs):
+        return client.post(self.url + path, json={}, **kwargs)
+
+    def test_keep_alive(self):
+        """Test the calls reuse the pooled connection"""
+        client = HttpClient("test")
+        for _ in range(3):
+            self.assertEqual(self.post(client).status_code, 201)
+        self.assertEqual(len(set(self.server.client_ports)), 1)
+
+    def test_timeout(self):
+        """Test a slow provider raises a timeout and counts as a failure"""
+        client = HttpClient("test", timeout=0.1)
+        with self.assertRaises(Timeout):
+            self.post(client, "/slow")
+        self.assertEqual(client.breaker.failures, 1)
+
+    def test_circuit_breaker(self):
+        """Test the calls fail fast after consecutive failures, and a successful call after the reset closes it"""
+        self.server.statuses = [500, 503, 429]
+        client = HttpClient("test", reset_timeout=60)
+        for _ in range(3):
+            self.post(client)
+        self.assertTrue(client.breaker.is_open)
+        with self.assertRaises(CircuitOpenError):
+            self.post(client)
+        self.assertEqual(len(self.server.payloads), 3)
+
+        client.breaker.opened_at -= 60
+        self.assertEqual(self.post(client).status_code, 201)
+        self.assertFalse(client.breaker.is_open)
+
+    def test_failed_trial(self):
+        """Test the circuit opens again when the call after the reset fails"""
+        self.server.statuses = [500, 500, 500, 500]
+        client = HttpClient("test", reset_timeout=60)
+        for _ in range(3):
+            self.post(client)
+        client.breaker.opened_at -= 60
+        self.post(client)
+        with self.assertRaises(CircuitOpenError):
+            self.post(client)
+
+    def test_client_errors(self):
+        """Test a rejected request does not open the circuit"""
+        self.server.statuses = [400, 400, 400]
+        client = HttpClient("test")
+        for _ in range(3):
+            self.post(client)
+        self.assertFalse(client.breaker.is_open)
+
+    def test_outbox_with_open_circuit(self):
+        """Test the outbox is not claimed while the circuit is open and the emails do not lose attempts"""
+        SendInBlueService.enqueue_email({"to": [{"email": "user@example.com"}]}, 1)
+        SendInBlueService.enqueue_email({"to": [{"email": "user@example.com"}]}, 1)
+        breaker = SendInBlueService.get_client().breaker
+        breaker.threshold = 1
+        self.server.statuses = [500]
+        self.assertEqual(process_outbox(workers=1), {"sent": 0, "pending": 2, "dead": 0})
+        self.assertEqual(sorted(OutboxEmail.objects.values_list("attempts", flat=True)), [0, 1])
+        self.assertEqual(len(self.server.payloads), 1)
+
+        OutboxEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(process_outbox(workers=1), {"sent": 0, "pending": 0, "dead": 0})
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxStatus.pending).count(), 2)
+
+
+class CurrentSiteTestCase(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_cached_site(self):
+        """Test the site is cached until it is saved"""
+        get_current_site_no_request()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_current_site_no_request().domain, "example.com")
+        Site.objects.filter(pk=settings.SITE_ID).update(domain="library.com")
+        Site.objects.get(pk=settings.SITE_ID).save()
+        self.assertEqual(get_current_site_no_request().domain, "library.com")
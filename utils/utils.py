@@ -1,8 +1,81 @@
+import re
+import unicodedata
+
+from django.conf import settings
 from django.contrib.sites.models import Site
+from django.db import connection, transaction
 
 from config.settings import SITE_ID
+from utils.cache import bump_generation, get_generations, get_generations_time, get_or_set
+
+try:
+    from constance import config as constance_config
+except ImportError:
+    constance_config = None
+
+CONFIG_NAMESPACE = "config"
 
 
 def get_current_site_no_request():
-    """Returns active current site for no request actions"""
-    return Site.objects.get(id=SITE_ID)
+    """Returns active current site for no request actions, cached until a site is saved"""
+    return get_or_set(get_data_namespace(Site), ["current-site", SITE_ID], lambda: Site.objects.get(id=SITE_ID),
+                      timeout=None)
+
+
+def get_config(name):
+    """
+    Returns a constance value, cached until any value is changed. Without constance the value is read from the
+    settings.
+    """
+    if constance_config is None:
+        return getattr(settings, name)
+    return get_or_set(CONFIG_NAMESPACE, [name], lambda: getattr(constance_config, name), timeout=None)
+
+
+def normalize_text(value):
+    """Returns the value in lowercase, without accents and with only alphanumeric words separated by spaces"""
+    value = unicodedata.normalize("NFKD", str(value or "")).encode("ascii", "ignore").decode("ascii")
+    return " ".join(re.findall(r"[a-z0-9]+", value.lower()))
+
+
+def get_trigrams(value, padded=True):
+    """
+    Returns the set of trigrams of the normalized words of the value, padded like pg_trgm.
+    :param padded: <boolean> add the trigrams of the word edges to the words of 3 or more characters, the shorter
+    words are always padded since they have no other trigrams
+    """
+    trigrams = set()
+    for word in normalize_text(value).split():
+        if padded or len(word) < 3:
+            word = "  {} ".format(word)
+        trigrams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return trigrams
+
+
+def get_chunks(items, size=500):
+    """Split the items in lists of the given size, to keep the queries under the database parameters limit."""
+    items = list(items)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def get_data_namespace(model):
+    return "data:{}".format(model._meta.label_lower)
+
+
+def get_data_version(*models):
+    """Returns the data version of every model, used to build cache keys that change when the data changes"""
+    return get_generations(*[get_data_namespace(model) for model in models])
+
+
+def get_data_version_time(*models):
+    """Returns the timestamp of the last change of any of the models"""
+    return get_generations_time(*[get_data_namespace(model) for model in models])
+
+
+def bump_data_version(*models):
+    """Invalidates the cached data of the models, call it after updates that do not send signals"""
+    namespaces = [get_data_namespace(model) for model in models]
+    bump_generation(*namespaces)
+    # Values cached from the data before the commit would keep the new version, bump it again once committed
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: bump_generation(*namespaces))
@@ -0,0 +1,169 @@
+import csv
+import itertools
+import json
+
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import prefetch_related_objects
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils import translation
+from django_filters.views import FilterView
+
+from utils.cache import get_or_set, make_key
+from utils.pagination import CachedCountPaginator
+from utils.utils import get_data_namespace
+
+
+class CachedCountMixin:
+    """
+    Mixin for the SingleTableMixin + FilterView list views, the table count is cached per filters and data version
+    and estimated above settings.LIST_COUNT_ESTIMATE_THRESHOLD. The list is only paginated by the table.
+    """
+    paginator_class = CachedCountPaginator
+    # Models the filters of the view depend on, the view model by default
+    count_models = None
+
+    def get_paginate_by(self, queryset):
+        # The table paginates the rows, paginating the object list too would run the count twice
+        return None
+
+    def get_count_params(self):
+        filterset = getattr(self, "filterset", None)
+        if filterset is not None and filterset.is_bound and filterset.is_valid():
+            return filterset.form.cleaned_data
+        return {}
+
+    def get_table_pagination(self, table):
+        paginate = super().get_table_pagination(table)
+        if paginate is False:
+            return paginate
+        if paginate is True:
+            paginate = {"paginator_class": self.paginator_class}
+        paginate.update({
+            "count_queryset": self.object_list,
+            "count_params": self.get_count_params(),
+            "count_models": self.count_models or [self.model],
+        })
+        return paginate
+
+
+class Echo:
+    """File-like object for csv.writer that returns the written line instead of storing it"""
+
+    def write(self, value):
+        return value
+
+
+class StreamingExportView(FilterView):
+    """
+    Export the filtered list as CSV or NDJSON, the records are read with queryset.iterator() and their relations
+    are prefetched per chunk, so the memory does not depend on the amount of records.
+    export_fields has the (name, header, value function) of every column.
+    """
+    export_formats = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+    export_fields = ()
+    export_prefetch = ()
+    export_filename = "export"
+    chunk_size = 2000
+
+    def get(self, request, *args, **kwargs):
+        export_format = kwargs.get("export_format")
+        if export_format not in self.export_formats:
+            raise Http404()
+
+        self.filterset = self.get_filterset(self.get_filterset_class())
+        if not self.filterset.is_bound or self.filterset.is_valid() or not self.get_strict():
+            queryset = self.filterset.qs
+        else:
+            queryset = self.filterset.queryset.none()
+
+        content = getattr(self, "get_{}_content".format(export_format))(self.get_rows(queryset))
+        response = StreamingHttpResponse(content, content_type=self.export_formats[export_format])
+        response["Content-Disposition"] = 'attachment; filename="{}.{}"'.format(self.export_filename, export_format)
+        return response
+
+    def get_chunks(self, queryset):
+        chunk = []
+        for record in queryset.iterator(chunk_size=self.chunk_size):
+            chunk.append(record)
+            if len(chunk) == self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def get_rows(self, queryset):
+        for chunk in self.get_chunks(queryset):
+            if self.export_prefetch:
+                prefetch_related_objects(chunk, *self.export_prefetch)
+            for record in chunk:
+                yield [value(record) for _, _, value in self.export_fields]
+
+    def get_csv_content(self, rows):
+        writer = csv.writer(Echo())
+        header = [str(header) for _, header, _ in self.export_fields]
+        return itertools.chain([writer.writerow(header)], (writer.writerow(row) for row in rows))
+
+    def get_ndjson_content(self, rows):
+        names = [name for name, _, _ in self.export_fields]
+        return (json.dumps(dict(zip(names, row)), cls=DjangoJSONEncoder) + "\n" for row in rows)
+
+
+def get_permissions_key(user):
+    """Returns a value that identifies the permissions of the user, cached until the users or permissions change"""
+    if user.is_superuser:
+        return "superuser"
+    return get_or_set(
+        "user-permissions", [user.pk], lambda: sorted(user.get_all_permissions()),
+        depends_on=[get_data_namespace(model) for model in (get_user_model(), Group, Permission)]
+    )
+
+
+class CachedResponseMixin:
+    """
+    Cache the rendered list per user permissions, language and query params, the cached pages are invalidated
+    when the data version of any of response_cache_models changes. Pages with csrf tokens are cached per csrf
+    cookie and the pages with pending messages are never cached.
+    """
+    # Models rendered by the view, the view model by default
+    response_cache_models = None
+    response_cache_csrf = False
+
+    def get_response_cache_key(self, request):
+        timeout = settings.LIST_RESPONSE_CACHE_TIMEOUT
+        if not timeout or len(messages.get_messages(request)):
+            return None
+        csrf = request.COOKIES.get(settings.CSRF_COOKIE_NAME) if self.response_cache_csrf else None
+        if self.response_cache_csrf and not csrf:
+            return None
+
+        params = sorted((key, value.strip()) for key, values in request.GET.lists() for value in values if value.strip())
+        models = self.response_cache_models or [self.model]
+        return make_key(
+            "list-response:{}".format(self.__class__.__name__),
+            get_permissions_key(request.user), translation.get_language(), params, csrf,
+            depends_on=[get_data_namespace(model) for model in models]
+        )
+
+    def get(self, request, *args, **kwargs):
+        key = self.get_response_cache_key(request)
+        if key is None:
+            return super().get(request, *args, **kwargs)
+
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = super().get(request, *args, **kwargs)
+
+        def set_cache(response):
+            if response.status_code == 200:
+                cache.set(key, (response.content, response["Content-Type"]), settings.LIST_RESPONSE_CACHE_TIMEOUT)
+
+        response.add_post_render_callback(set_cache)
+        return response